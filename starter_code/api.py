@@ -0,0 +1,345 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, request
+from models import db, Venue, Artist, Show
+from availability import filters_from_args
+from bookings import overlaps
+from deletes import delete_entities
+from geo import UNITS, box_center, venues_in_box, venues_near
+from pagination import InvalidCursor, decode_cursor, keyset_page
+from viewmodels import venue_detail, artist_detail
+
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+# ----------------------------------------------------------------------------#
+# Resources.
+# ----------------------------------------------------------------------------#
+
+
+# field name -> (column, table it needs joined, if any)
+VENUE_FIELDS = {
+    'id': (Venue.id, None),
+    'name': (Venue.name, None),
+    'city': (Venue.city, None),
+    'state': (Venue.state, None),
+    'address': (Venue.address, None),
+    'phone': (Venue.phone, None),
+    'image_link': (Venue.image_link, None),
+    'facebook_link': (Venue.facebook_link, None),
+    'website': (Venue.website, None),
+    'seeking_talent': (Venue.seeking_talent, None),
+    'seeking_description': (Venue.seeking_description, None),
+    'latitude': (Venue.latitude, None),
+    'longitude': (Venue.longitude, None),
+    'upcoming_shows_count': (Venue.upcoming_shows_count, None),
+    'past_shows_count': (Venue.past_shows_count, None),
+    'updated_at': (Venue.updated_at, None),
+}
+
+ARTIST_FIELDS = {
+    'id': (Artist.id, None),
+    'name': (Artist.name, None),
+    'city': (Artist.city, None),
+    'state': (Artist.state, None),
+    'phone': (Artist.phone, None),
+    'image_link': (Artist.image_link, None),
+    'facebook_link': (Artist.facebook_link, None),
+    'website': (Artist.website, None),
+    'seeking_venue': (Artist.seeking_venue, None),
+    'seeking_description': (Artist.seeking_description, None),
+    'upcoming_shows_count': (Artist.upcoming_shows_count, None),
+    'past_shows_count': (Artist.past_shows_count, None),
+    'updated_at': (Artist.updated_at, None),
+}
+
+SHOW_FIELDS = {
+    'id': (Show.id, None),
+    'start_time': (Show.start_time, None),
+    'end_time': (Show.end_time, None),
+    'venue_id': (Show.venue_id, None),
+    'venue_name': (Venue.name, Venue),
+    'venue_image_link': (Venue.image_link, Venue),
+    'artist_id': (Show.artist_id, None),
+    'artist_name': (Artist.name, Artist),
+    'artist_image_link': (Artist.image_link, Artist),
+    'updated_at': (Show.updated_at, None),
+}
+
+JOINS = {
+    Venue: Venue.id == Show.venue_id,
+    Artist: Artist.id == Show.artist_id,
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ----------------------------------------------------------------------------#
+# Serialization.
+# ----------------------------------------------------------------------------#
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def json_response(payload, status=200):
+    return Response(
+        json.dumps(payload, default=_default, separators=(',', ':')),
+        status=status,
+        mimetype='application/json'
+    )
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return json_response({'error': error.message}, error.status)
+
+
+def requested_fields(available):
+    # ?fields=a,b,c, every field when absent
+    fields = request.args.get('fields')
+    if not fields:
+        return list(available)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(400, f'Unknown fields: {", ".join(unknown)}')
+    return list(dict.fromkeys(names))
+
+
+def page_size():
+    limit = request.args.get(
+        'limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+# ----------------------------------------------------------------------------#
+# Listing.
+# ----------------------------------------------------------------------------#
+
+
+def list_resource(model, available, key_fields, filters=()):
+    # only the requested columns are selected, no ORM objects are built;
+    # the key fields are always fetched for the cursor
+    fields = requested_fields(available)
+    selected = list(dict.fromkeys(list(key_fields) + fields))
+
+    query = db.session.query(
+        *[available[name][0].label(name) for name in selected]
+    ).select_from(model)
+    joined = {available[name][1] for name in selected} - {None}
+    for table in joined:
+        query = query.join(table, JOINS[table])
+    for condition in filters:
+        query = query.filter(condition)
+
+    types = tuple(
+        datetime if name == 'start_time' else int for name in key_fields)
+    try:
+        after = request.args.get('after')
+        before = request.args.get('before')
+        page = keyset_page(
+            query,
+            [available[name][0] for name in key_fields],
+            key=lambda row: tuple(row[name] for name in key_fields),
+            per_page=page_size(),
+            after=decode_cursor(after, types) if after else None,
+            before=decode_cursor(before, types) if before else None
+        )
+    except InvalidCursor:
+        raise ApiError(400, 'Invalid cursor')
+
+    indexes = [selected.index(name) for name in fields]
+    return json_response({
+        'data': [
+            {name: row[i] for name, i in zip(fields, indexes)}
+            for row in page.items
+        ],
+        'next': page.next_cursor,
+        'prev': page.prev_cursor
+    })
+
+
+@api.route('/venues')
+def venues():
+    filters = []
+    if request.args.get('city'):
+        filters.append(Venue.city == request.args['city'])
+    if request.args.get('state'):
+        filters.append(Venue.state == request.args['state'])
+    return list_resource(Venue, VENUE_FIELDS, ('id',), filters)
+
+
+@api.route('/venues/available')
+def available_venues():
+    parsed = filters_from_args(request.args)
+    if parsed is None:
+        raise ApiError(400, 'from must be a date (YYYY-MM-DD)')
+    return list_resource(Venue, VENUE_FIELDS, ('id',), parsed[1])
+
+
+def _coordinate(name, low, high, required=True):
+    value = request.args.get(name, type=float)
+    if value is None:
+        if required:
+            raise ApiError(400, f'{name} is required')
+        return None
+    if not low <= value <= high:
+        raise ApiError(400, f'{name} must be between {low} and {high}')
+    return value
+
+
+@api.route('/venues/nearby')
+def nearby_venues():
+    # ?lat=&lon=&radius=25&unit=mi, or ?bbox=south,west,north,east with an
+    # optional lat / lon to sort from (the middle of the box otherwise);
+    # nearest first, with the distance in the unit
+    unit = request.args.get('unit', 'mi')
+    if unit not in UNITS:
+        raise ApiError(400, f'unit must be one of {", ".join(UNITS)}')
+    fields = requested_fields(VENUE_FIELDS)
+    limit = page_size()
+
+    if request.args.get('bbox'):
+        try:
+            box = [float(value) for value in request.args['bbox'].split(',')]
+        except ValueError:
+            box = []
+        if len(box) != 4 or not all(
+                -90 <= box[i] <= 90 for i in (0, 2)) or not all(
+                -180 <= box[i] <= 180 for i in (1, 3)) or box[0] > box[2]:
+            raise ApiError(400, 'bbox must be south,west,north,east')
+        lat = _coordinate('lat', -90, 90, required=False)
+        lon = _coordinate('lon', -180, 180, required=False)
+        if lat is None or lon is None:
+            lat, lon = box_center(*box)
+        found = venues_in_box(tuple(box), lat, lon, limit)
+    else:
+        lat = _coordinate('lat', -90, 90)
+        lon = _coordinate('lon', -180, 180)
+        radius = request.args.get(
+            'radius', current_app.config['GEO_DEFAULT_RADIUS'], type=float)
+        if radius is None or not 0 < radius <= \
+                current_app.config['GEO_MAX_RADIUS_MILES'] * \
+                UNITS['mi'] / UNITS[unit]:
+            raise ApiError(400, 'radius out of range')
+        found = venues_near(lat, lon, radius * UNITS[unit], limit)
+
+    rows = {}
+    if found:
+        rows = {
+            row._key: row for row in db.session.query(
+                Venue.id.label('_key'),
+                *[VENUE_FIELDS[name][0].label(name) for name in fields]
+            ).filter(Venue.id.in_([venue_id for venue_id, _ in found]))
+        }
+    return json_response({
+        'data': [
+            dict({name: rows[venue_id][name] for name in fields},
+                 distance=round(meters / UNITS[unit], 3))
+            for venue_id, meters in found if venue_id in rows
+        ],
+        'unit': unit,
+    })
+
+
+@api.route('/artists')
+def artists():
+    filters = []
+    if request.args.get('city'):
+        filters.append(Artist.city == request.args['city'])
+    if request.args.get('state'):
+        filters.append(Artist.state == request.args['state'])
+    return list_resource(Artist, ARTIST_FIELDS, ('id',), filters)
+
+
+@api.route('/shows')
+def shows():
+    filters = []
+    if request.args.get('upcoming') in ('1', 'true', 'y'):
+        filters.append(Show.start_time > datetime.today())
+    venue_id = request.args.get('venue_id', type=int)
+    if venue_id is not None:
+        filters.append(Show.venue_id == venue_id)
+    artist_id = request.args.get('artist_id', type=int)
+    if artist_id is not None:
+        filters.append(Show.artist_id == artist_id)
+    # shows running at any time between from and to
+    start = request.args.get('from', type=datetime.fromisoformat)
+    end = request.args.get('to', type=datetime.fromisoformat)
+    if start or end:
+        filters.append(overlaps(start or datetime.min, end or datetime.max))
+    return list_resource(Show, SHOW_FIELDS, ('start_time', 'id'), filters)
+
+
+# ----------------------------------------------------------------------------#
+# Details.
+# ----------------------------------------------------------------------------#
+
+
+def detail_response(data, kind):
+    if data is None:
+        raise ApiError(404, f'No such {kind}')
+    data['genres'] = [genre.name for genre in data['genres']]
+    fields = requested_fields(data)
+    return json_response({'data': {name: data[name] for name in fields}})
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    return detail_response(venue_detail(venue_id), 'venue')
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    return detail_response(artist_detail(artist_id), 'artist')
+
+
+# ----------------------------------------------------------------------------#
+# Batch deletes.
+# ----------------------------------------------------------------------------#
+
+
+def batch_delete(kind):
+    # DELETE with {"ids": [...]}: every listed row, its shows and genre
+    # links in one transaction, a handful of statements in all
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids')
+    if not isinstance(ids, list) or not ids or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ApiError(400, 'Expected {"ids": [<int>, ...]}')
+    if len(ids) > current_app.config['API_MAX_DELETE']:
+        raise ApiError(
+            400, f'At most {current_app.config["API_MAX_DELETE"]} ids')
+
+    try:
+        deleted = delete_entities(db.session, kind, ids)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return json_response({
+        'deleted': deleted,
+        'missing': sorted(set(ids) - set(deleted)),
+    })
+
+
+@api.route('/venues', methods=['DELETE'])
+def delete_venues():
+    return batch_delete('venue')
+
+
+@api.route('/artists', methods=['DELETE'])
+def delete_artists():
+    return batch_delete('artist')
@@ -4,19 +4,49 @@
 
 import dateutil.parser
 import babel
+import babel.dates
+import click
 from sqlalchemy.sql.schema import ForeignKey
 import config
 from flask import Flask, render_template, request
-from flask import flash, redirect, url_for, jsonify
+from flask import flash, redirect, url_for, jsonify, abort
+from flask import Response, stream_with_context
 from flask_moment import Moment
 from flask_migrate import Migrate, current
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload
 import logging
+import os
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
-from datetime import datetime
-from models import db, Venue, Show, Artist, Genre
+from datetime import datetime, timedelta
+from functools import lru_cache
+from models import db, Venue, Show, Artist, Area
+from models import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+import search
+from pagination import InvalidCursor, decode_cursor, keyset_page
+from exports import EXPORTS, FORMATS, export_query, iter_export
+from genres import resolve_genres
+from viewmodels import venue_detail, artist_detail
+from page_cache import cached_page
+from importer import KINDS, import_file
+from instrumentation import SQLInstrumentation
+from api import api
+from pool_stats import engine_options, pool_view
+from routing import read_only, use_primary
+from counters import rebuild as rebuild_counters, roll_forward
+import areas
+from availability import filters_from_args
+from bookings import book_show
+import assets
+import thumbnails
+import template_cache
+from deletes import delete_entities
+from partitions import archive_shows, ensure_partitions, is_partitioned
+import related
+import matchmaking
+import geo
 
 
 # ----------------------------------------------------------------------------#
@@ -31,24 +61,56 @@ db.init_app(app)
 # connect to a local postgresql database
 app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config.SQLALCHEMY_TRACK_MODIFICATIONS
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    config.SQLALCHEMY_DATABASE_URI,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    statement_timeout=config.DB_STATEMENT_TIMEOUT
+)
+app.config['SQLALCHEMY_BINDS'] = {
+    f'replica_{i}': uri
+    for i, uri in enumerate(config.SQLALCHEMY_REPLICA_URIS)
+}
+app.config['SQLALCHEMY_REPLICA_BINDS'] = list(app.config['SQLALCHEMY_BINDS'])
 
 migrate = Migrate(app, db)
+sql_instrumentation = SQLInstrumentation(app)
+app.register_blueprint(api)
+app.add_url_rule('/_debug/pool', 'debug_pool', pool_view)
+assets.init_app(app)
+thumbnails.init_app(app)
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+    # compiled babel pattern and locale, parsed once per format and locale
+    return babel.dates.parse_pattern(format), babel.Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    # accepts datetime objects directly, strings are still parsed
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    pattern, locale = datetime_pattern(
+        DATETIME_FORMATS.get(format, format), locale)
+    return pattern.apply(value, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
+template_cache.init_app(app)
 
 # ----------------------------------------------------------------------------#
 # Controllers.
@@ -69,44 +131,47 @@ def venues():
     # num_upcoming_shows aggregated
     # based on number of upcoming shows per venue.
 
-    # store all venues
-    venues = Venue.query.all()
-
-    # store all states that venues are in
-    states = list(set([venue.state for venue in venues]))
-
-    # create list for data to be displayed
-    new_data = []
-
-    for state in states:
-        current_st_venues = Venue.query.filter_by(state=state)
-        cities = list(set([venue.city for venue in current_st_venues]))
-        for city in cities:
-            venue_collection = {}
-            venue_collection['state'] = state
-            venue_collection['city'] = city
-            venue_collection['venues'] = []
-            current_city_venues = current_st_venues.filter_by(city=city)
-            for venue in current_city_venues:
-                venue_arena = {
-                    'id': venue.id,
-                    'name': venue.name,
-                    'num_upcoming_shows': len(
-                        list(
-                            filter(
-                                lambda x: x.start_time > datetime.today(),
-                                venue.shows
-                            )
-                        )
-                    )
-                }
-                venue_collection['venues'].append(venue_arena)
-            new_data.append(venue_collection)
+    # the areas come from the maintained summary table, one row per
+    # (state, city); each links to its venues at /areas/<state>/<city>
+    new_data = [
+        {'state': area.state, 'city': area.city, 'count': area.venue_count}
+        for area in Area.query.order_by(Area.state, Area.city)
+    ]
 
     return render_template('pages/venues.html', areas=new_data)
 
 
+@app.route('/areas/<state>/<city>')
+def area_venues(state, city):
+    # the venues of one area with their upcoming show counts
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(
+        Venue.state == state, Venue.city == city
+    ).order_by(Venue.id).all()
+
+    if not rows:
+        abort(404)
+
+    area = {
+        'state': state,
+        'city': city,
+        'venues': [
+            {
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows
+            }
+            for row in rows
+        ]
+    }
+    return render_template('pages/area.html', area=area)
+
+
 @app.route('/venues/search', methods=['POST'])
+@read_only
 def search_venues():
     # implement search on artists with
     # partial string search. Ensure it is case-insensitive.
@@ -115,23 +180,30 @@ def search_venues():
     # "The Musical Hop" and "Park Square Live Music & Coffee"
     text = request.form.get('search_term', '')
 
-    results = Venue.query.filter(Venue.name.ilike('%' + text + '%')).all()
-    new_response = {'count': len(results), 'data': []}
-
-    for venue in results:
-        add_data = {
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': len(
-                list(
-                    filter(
-                        lambda x: x.start_time > datetime.today(),
-                        venue.shows
-                    )
-                )
-            )
-        }
-        new_response['data'].append(add_data)
+    # ranked venue ids from the search backend
+    venue_ids, total = search.search_venues(
+        text, limit=app.config['SEARCH_RESULT_LIMIT'])
+
+    # names and upcoming show counts for the matches in one query
+    rows = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(
+        Venue.id.in_(venue_ids)
+    ).all()
+    rows_by_id = {row.id: row for row in rows}
+
+    new_response = {'count': total, 'data': []}
+
+    for venue_id in venue_ids:
+        if venue_id in rows_by_id:
+            row = rows_by_id[venue_id]
+            new_response['data'].append({
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows
+            })
 
     return render_template(
         'pages/search_venues.html',
@@ -140,68 +212,70 @@ def search_venues():
     )
 
 
+@app.route('/venues/available')
+def available_venues():
+    # venues with no show in a date range, optionally narrowed by
+    # city, state, genre and seeking_talent; see availability.py
+    parsed = filters_from_args(request.args)
+    if parsed is None:
+        return render_template(
+            'pages/available_venues.html', venues=None, page=None,
+            params=request.args)
+    params, filters = parsed
+
+    query = db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(*filters)
+
+    try:
+        after = request.args.get('after')
+        before = request.args.get('before')
+        page = keyset_page(
+            query,
+            (Venue.id,),
+            key=lambda row: (row.id,),
+            per_page=app.config['SEARCH_RESULT_LIMIT'],
+            after=decode_cursor(after, (int,)) if after else None,
+            before=decode_cursor(before, (int,)) if before else None
+        )
+    except InvalidCursor:
+        abort(400)
+
+    return render_template(
+        'pages/available_venues.html', venues=page.items, page=page,
+        params=params)
+
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    # replace with real venue data from the venues table, using venue_id
-
-    new_data = {}
-    current_venue = Venue.query.get(venue_id)
-
-    if current_venue:
-
-        new_data['id'] = current_venue.id
-        new_data['name'] = current_venue.name
-        new_data['genres'] = current_venue.genres
-        new_data['address'] = current_venue.address
-        new_data['city'] = current_venue.city
-        new_data['state'] = current_venue.state
-        new_data['phone'] = current_venue.phone
-        new_data['website'] = current_venue.website
-        new_data['facebook_link'] = current_venue.facebook_link
-        new_data['seeking_talent'] = current_venue.seeking_talent
-        new_data['seeking_description'] = current_venue.seeking_description
-        new_data['image_link'] = current_venue.image_link
-        new_data['past_shows'] = []
-        new_data['upcoming_shows'] = []
-
-        past_shows = Show.query.join(Venue).filter(
-            Venue.id == current_venue.id,
-            Show.start_time < datetime.today()).all()
-
-        if len(past_shows) > 0:
-            for show in past_shows:
-                show_dict = {
-                    'artist_id': show.artist.id,
-                    'artist_name': show.artist.name,
-                    'artist_image_link': show.artist.image_link,
-                    'start_time': str(show.start_time)
-                }
-
-                new_data['past_shows'].append(show_dict)
-
-        upcoming_shows = Show.query.join(Venue).filter(
-            Venue.id == current_venue.id,
-            Show.start_time > datetime.today()).all()
-
-        if len(upcoming_shows) > 0:
-            for show in upcoming_shows:
-                show_dict = {
-                    'artist_id': show.artist.id,
-                    'artist_name': show.artist.name,
-                    'artist_image_link': show.artist.image_link,
-                    'start_time': str(show.start_time)
-                }
-
-                new_data['upcoming_shows'].append(show_dict)
-
-        new_data['past_shows_count'] = len(past_shows)
-        new_data['upcoming_shows_count'] = len(upcoming_shows)
-
-        return render_template('pages/show_venue.html', venue=new_data)
-    else:
-
+    # the rendered page is cached until the venue, one of its shows or
+    # one of the artists on it changes, or its next show starts
+    response = cached_page(
+        ('venue', venue_id), lambda: build_venue_page(venue_id))
+    if response is None:
         return render_template('pages/home.html')
+    return response
+
+
+def build_venue_page(venue_id):
+    new_data = venue_detail(venue_id)
+
+    if new_data is None:
+        return None
+
+    body = render_template('pages/show_venue.html', venue=new_data)
+    expires_at = (
+        new_data['upcoming_shows'][0]['start_time']
+        if new_data['upcoming_shows'] else None
+    )
+    return body, expires_at
+
+
 #  ----------------------------------------------------------------
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -222,32 +296,8 @@ def create_venue_submission():
         form = VenueForm(request.form)
         name = form.name.data
 
-        genre_objects = []
-        all_genre_names = [
-            genre.name for genre in Genre.query.all()
-        ]
-        for genre in form.genres.data:
-            if genre in all_genre_names:
-                go = Genre.query.filter_by(name=genre).all()[0]
-                genre_objects.append(go)
-            else:
-                new_genre = Genre(name=genre)
-                try:
-                    db.session.add(new_genre)
-                    db.session.commit()
-                    new_genre_success = True
-                except Exception as e:
-                    print(e)
-                    db.session.rollback()
-                    new_genre_success = False
-                finally:
-                    if new_genre_success:
-                        go = Genre.query.filter_by(name=genre).all()[0]
-                        genre_objects.append(go)
-                    else:
-                        flash('An error occurred with genres. Venue ' +
-                              name + ' could not be listed.')
-                        return render_template('pages/home.html')
+        genre_objects = resolve_genres(form.genres.data)
+
         if form.seeking_talent.data == 'y':
             seeking_talent = True
         else:
@@ -293,27 +343,23 @@ def create_venue_submission():
     # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    # Complete this endpoint for taking a venue_id, and using
-    # SQLAlchemy ORM to delete a record.
-    # Handle cases where the session commit could fail.
-
-    # add an if statement saying that if the venue id
-    # does not exist in the db then redirect to index
+    # deletes the venue, its shows and genre links with one statement each
+    return delete_entity_response('venue', venue_id)
 
-    # also check if you can cancel the buttons auto response
 
-    if Venue.query.get(venue_id) is None:
+def delete_entity_response(kind, entity_id):
+    model = Venue if kind == 'venue' else Artist
+    name = db.session.query(model.name).filter(
+        model.id == entity_id).scalar()
+    if name is None:
         return redirect(url_for('index'))
 
     delete_response = {}
 
     try:
-
-        current_venue = Venue.query.get(venue_id)
-        name = current_venue.name
-        db.session.delete(current_venue)
+        delete_entities(db.session, kind, [entity_id])
         db.session.commit()
         delete_response['success'] = True
         delete_response['message'] = f'{name} has successfully been deleted.'
@@ -342,12 +388,14 @@ def artists():
     for artist in Artist.query.all():
         artist_data.append({
             'id': artist.id,
-            'name': artist.name})
+            'name': artist.name,
+            'num_upcoming_shows': artist.upcoming_shows_count})
 
     return render_template('pages/artists.html', artists=artist_data)
 
 
 @app.route('/artists/search', methods=['POST'])
+@read_only
 def search_artists():
     # search for artists with partial
     # string search.  It is case-insensitive.
@@ -355,19 +403,30 @@ def search_artists():
     # variable to hold the search term
     text = request.form.get('search_term', '')
 
-    # variable to hold the amount of artists found
-    results = Artist.query.filter(Artist.name.ilike('%' + text + '%')).all()
+    # ranked artist ids from the search backend
+    artist_ids, total = search.search_artists(
+        text, limit=app.config['SEARCH_RESULT_LIMIT'])
+
+    rows = db.session.query(
+        Artist.id, Artist.name, Artist.upcoming_shows_count
+    ).filter(
+        Artist.id.in_(artist_ids)
+    ).all()
+    rows_by_id = {row.id: row for row in rows}
 
     response = {
-        'count': len(results),
+        'count': total,
         'data': []
     }
 
-    for artist in results:
-        response['data'].append({
-            'id': artist.id,
-            'name': artist.name
-        })
+    for artist_id in artist_ids:
+        if artist_id in rows_by_id:
+            row = rows_by_id[artist_id]
+            response['data'].append({
+                'id': artist_id,
+                'name': row.name,
+                'num_upcoming_shows': row.upcoming_shows_count
+            })
 
     return render_template(
         'pages/search_artists.html',
@@ -379,76 +438,36 @@ def search_artists():
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
-    # replace with real artist data from
-    # the artist table, using artist_id
-
-    artist = Artist.query.get(artist_id)
-
-    data = {
-        'id': artist.id,
-        'name': artist.name,
-        'genres': artist.genres,
-        'city': artist.city,
-        'state': artist.state,
-        'phone': artist.phone,
-        'website': artist.website,
-        'facebook_link': artist.facebook_link,
-        'seeking_venue': artist.seeking_venue,
-        'seeking_description': artist.seeking_description,
-        'image_link': artist.image_link,
-        'past_shows': [],
-        'upcoming_shows': [],
-        'past_show_count': len(
-            list(
-                filter(
-                    lambda x: x.start_time < datetime.today(),
-                    artist.shows
-                )
-            )
-        ),
-        'upcoming_shows_count': len(
-            list(
-                filter(
-                    lambda x: x.start_time > datetime.today(),
-                    artist.shows
-                )
-            )
-        )
-    }
+    # the rendered page is cached until the artist, one of its shows or
+    # one of the venues on it changes, or its next show starts
+    response = cached_page(
+        ('artist', artist_id), lambda: build_artist_page(artist_id))
+    if response is None:
+        return render_template('pages/home.html')
+    return response
 
-    past_shows = Show.query.join(Artist).filter(
-        Artist.id == artist.id,
-        Show.start_time < datetime.today()
-    ).all()
-    # add past_shows data
-    for show in past_shows:
-        data['past_shows'].append(
-            {
-                'venue_id': show.venue.id,
-                'venue_name': show.venue.name,
-                'venue_image_link': show.venue.image_link,
-                'start_time': str(show.start_time)
-            }
-        )
-    # add upcoming_shows data
-    upcoming_shows = Show.query.join(Artist).filter(
-        Artist.id == artist.id,
-        Show.start_time > datetime.today()
-    ).all()
-    for show in upcoming_shows:
-        data['upcoming_shows'].append(
-            {
-                'venue_id': show.venue.id,
-                'venue_name': show.venue.name,
-                'venue_image_link': show.venue.image_link,
-                'start_time': str(show.start_time)
-            }
-        )
 
-    return render_template(
+def build_artist_page(artist_id):
+    data = artist_detail(artist_id)
+
+    if data is None:
+        return None
+
+    body = render_template(
         'pages/show_artist.html',
         artist=data
     )
+    expires_at = (
+        data['upcoming_shows'][0]['start_time']
+        if data['upcoming_shows'] else None
+    )
+    return body, expires_at
+
+
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    # deletes the artist, its shows and genre links with one statement each
+    return delete_entity_response('artist', artist_id)
 
 #  ----------------------------------------------------------------
 #  Update
@@ -458,6 +477,8 @@ def show_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
+    # a stale replica row would be posted back over newer values
+    use_primary()
 
     try:
         artist_to_edit = Artist.query.get(artist_id)
@@ -482,24 +503,8 @@ def edit_artist_submission(artist_id):
         form = ArtistForm(request.form)
         name = form.name.data
 
-        # Add new genres to the db
-        # create a list of genre objects
-
-        genre_objects = []
-
-        for genre in form.genres.data:
-            if genre not in [gen.name for gen in Genre.query.all()]:
-                try:
-                    new_genre = Genre(name=genre)
-                    db.session.add(new_genre)
-                    genre_objects.append(new_genre)
-                except Exception as e:
-                    print(e)
-                    flash('An error occured adding the new genre')
-                    return render_template('pages/home.html')
-            else:
-                genre_objects.append(
-                    Genre.query.filter(Genre.name == genre).all()[0])
+        # genre objects, adding new genres to the db
+        genre_objects = resolve_genres(form.genres.data)
 
         if form.seeking_venue.data == 'y':
             seeking_venue = True
@@ -544,6 +549,8 @@ def edit_artist_submission(artist_id):
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
+    # a stale replica row would be posted back over newer values
+    use_primary()
 
     try:
         venue = Venue.query.get(venue_id)
@@ -571,23 +578,8 @@ def edit_venue_submission(venue_id):
     try:
         venue = Venue.query.get(venue_id)
         form = VenueForm(request.form)
-        # check if the genres are in the db
-        # add the genre objects to a list
-
-        genre_objects = []
-
-        for genre in form.genres.data:
-            if genre not in [gen.name for gen in Genre.query.all()]:
-                try:
-                    new_genre = Genre(name=genre)
-                    db.session.add(new_genre)
-                    genre_objects.append(new_genre)
-                except Exception as e:
-                    print(e)
-                    flash('An error occured adding a genre: {e}')
-            else:
-                genre_objects.append(Genre.query.filter(
-                    Genre.name == genre).all()[0])
+        # genre objects, adding new genres to the db
+        genre_objects = resolve_genres(form.genres.data)
 
         if form.seeking_talent.data == 'y':
             seeking_talent = True
@@ -643,23 +635,8 @@ def create_artist_submission():
         form = ArtistForm(request.form)
         name = form.name.data
 
-        # create a list to hold the genres as objects
-        # add new genres to the db
-        genre_objects = []
-
-        for genre in form.genres.data:
-            if genre not in [gen.name for gen in Genre.query.all()]:
-                try:
-                    new_genre = Genre(name=genre)
-                    db.session.add(new_genre)
-                    genre_objects.append(new_genre)
-                except Exception as e:
-                    print(e)
-                    flash(f'An error occurred while entering a new Genre: {e}')
-                    return render_template('pages/home.html')
-            else:
-                genre_objects.append(Genre.query.filter(
-                    Genre.name == genre).all()[0])
+        # genre objects, adding new genres to the db
+        genre_objects = resolve_genres(form.genres.data)
 
         if form.seeking_venue == 'y':
             seeking_venue = True
@@ -709,14 +686,53 @@ def shows():
     # displays list of shows at /shows
     # replace with real venues data.
 
-    # Query for all of the Shows in the db
-    shows = Show.query.all()
+    # optional filters, kept on the next / prev links
+    filters = {}
+    query = Show.query.options(
+        joinedload(Show.venue),
+        joinedload(Show.artist)
+    )
+
+    if request.args.get('upcoming') in ('1', 'true', 'y'):
+        filters['upcoming'] = '1'
+        query = query.filter(Show.start_time > datetime.today())
+
+    city = request.args.get('city')
+    if city:
+        filters['city'] = city
+        query = query.filter(Show.venue_id.in_(
+            db.session.query(Venue.id).filter(Venue.city == city)))
+
+    venue_id = request.args.get('venue_id', type=int)
+    if venue_id is not None:
+        filters['venue_id'] = venue_id
+        query = query.filter(Show.venue_id == venue_id)
+
+    artist_id = request.args.get('artist_id', type=int)
+    if artist_id is not None:
+        filters['artist_id'] = artist_id
+        query = query.filter(Show.artist_id == artist_id)
+
+    # keyset pagination on (start_time, id)
+    try:
+        after = request.args.get('after')
+        before = request.args.get('before')
+        page = keyset_page(
+            query,
+            (Show.start_time, Show.id),
+            key=lambda show: (show.start_time, show.id),
+            per_page=app.config['SHOWS_PER_PAGE'],
+            after=decode_cursor(after, (datetime, int)) if after else None,
+            before=decode_cursor(before, (datetime, int)) if before else None
+        )
+    except InvalidCursor:
+        abort(400)
 
     # Create a variable to hold the Show data
 
     data = []
 
-    for show in shows:
+    for show in page.items:
         data.append(
             {
                 "venue_id": show.venue.id,
@@ -724,11 +740,16 @@ def shows():
                 "artist_id": show.artist.id,
                 "artist_name": show.artist.name,
                 "artist_image_link": show.artist.image_link,
-                "start_time": str(show.start_time)
+                "start_time": show.start_time
             }
         )
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template(
+        'pages/shows.html',
+        shows=data,
+        page=page,
+        filters=filters
+    )
 
 
 @app.route('/shows/create')
@@ -744,18 +765,41 @@ def create_show_submission():
     # upon submitting new show listing form
     # insert form data as a new Show record in the db, instead
 
+    problem = None
     try:
         form = ShowForm(request.form)
-
-        db.session.add(
-            Show(
-                venue_id=form.venue_id.data,
-                artist_id=form.artist_id.data,
-                start_time=form.start_time.data
+        venue_id = int(form.venue_id.data)
+        artist_id = int(form.artist_id.data)
+        start_time = form.start_time.data
+        end_time = form.end_time.data or start_time + DEFAULT_SHOW_DURATION
+        if end_time <= start_time:
+            problem = (
+                'Show could not be listed, it has to end after it starts.')
+        elif end_time - start_time > MAX_SHOW_DURATION:
+            problem = (
+                f'Show could not be listed, it can last at most '
+                f'{MAX_SHOW_DURATION // timedelta(hours=1)} hours.')
+        else:
+            # refuse to double book the venue or the artist
+            conflicts = book_show(
+                Show(
+                    venue_id=venue_id,
+                    artist_id=artist_id,
+                    start_time=start_time,
+                    end_time=end_time
+                )
             )
-        )
-        db.session.commit()
-        success = True
+            if conflicts:
+                db.session.rollback()
+                problem = (
+                    f'Show could not be listed, it overlaps the show on '
+                    f'{conflicts[0].start_time:%Y-%m-%d %H:%M} '
+                    f'(venue {conflicts[0].venue_id}, '
+                    f'artist {conflicts[0].artist_id}).'
+                )
+            else:
+                db.session.commit()
+        success = problem is None
     except Exception as e:
         print(e)
         db.session.rollback()
@@ -765,6 +809,8 @@ def create_show_submission():
 
         if success:
             flash('Show was successfully listed!')
+        elif problem:
+            flash(problem)
         else:
             flash('An error occurred. Show could not be listed.')
 
@@ -774,6 +820,45 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#  ----------------------------------------------------------------
+#  Export
+#  ----------------------------------------------------------------
+
+
+def parse_date_arg(name):
+    # optional ISO 8601 date / datetime query parameter
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return dateutil.parser.isoparse(value)
+    except ValueError:
+        abort(400)
+
+
+@app.route('/export/<kind>.<format>')
+def export(kind, format):
+    # streams every venue, artist or show as csv or ndjson
+    if kind not in EXPORTS or format not in FORMATS:
+        abort(404)
+
+    query = export_query(
+        kind,
+        start=parse_date_arg('start'),
+        end=parse_date_arg('end'),
+        updated_since=parse_date_arg('updated_since')
+    )
+    mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(iter_export(query, format)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={kind}.{format}'
+        }
+    )
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -796,6 +881,219 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'format', type=click.Choice(FORMATS),
+              default='csv', show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='File to write to, stdout by default.')
+@click.option('--start', type=click.DateTime(),
+              help='Only shows starting at or after this time.')
+@click.option('--end', type=click.DateTime(),
+              help='Only shows starting before this time.')
+@click.option('--updated-since', type=click.DateTime(),
+              help='Only rows updated at or after this time.')
+def export_command(kind, format, output, start, end, updated_since):
+    """Stream venues, artists or shows as CSV or NDJSON."""
+    query = export_query(
+        kind, start=start, end=end, updated_since=updated_since)
+    for chunk in iter_export(query, format):
+        output.write(chunk)
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Rows written per transaction.')
+@click.option('--dry-run', is_flag=True,
+              help='Validate only, write nothing.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='Progress file, defaults to PATH.checkpoint.')
+@click.option('--restart', is_flag=True,
+              help='Ignore an existing checkpoint and start over.')
+def import_command(kind, path, batch_size, dry_run, checkpoint, restart):
+    """Bulk load genres, venues, artists or shows from CSV or JSON."""
+    checkpoint = checkpoint or path + '.checkpoint'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    def progress(report):
+        click.echo(
+            f'{kind}: {report.skipped + report.read} rows read, '
+            f'{report.imported} imported, {report.invalid} invalid',
+            err=True
+        )
+
+    report = import_file(
+        kind, path, batch_size=batch_size, dry_run=dry_run,
+        checkpoint=checkpoint, progress=progress)
+
+    for line, errors in report.errors[:20]:
+        click.echo(f'line {line}: {errors}', err=True)
+    if report.invalid > 20:
+        click.echo(f'... and {report.invalid - 20} more invalid rows',
+                   err=True)
+
+    verb = 'would import' if dry_run else 'imported'
+    click.echo(f'{verb} {report.imported} {kind}, '
+               f'{report.invalid} invalid, {report.skipped} already done')
+
+
+@app.cli.group('counters')
+def counters_command():
+    """Maintain the venue and artist show counters."""
+
+
+@counters_command.command('roll')
+def roll_counters_command():
+    """Move shows that have started into the past counters."""
+    with db.engine.begin() as connection:
+        moved = roll_forward(connection)
+    click.echo(f'{moved} shows moved to the past counters')
+
+
+@counters_command.command('rebuild')
+def rebuild_counters_command():
+    """Recompute every counter from the shows table."""
+    with db.engine.begin() as connection:
+        rebuild_counters(connection)
+    click.echo('show counters rebuilt')
+
+
+@app.cli.group('shows')
+def shows_maintenance_command():
+    """Maintain the shows partitions and archive."""
+
+
+@shows_maintenance_command.command('partitions')
+@click.option('--ahead', type=int,
+              default=lambda: app.config['SHOWS_PARTITION_MONTHS_AHEAD'],
+              help='Months to create beyond the current one.')
+def partitions_command(ahead):
+    """Create the monthly shows partitions of the coming months."""
+    with db.engine.begin() as connection:
+        if not is_partitioned(connection):
+            raise click.ClickException(
+                'shows is not partitioned, see SHOWS_PARTITIONED')
+        created = ensure_partitions(connection, ahead)
+    click.echo(f'{len(created)} partitions created'
+               + (f': {", ".join(created)}' if created else ''))
+
+
+@shows_maintenance_command.command('archive')
+@click.option('--days', type=int,
+              default=lambda: app.config['SHOWS_ARCHIVE_AFTER_DAYS'],
+              help='Archive shows that ended at least this many days ago.')
+def archive_command(days):
+    """Move long finished shows into shows_archive."""
+    with db.engine.begin() as connection:
+        if is_partitioned(connection):
+            raise click.ClickException(
+                'shows is partitioned, past months are already kept apart')
+        moved = archive_shows(
+            connection, datetime.today() - timedelta(days=days))
+    click.echo(f'{moved} shows archived')
+
+
+@app.cli.group('related')
+def related_command():
+    """Maintain the precomputed related artists."""
+
+
+@related_command.command('update')
+@click.option('--k', type=int,
+              default=lambda: app.config['RELATED_ARTISTS_K'],
+              help='Related artists kept per artist.')
+def update_related_command(k):
+    """Recompute the artists queued by genre and show changes."""
+    with db.engine.begin() as connection:
+        count = related.update(connection, k)
+    click.echo(f'{count} artists updated')
+
+
+@related_command.command('rebuild')
+@click.option('--k', type=int,
+              default=lambda: app.config['RELATED_ARTISTS_K'],
+              help='Related artists kept per artist.')
+def rebuild_related_command(k):
+    """Recompute the related artists of every artist."""
+    with db.engine.begin() as connection:
+        count = related.rebuild(connection, k)
+    click.echo(f'{count} artists rebuilt')
+
+
+@app.cli.group('matches')
+def matches_command():
+    """Maintain the venue / artist matches."""
+
+
+@matches_command.command('update')
+@click.option('--k', type=int, default=lambda: app.config['MATCHES_K'],
+              help='Matches kept per venue and per artist.')
+@click.option('--full', is_flag=True,
+              help='Re-score everyone, not only what changed.')
+def update_matches_command(k, full):
+    """Re-score the seeking venues and artists changed since the last run."""
+    margin = timedelta(seconds=app.config['MATCHES_WATERMARK_MARGIN'])
+    with db.engine.begin() as connection:
+        counts = matchmaking.update(connection, k, full, margin)
+    click.echo(f"{counts['venue']} venues, {counts['artist']} artists "
+               f"re-scored")
+
+
+@app.cli.group('geo')
+def geo_command():
+    """Maintain the venue coordinates."""
+
+
+@geo_command.command('geocode')
+@click.argument('gazetteer', type=click.Path(exists=True, dir_okay=False))
+@click.option('--overwrite', is_flag=True,
+              help='Geocode venues that already have coordinates too.')
+def geocode_command(gazetteer, overwrite):
+    """Fill venue coordinates from a GeoNames or Census gazetteer file."""
+    places = geo.load_gazetteer(gazetteer)
+    with db.engine.begin() as connection:
+        geocoded, missing = geo.geocode_venues(connection, places, overwrite)
+    # core updates, the mapper events do not see them
+    geo.invalidate()
+    click.echo(f'{len(places)} places read, {geocoded} venues geocoded, '
+               f'{missing} not found')
+
+
+@app.cli.group('assets')
+def assets_command():
+    """Build the static asset bundles."""
+
+
+@assets_command.command('build')
+def build_assets_command():
+    """Bundle, minify, fingerprint and compress static/ into static/dist."""
+    manifest = assets.build(
+        app.static_folder, app.static_url_path, echo=click.echo)
+    click.echo(f'{len(manifest)} assets written to static/{assets.DIST}'
+               + ('' if assets.brotli else ' (no brotli, .gz only)'))
+
+
+@app.cli.group('areas')
+def areas_command():
+    """Maintain the city / state area summary."""
+
+
+@areas_command.command('rebuild')
+def rebuild_areas_command():
+    """Recompute the area summary from the venues table."""
+    with db.engine.begin() as connection:
+        areas.rebuild(connection)
+    click.echo(f'{Area.query.count()} areas')
+
+
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
@@ -0,0 +1,124 @@
+from collections import Counter
+
+from sqlalchemy import bindparam, event, func, inspect, select
+from models import Area, Venue
+
+
+# ----------------------------------------------------------------------------#
+# Area summary.
+# ----------------------------------------------------------------------------#
+# One row per (state, city) with its number of venues, so the venue landing
+# page lists areas without reading every venue.  Venue insert / update /
+# delete events keep it in step inside the same transaction.
+
+
+areas = Area.__table__
+venues = Venue.__table__
+
+
+def _upsert(connection, rows):
+    # adds venue_count to existing areas, creates the missing ones
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for row in rows:
+            updated = connection.execute(
+                areas.update().where(
+                    (areas.c.state == row['state']) &
+                    (areas.c.city == row['city'])
+                ).values(venue_count=areas.c.venue_count + row['venue_count'])
+            ).rowcount
+            if not updated:
+                connection.execute(areas.insert().values(**row))
+        return
+
+    statement = insert(areas)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=['state', 'city'],
+            set_={'venue_count': areas.c.venue_count +
+                  statement.excluded.venue_count}
+        ),
+        rows
+    )
+
+
+def count_venues(connection, added=(), removed=()):
+    # adjusts the summary for (state, city) pairs of venues inserted into
+    # or deleted from this connection
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    increments = [
+        {'state': state, 'city': city, 'venue_count': delta}
+        for (state, city), delta in deltas.items()
+        if delta > 0 and state is not None and city is not None
+    ]
+    decrements = [
+        {'_state': state, '_city': city, '_delta': -delta}
+        for (state, city), delta in deltas.items() if delta < 0
+    ]
+
+    if increments:
+        _upsert(connection, increments)
+    if decrements:
+        where = (
+            (areas.c.state == bindparam('_state')) &
+            (areas.c.city == bindparam('_city'))
+        )
+        connection.execute(
+            areas.update().where(where).values(
+                venue_count=areas.c.venue_count - bindparam('_delta')),
+            decrements
+        )
+        connection.execute(
+            areas.delete().where(where & (areas.c.venue_count <= 0)),
+            decrements
+        )
+
+
+def rebuild(connection):
+    # recomputes the summary from the venues table
+    connection.execute(areas.delete())
+    rows = connection.execute(
+        select(venues.c.state, venues.c.city, func.count()).where(
+            venues.c.state.isnot(None), venues.c.city.isnot(None)
+        ).group_by(venues.c.state, venues.c.city)
+    ).all()
+    if rows:
+        connection.execute(areas.insert(), [
+            {'state': state, 'city': city, 'venue_count': count}
+            for state, city, count in rows
+        ])
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+
+
+def _venue_inserted(mapper, connection, target):
+    count_venues(connection, added=[(target.state, target.city)])
+
+
+def _venue_deleted(mapper, connection, target):
+    count_venues(connection, removed=[(target.state, target.city)])
+
+
+def _venue_updated(mapper, connection, target):
+    attrs = inspect(target).attrs
+    old = tuple(
+        attrs[name].history.deleted[0] if attrs[name].history.deleted
+        else getattr(target, name)
+        for name in ('state', 'city')
+    )
+    new = (target.state, target.city)
+    if old != new:
+        count_venues(connection, added=[new], removed=[old])
+
+
+event.listen(Venue, 'after_insert', _venue_inserted)
+event.listen(Venue, 'after_delete', _venue_deleted)
+event.listen(Venue, 'after_update', _venue_updated)
@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import threading
+
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# ----------------------------------------------------------------------------#
+# Bundles.
+# ----------------------------------------------------------------------------#
+# `flask assets build` writes every file of static/ to static/dist/ under a
+# content-hashed name, concatenates and minifies the bundles below, adds
+# .gz (and .br when the brotli package is installed) siblings and records
+# the names in static/dist/manifest.json.  Templates ask for urls through
+# asset_url() / asset_urls(), which fall back to the plain files when
+# nothing has been built.
+
+
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'main.js': [
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.eot',
+                '.ttf', '.otf')
+
+
+# ----------------------------------------------------------------------------#
+# Minification.
+# ----------------------------------------------------------------------------#
+
+
+_CSS_COMMENTS = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACES = re.compile(r'\s+')
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+_CSS_URLS = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def minify_css(text):
+    text = _CSS_COMMENTS.sub('', text)
+    text = _CSS_SPACES.sub(' ', text)
+    text = _CSS_PUNCTUATION.sub(r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    # whitespace only: indentation, blank lines and whole-line // comments;
+    # anything smarter needs a real parser
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def minify(path, text):
+    if '.min.' in path:
+        return text
+    if path.endswith('.css'):
+        return minify_css(text)
+    if path.endswith('.js'):
+        return minify_js(text)
+    return text
+
+
+# ----------------------------------------------------------------------------#
+# Build.
+# ----------------------------------------------------------------------------#
+
+
+def hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    root, extension = posixpath.splitext(path)
+    return f'{root}.{digest}{extension}'
+
+
+def _write(dist, name, content):
+    target = os.path.join(dist, *name.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(content)
+    if name.endswith(COMPRESSIBLE):
+        with open(target + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            with open(target + '.br', 'wb') as f:
+                f.write(brotli.compress(content))
+
+
+def _rewrite_urls(path, text, manifest, static_url):
+    # relative url()s of a css file point at the built files instead, the
+    # css itself moves to another directory
+    def replace(match):
+        url = match.group(2)
+        if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        target = re.split(r'[?#]', url, 1)[0]
+        suffix = url[len(target):]
+        target = posixpath.normpath(
+            posixpath.join(posixpath.dirname(path), target))
+        built = manifest.get(target)
+        location = f'{DIST}/{built}' if built else target
+        return f'url("{static_url}/{location}{suffix}")'
+    return _CSS_URLS.sub(replace, text)
+
+
+def build(static_folder, static_url='/static', echo=print):
+    # rebuilds static/dist from scratch, returns the manifest
+    dist = os.path.join(static_folder, DIST)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist]
+        for filename in files:
+            if not filename.startswith('.'):
+                path = os.path.relpath(
+                    os.path.join(root, filename), static_folder)
+                sources.append(path.replace(os.sep, '/'))
+    # css last, its url()s need the hashed names of fonts and images
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static_folder, *path.split('/')), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = _rewrite_urls(
+                path, content.decode('utf-8'), manifest, static_url
+            ).encode('utf-8')
+        manifest[path] = hashed_name(path, content)
+        _write(dist, manifest[path], content)
+
+    for bundle, paths in BUNDLES.items():
+        parts = []
+        for path in paths:
+            with open(os.path.join(static_folder, *path.split('/')),
+                      encoding='utf-8') as f:
+                text = f.read()
+            if path.endswith('.css'):
+                text = _rewrite_urls(path, text, manifest, static_url)
+            parts.append(minify(path, text))
+        # ';' keeps one script's last statement from running into the next
+        joiner = '\n' if bundle.endswith('.css') else ';\n'
+        content = joiner.join(parts).encode('utf-8')
+        manifest[bundle] = hashed_name(bundle, content)
+        _write(dist, manifest[bundle], content)
+        echo(f'{bundle}: {len(paths)} files, {len(content)} bytes '
+             f'-> {manifest[bundle]}')
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    _manifest.clear()
+    return manifest
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+
+_manifest = {}
+_lock = threading.Lock()
+
+
+def load_manifest():
+    # the built names, re-read when manifest.json changes
+    path = os.path.join(current_app.static_folder, DIST, MANIFEST)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    with _lock:
+        if _manifest.get('mtime') != mtime:
+            with open(path) as f:
+                _manifest.update(mtime=mtime, names=json.load(f))
+        return _manifest['names']
+
+
+def manifest_version():
+    # mtime of the current manifest, None when nothing is built
+    if not load_manifest():
+        return None
+    return _manifest['mtime']
+
+
+def asset_url(path):
+    # url of the built copy of a static file, the file itself otherwise
+    built = load_manifest().get(path)
+    if built:
+        return url_for('static', filename=f'{DIST}/{built}')
+    return url_for('static', filename=path)
+
+
+def asset_urls(bundle):
+    # one url for a built bundle, one per source file otherwise
+    built = load_manifest().get(bundle)
+    if built:
+        return [url_for('static', filename=f'{DIST}/{built}')]
+    return [url_for('static', filename=path) for path in BUNDLES[bundle]]
+
+
+def dist_view(filename):
+    # built files never change under a name, so they may be cached forever;
+    # a precompressed sibling is sent when the client accepts it
+    dist = os.path.join(current_app.static_folder, DIST)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+
+    for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(
+                os.path.join(dist, *(filename + extension).split('/'))):
+            response = send_from_directory(
+                dist, filename + extension, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            # the name of the compressed file is not the one asked for
+            response.headers.pop('Content-Disposition', None)
+            break
+    else:
+        if filename.endswith(('.gz', '.br')):
+            raise NotFound()
+        response = send_from_directory(dist, filename, mimetype=mimetype)
+
+    response.headers.add('Vary', 'Accept-Encoding')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['ASSETS_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    app.add_url_rule(
+        f'{app.static_url_path}/{DIST}/<path:filename>', 'dist', dist_view)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
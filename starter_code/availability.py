@@ -0,0 +1,82 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, exists
+from bookings import overlaps
+from models import Venue, Show, Genre, venue_genre
+
+
+# ----------------------------------------------------------------------------#
+# Venue availability.
+# ----------------------------------------------------------------------------#
+# Open venues are found with NOT EXISTS probes, one per candidate venue:
+# "any show at this venue overlapping the range" is answered by the GiST
+# index of ex_shows_venue_overlap on postgres (ix_shows_venue_id_start_time
+# elsewhere) and the genre check by ix_venue_genres_venue_id_genre_id, so
+# the cost follows the venues examined, not the size of the shows table.
+
+
+def date_range(first, last=None):
+    # [start, end) covering the days first..last inclusive
+    last = last or first
+    if last < first:
+        first, last = last, first
+    return (
+        datetime.combine(first, time.min),
+        datetime.combine(last + timedelta(days=1), time.min)
+    )
+
+
+def availability_filters(start, end, city=None, state=None, genre=None,
+                         seeking_talent=None):
+    # conditions on Venue for venues with no show running in [start, end)
+    booked = exists().where(and_(
+        Show.venue_id == Venue.id,
+        overlaps(start, end)
+    ))
+    filters = [~booked]
+
+    if city:
+        filters.append(Venue.city == city)
+    if state:
+        filters.append(Venue.state == state)
+    if genre:
+        filters.append(exists().where(and_(
+            venue_genre.c.venue_id == Venue.id,
+            venue_genre.c.genre_id == Genre.id,
+            Genre.name == genre
+        )))
+    if seeking_talent is not None:
+        filters.append(
+            Venue.seeking_talent.is_(True) if seeking_talent
+            else Venue.seeking_talent.isnot(True))
+    return filters
+
+
+def filters_from_args(args):
+    # (query string parameters to keep, filters) for ?from=YYYY-MM-DD
+    # &to=&city=&state=&genre=&seeking_talent=, None without a valid from
+    first = args.get('from', type=date.fromisoformat)
+    if first is None:
+        return None
+    last = args.get('to', type=date.fromisoformat) or first
+    params = {'from': first.isoformat(), 'to': last.isoformat()}
+    for name in ('city', 'state', 'genre'):
+        if args.get(name):
+            params[name] = args[name]
+
+    seeking_talent = None
+    if args.get('seeking_talent') in ('1', 'true', 'y'):
+        seeking_talent = True
+    elif args.get('seeking_talent') in ('0', 'false', 'n'):
+        seeking_talent = False
+    if seeking_talent is not None:
+        params['seeking_talent'] = '1' if seeking_talent else '0'
+
+    start, end = date_range(first, last)
+    return params, availability_filters(
+        start, end,
+        city=params.get('city'),
+        state=params.get('state'),
+        genre=params.get('genre'),
+        seeking_talent=seeking_talent
+    )
@@ -0,0 +1,235 @@
+import random
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select
+from models import db, Venue, Artist, Show, MAX_SHOW_DURATION
+
+
+# ----------------------------------------------------------------------------#
+# Interval tree.
+# ----------------------------------------------------------------------------#
+
+
+class _Node(object):
+    __slots__ = ('start', 'end', 'key', 'priority', 'left', 'right',
+                 'max_end')
+
+    def __init__(self, start, end, key):
+        self.start = start
+        self.end = end
+        self.key = key
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+    def update(self):
+        self.max_end = self.end
+        for child in (self.left, self.right):
+            if child is not None and child.max_end > self.max_end:
+                self.max_end = child.max_end
+
+
+def _rotate_right(node):
+    left = node.left
+    node.left, left.right = left.right, node
+    node.update()
+    left.update()
+    return left
+
+
+def _rotate_left(node):
+    right = node.right
+    node.right, right.left = right.left, node
+    node.update()
+    right.update()
+    return right
+
+
+class IntervalTree(object):
+    # half-open [start, end) intervals, each with a key; a treap ordered by
+    # (start, key) whose nodes know the largest end below them, so add,
+    # remove and overlap queries take O(log n) expected, plus the matches
+
+    def __init__(self, intervals=()):
+        self.root = None
+        self.size = 0
+        for start, end, key in intervals:
+            self.add(start, end, key)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, start, end, key):
+        self.root = self._add(self.root, _Node(start, end, key))
+        self.size += 1
+
+    def _add(self, node, new):
+        if node is None:
+            return new
+        if (new.start, new.key) < (node.start, node.key):
+            node.left = self._add(node.left, new)
+            if node.left.priority > node.priority:
+                return _rotate_right(node)
+        else:
+            node.right = self._add(node.right, new)
+            if node.right.priority > node.priority:
+                return _rotate_left(node)
+        node.update()
+        return node
+
+    def remove(self, start, key):
+        size = self.size
+        self.root = self._remove(self.root, (start, key))
+        return self.size < size
+
+    def _remove(self, node, target):
+        if node is None:
+            return None
+        current = (node.start, node.key)
+        if target < current:
+            node.left = self._remove(node.left, target)
+        elif target > current:
+            node.right = self._remove(node.right, target)
+        else:
+            self.size -= 1
+            return self._merge(node.left, node.right)
+        node.update()
+        return node
+
+    def _merge(self, left, right):
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            left.update()
+            return left
+        right.left = self._merge(left, right.left)
+        right.update()
+        return right
+
+    def overlapping(self, start, end):
+        # (start, end, key) of every interval sharing time with [start, end)
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end <= start:
+                continue
+            stack.append(node.left)
+            if node.start < end:
+                if node.end > start:
+                    found.append((node.start, node.end, node.key))
+                stack.append(node.right)
+        found.sort(key=lambda interval: (interval[0], interval[2]))
+        return found
+
+
+# ----------------------------------------------------------------------------#
+# Double bookings.
+# ----------------------------------------------------------------------------#
+# Double bookings are checked in SQL, in the transaction that inserts the
+# show: the GiST indexes behind the exclusion constraints answer on
+# PostgreSQL, ix_shows_venue_id_start_time / ix_shows_artist_id_start_time
+# elsewhere, where no show lasting more than MAX_SHOW_DURATION bounds the
+# range scanned from below.  Bulk inserts check their rows against an
+# IntervalTree per venue and artist, see reject_overlaps.
+
+
+COLUMNS = {
+    'venue': Show.venue_id,
+    'artist': Show.artist_id,
+}
+
+
+def uses_gist():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def overlaps(start, end):
+    # SQL condition: the show shares time with [start, end)
+    if uses_gist():
+        return func.tsrange(Show.start_time, Show.end_time).op('&&')(
+            func.tsrange(start, end))
+    condition = and_(Show.start_time < end, Show.end_time > start)
+    if start - datetime.min > MAX_SHOW_DURATION:
+        condition = and_(
+            condition, Show.start_time > start - MAX_SHOW_DURATION)
+    return condition
+
+
+def overlap_filter(kind, entity_id, start, end):
+    # SQL condition for the venue's / artist's shows overlapping [start, end)
+    return and_(COLUMNS[kind] == entity_id, overlaps(start, end))
+
+
+def find_conflicts(venue_id, artist_id, start, end, exclude_id=None):
+    # shows that would double book the venue or the artist, as committed
+    query = Show.query.filter(or_(
+        overlap_filter('venue', venue_id, start, end),
+        overlap_filter('artist', artist_id, start, end)
+    ))
+    if exclude_id is not None:
+        query = query.filter(Show.id != exclude_id)
+    return query.order_by(Show.start_time).all()
+
+
+def book_show(show):
+    # adds the show to the session unless it double books its venue or
+    # artist, returns the conflicting shows; the caller commits, or rolls
+    # back when there are any.  The venue and artist rows stay locked until
+    # then, and the check runs again once the show is flushed: sqlite
+    # ignores FOR UPDATE, but the flush takes its write lock, after which a
+    # concurrent booking is either committed and seen or waiting
+    for model, entity_id in ((Venue, show.venue_id),
+                             (Artist, show.artist_id)):
+        db.session.query(model.id).filter(
+            model.id == entity_id).with_for_update().all()
+    interval = (show.venue_id, show.artist_id, show.start_time, show.end_time)
+    conflicts = find_conflicts(*interval)
+    if conflicts:
+        return conflicts
+    db.session.add(show)
+    db.session.flush()
+    return find_conflicts(*interval, exclude_id=show.id)
+
+
+def reject_overlaps(connection, rows):
+    # rows of a bulk insert that overlap an existing show or an earlier row
+    # of the same batch, in two queries and one pair of trees per batch
+    if not rows:
+        return []
+    first = min(row['start_time'] for row in rows)
+    last = max(row['end_time'] for row in rows)
+    trees = {}
+    for kind, column in COLUMNS.items():
+        ids = {row[column.key] for row in rows}
+        existing = connection.execute(
+            select(column, Show.start_time, Show.end_time, Show.id).where(
+                column.in_(ids),
+                overlaps(first, last)
+            )
+        ).all()
+        for entity_id, start, end, show_id in existing:
+            trees.setdefault((kind, entity_id), IntervalTree()).add(
+                start, end, show_id)
+
+    rejected = []
+    for position, row in enumerate(rows):
+        keys = [(kind, row[column.key]) for kind, column in COLUMNS.items()]
+        clash = [
+            interval for key in keys if key in trees
+            for interval in trees[key].overlapping(
+                row['start_time'], row['end_time'])
+        ]
+        if clash:
+            key = clash[0][2]
+            rejected.append((row, (
+                f'overlaps show {key}' if key > 0
+                else 'overlaps an earlier row of this batch')))
+            continue
+        for key in keys:
+            # pending rows get negative keys so they never equal a show id
+            trees.setdefault(key, IntervalTree()).add(
+                row['start_time'], row['end_time'], -position - 1)
+    return rejected
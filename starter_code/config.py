@@ -1,5 +1,5 @@
 import os
-from decouple import config
+from decouple import Csv, config
 SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -14,3 +14,115 @@ DEBUG = config('DEBUG')
 SQLALCHEMY_DATABASE_URI = config('SQLALCHEMY_DATABASE_URI')
 
 SQLALCHEMY_TRACK_MODIFICATIONS = config('SQLALCHEMY_TRACK_MODIFICATIONS')
+
+# Comma separated read replica URLs; GET requests read from one of them
+SQLALCHEMY_REPLICA_URIS = config(
+    'SQLALCHEMY_REPLICA_URIS', default='', cast=Csv())
+# seconds a client keeps reading from the primary after it wrote something,
+# keep this above the replication lag
+SQLALCHEMY_REPLICA_STICKY_SECONDS = config(
+    'SQLALCHEMY_REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+# Connection pool and engine tuning, size these against the database's
+# max_connections divided by the number of workers
+DB_POOL_SIZE = config('DB_POOL_SIZE', default=5, cast=int)
+DB_MAX_OVERFLOW = config('DB_MAX_OVERFLOW', default=10, cast=int)
+# seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=30, cast=int)
+# seconds after which a connection is replaced, keep this below the
+# server's / proxy's idle timeout
+DB_POOL_RECYCLE = config('DB_POOL_RECYCLE', default=1800, cast=int)
+# test connections on checkout, catches ones dropped while idle
+DB_POOL_PRE_PING = config('DB_POOL_PRE_PING', default=True, cast=bool)
+# postgres statement_timeout in milliseconds, 0 disables it
+DB_STATEMENT_TIMEOUT = config('DB_STATEMENT_TIMEOUT', default=0, cast=int)
+
+# Search backend: 'postgres' (pg_trgm / tsvector), 'ngram' (in-process
+# index) or 'auto' to pick by database dialect
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='auto')
+SEARCH_RESULT_LIMIT = config('SEARCH_RESULT_LIMIT', default=50, cast=int)
+# seconds before the in-process index is rebuilt from the database
+SEARCH_INDEX_TTL = config('SEARCH_INDEX_TTL', default=300, cast=int)
+
+# Number of shows per page on /shows
+SHOWS_PER_PAGE = config('SHOWS_PER_PAGE', default=30, cast=int)
+
+# Cache rendered venue / artist pages and answer conditional GETs
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=True, cast=bool)
+
+# Per-request SQL statistics (Server-Timing header, N+1 warnings)
+SQL_INSTRUMENTATION = config('SQL_INSTRUMENTATION', default=True, cast=bool)
+# warn when one request runs the same statement shape more often than this
+SQL_REPEAT_THRESHOLD = config('SQL_REPEAT_THRESHOLD', default=10, cast=int)
+# expose recent request statistics at /_debug/sql
+SQL_DEBUG_ENDPOINT = config('SQL_DEBUG_ENDPOINT', default=False, cast=bool)
+
+# Cache lifetime, in seconds, of the fingerprinted files in static/dist
+ASSETS_MAX_AGE = config('ASSETS_MAX_AGE', default=365 * 24 * 3600, cast=int)
+
+# Compiled templates, shared by the workers; empty to compile in memory
+TEMPLATE_BYTECODE_DIR = config('TEMPLATE_BYTECODE_DIR',
+                               default=os.path.join(basedir, 'instance',
+                                                    'jinja'))
+# compile every template at boot instead of on first use
+TEMPLATE_PRECOMPILE = config('TEMPLATE_PRECOMPILE', default=True, cast=bool)
+# {% cache %} fragments kept in memory, see template_cache.py
+FRAGMENT_CACHE_ENABLED = config('FRAGMENT_CACHE_ENABLED', default=True,
+                                cast=bool)
+FRAGMENT_CACHE_SIZE = config('FRAGMENT_CACHE_SIZE', default=5000, cast=int)
+FRAGMENT_CACHE_TTL = config('FRAGMENT_CACHE_TTL', default=3600, cast=int)
+
+# Local copies of image_link images, see thumbnails.py
+THUMBNAIL_DIR = config(
+    'THUMBNAIL_DIR', default=os.path.join(basedir, 'instance', 'thumbnails'))
+# disk space the thumbnails may use before the least recently used go
+THUMBNAIL_CACHE_BYTES = config(
+    'THUMBNAIL_CACHE_BYTES', default=256 * 1024 * 1024, cast=int)
+THUMBNAIL_MAX_AGE = config('THUMBNAIL_MAX_AGE', default=7 * 24 * 3600,
+                           cast=int)
+THUMBNAIL_FETCH_TIMEOUT = config('THUMBNAIL_FETCH_TIMEOUT', default=5,
+                                 cast=int)
+THUMBNAIL_MAX_SOURCE_BYTES = config(
+    'THUMBNAIL_MAX_SOURCE_BYTES', default=10 * 1024 * 1024, cast=int)
+# seconds before an origin that failed is tried again
+THUMBNAIL_RETRY_AFTER = config('THUMBNAIL_RETRY_AFTER', default=300,
+                               cast=int)
+# fetch image_links from private and loopback addresses too, for tests and
+# local development only
+THUMBNAIL_ALLOW_PRIVATE = config('THUMBNAIL_ALLOW_PRIVATE', default=False,
+                                 cast=bool)
+
+# Partition `shows` by month when migrating a PostgreSQL database, and how
+# many months ahead `flask shows partitions` keeps created
+SHOWS_PARTITIONED = config('SHOWS_PARTITIONED', default=False, cast=bool)
+SHOWS_PARTITION_MONTHS_AHEAD = config('SHOWS_PARTITION_MONTHS_AHEAD',
+                                      default=12, cast=int)
+# `flask shows archive` moves shows that ended this many days ago
+SHOWS_ARCHIVE_AFTER_DAYS = config('SHOWS_ARCHIVE_AFTER_DAYS', default=90,
+                                  cast=int)
+
+# Related artists stored per artist by `flask related rebuild / update`
+RELATED_ARTISTS_K = config('RELATED_ARTISTS_K', default=10, cast=int)
+
+# Matches stored per seeking venue and artist by `flask matches update`
+MATCHES_K = config('MATCHES_K', default=10, cast=int)
+# seconds each `flask matches update` re-reads before its start, longer
+# than a write transaction takes to commit, see matchmaking.py
+MATCHES_WATERMARK_MARGIN = config('MATCHES_WATERMARK_MARGIN', default=300,
+                                  cast=int)
+
+# /api/v1/venues/nearby: 'earthdistance' (postgres with the extension),
+# 'grid' (in-process index) or 'auto'
+GEO_BACKEND = config('GEO_BACKEND', default='auto')
+# Seconds before the in-process grid index is rebuilt from the database
+GEO_INDEX_TTL = config('GEO_INDEX_TTL', default=300, cast=int)
+# Default radius, in the requested unit, and the largest one, in miles
+GEO_DEFAULT_RADIUS = config('GEO_DEFAULT_RADIUS', default=25, cast=float)
+GEO_MAX_RADIUS_MILES = config('GEO_MAX_RADIUS_MILES', default=500,
+                              cast=float)
+
+# Default and largest page size of the JSON API
+API_PAGE_SIZE = config('API_PAGE_SIZE', default=50, cast=int)
+API_MAX_PAGE_SIZE = config('API_MAX_PAGE_SIZE', default=500, cast=int)
+# Most ids one DELETE /api/v1/venues or /api/v1/artists may name
+API_MAX_DELETE = config('API_MAX_DELETE', default=1000, cast=int)
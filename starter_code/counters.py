@@ -0,0 +1,178 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, event, func, inspect, select
+from models import Venue, Artist, Show, ShowCounterState, show_archive
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+# Venue and Artist carry upcoming_shows_count / past_shows_count so list
+# and search pages never count the shows table.  The counters are exact as
+# of ShowCounterState.rolled_at: a show is upcoming while its start_time is
+# after it.  `flask counters roll`, run from cron every minute or so, moves
+# the shows that have started since into the past counters.
+
+
+STATE_ID = 1
+
+venues = Venue.__table__
+artists = Artist.__table__
+shows = Show.__table__
+state = ShowCounterState.__table__
+
+
+def rolled_at(connection, for_update=False):
+    # shared lock for writers of shows, exclusive for roll / rebuild, so a
+    # show is never classified against a watermark that is moving
+    query = select(state.c.rolled_at).where(state.c.id == STATE_ID)
+    query = query.with_for_update(read=not for_update)
+    return connection.execute(query).scalar()
+
+
+def _set_rolled_at(connection, now):
+    updated = connection.execute(
+        state.update().where(state.c.id == STATE_ID).values(rolled_at=now)
+    ).rowcount
+    if not updated:
+        connection.execute(state.insert().values(id=STATE_ID, rolled_at=now))
+
+
+def _update_counts(connection, table, deltas):
+    # deltas: {id: (upcoming, past)}; updated_at is left alone, the counters
+    # are bookkeeping, not an edit
+    rows = [
+        {'_id': key, '_upcoming': upcoming, '_past': past}
+        for key, (upcoming, past) in deltas.items()
+        if key is not None and (upcoming or past)
+    ]
+    if rows:
+        connection.execute(
+            table.update().where(table.c.id == bindparam('_id')).values(
+                upcoming_shows_count=(
+                    table.c.upcoming_shows_count + bindparam('_upcoming')),
+                past_shows_count=table.c.past_shows_count + bindparam('_past'),
+                updated_at=table.c.updated_at
+            ),
+            rows
+        )
+
+
+def count_shows(connection, added=(), removed=()):
+    # adjusts the counters for (venue_id, artist_id, start_time) tuples
+    # that were inserted or deleted on this connection
+    if not added and not removed:
+        return
+    watermark = rolled_at(connection) or datetime.today()
+
+    deltas = {'venue': Counter(), 'artist': Counter()}
+    for sign, rows in ((1, added), (-1, removed)):
+        for venue_id, artist_id, start_time in rows:
+            column = 'upcoming' if start_time > watermark else 'past'
+            deltas['venue'][venue_id, column] += sign
+            deltas['artist'][artist_id, column] += sign
+
+    for table, kind in ((venues, 'venue'), (artists, 'artist')):
+        keys = {key for key, _ in deltas[kind]}
+        _update_counts(connection, table, {
+            key: (deltas[kind][key, 'upcoming'], deltas[kind][key, 'past'])
+            for key in keys
+        })
+
+
+def uncount_shows(connection, condition, source=shows):
+    # takes the rows of source (shows or shows_archive) matching condition
+    # out of the counters before they are deleted in bulk, one grouped
+    # query per side instead of a row each
+    watermark = rolled_at(connection) or datetime.today()
+    upcoming = func.sum(case((source.c.start_time > watermark, 1), else_=0))
+    for table, column in ((venues, source.c.venue_id),
+                          (artists, source.c.artist_id)):
+        rows = connection.execute(
+            select(column, upcoming, func.count()).where(condition).group_by(
+                column)
+        ).all()
+        _update_counts(connection, table, {
+            key: (-upcoming_count, upcoming_count - count)
+            for key, upcoming_count, count in rows
+        })
+
+
+def roll_forward(connection, now=None):
+    # moves the shows that started since the last roll into the past
+    # counters, returns how many there were
+    now = now or datetime.today()
+    watermark = rolled_at(connection, for_update=True)
+    if watermark is None:
+        rebuild(connection, now)
+        return 0
+    if now <= watermark:
+        return 0
+
+    started = (Show.start_time > watermark) & (Show.start_time <= now)
+    moved = connection.execute(
+        select(func.count()).select_from(Show).where(started)).scalar()
+    for table, column in ((venues, Show.venue_id), (artists, Show.artist_id)):
+        rows = connection.execute(
+            select(column, func.count()).where(started).group_by(column)
+        ).all()
+        _update_counts(connection, table, {
+            key: (-count, count) for key, count in rows
+        })
+
+    _set_rolled_at(connection, now)
+    return moved
+
+
+def rebuild(connection, now=None):
+    # recomputes every counter from the shows table and its archive
+    now = now or datetime.today()
+    rolled_at(connection, for_update=True)
+    for table, kind in ((venues, 'venue_id'), (artists, 'artist_id')):
+        def counted(source, condition):
+            return select(func.count()).where(
+                source.c[kind] == table.c.id, condition
+            ).scalar_subquery()
+
+        connection.execute(table.update().values(
+            upcoming_shows_count=counted(shows, shows.c.start_time > now),
+            past_shows_count=(
+                counted(shows, shows.c.start_time <= now) +
+                counted(show_archive, show_archive.c.start_time <= now)),
+            updated_at=table.c.updated_at
+        ))
+    _set_rolled_at(connection, now)
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+
+
+def _show_inserted(mapper, connection, target):
+    count_shows(connection, added=[
+        (target.venue_id, target.artist_id, target.start_time)])
+
+
+def _show_deleted(mapper, connection, target):
+    count_shows(connection, removed=[
+        (target.venue_id, target.artist_id, target.start_time)])
+
+
+def _show_updated(mapper, connection, target):
+    # a moved show is counted out of its old place and into the new one
+    attrs = inspect(target).attrs
+    old = tuple(
+        attrs[name].history.deleted[0] if attrs[name].history.deleted
+        else getattr(target, name)
+        for name in ('venue_id', 'artist_id', 'start_time')
+    )
+    new = (target.venue_id, target.artist_id, target.start_time)
+    if old != new:
+        count_shows(connection, added=[new], removed=[old])
+
+
+event.listen(Show, 'after_insert', _show_inserted)
+event.listen(Show, 'after_delete', _show_deleted)
+event.listen(Show, 'after_update', _show_updated)
@@ -0,0 +1,110 @@
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import object_session
+import areas
+import geo
+import matchmaking
+import related
+from counters import uncount_shows
+from models import Venue, Artist, Show, venue_genre, artist_genre, show_archive
+from page_cache import page_cache
+
+
+# ----------------------------------------------------------------------------#
+# Bulk deletes.
+# ----------------------------------------------------------------------------#
+# Venues and artists are deleted with one DELETE per table, whatever the
+# number of shows.  The foreign keys cascade on PostgreSQL too, so rows
+# deleted outside the app take their shows and genre links with them; here
+# the dependents are deleted explicitly first, which also covers SQLite,
+# where foreign keys are not enforced by default.  The counters, the area
+# summary, the matches and the related artists are adjusted set-based, the
+# caches are invalidated the way the mapper events do it.
+
+
+shows = Show.__table__
+
+# kind -> (model, genre link column, other side of the shows)
+KINDS = {
+    'venue': (Venue, venue_genre.c.venue_id, 'artist'),
+    'artist': (Artist, artist_genre.c.artist_id, 'venue'),
+}
+
+
+def _invalidate(session, keys):
+    # now, and again after commit like page_cache
+    session.info.setdefault('page_cache_keys', set()).update(keys)
+    for key in keys:
+        page_cache.invalidate(key)
+
+
+def delete_shows(session, connection, kind, ids):
+    # deletes the shows, archived ones included, of the given venues /
+    # artists; the keys of the pages they touched are invalidated
+    other_kind = KINDS[kind][2]
+    others = set()
+    for table in (shows, show_archive):
+        selected = table.c[f'{kind}_id'].in_(ids)
+        others.update(connection.execute(
+            select(table.c[f'{other_kind}_id']).where(selected).distinct()
+        ).scalars())
+        uncount_shows(connection, selected, table)
+        connection.execute(table.delete().where(selected))
+    # artists that shared a stage with the deleted shows' artists
+    if kind == 'venue':
+        related.queue(connection, artist_ids=others)
+    else:
+        related.queue(connection, venue_ids=others)
+    _invalidate(session, {(kind, i) for i in ids} | {
+        (other_kind, i) for i in others if i is not None})
+
+
+def delete_entities(session, kind, ids):
+    # deletes the venues / artists with the given ids and everything that
+    # refers to them, returns the ids that existed; the caller commits
+    model, link, _ = KINDS[kind]
+    table = model.__table__
+    connection = session.connection()
+    found = connection.execute(
+        select(table.c.id).where(table.c.id.in_(ids))).scalars().all()
+    if not found:
+        return []
+
+    delete_shows(session, connection, kind, found)
+    connection.execute(link.table.delete().where(link.in_(found)))
+    matchmaking.forget(connection, kind, found)
+    if model is Artist:
+        related.forget(connection, found)
+    if model is Venue:
+        areas.count_venues(connection, removed=connection.execute(
+            select(table.c.state, table.c.city).where(table.c.id.in_(found))
+        ).all())
+        geo.invalidate(found, session)
+    connection.execute(table.delete().where(table.c.id.in_(found)))
+
+    # instances loaded earlier in this session are gone now; their loaded
+    # state is read directly, an expired attribute would query for them
+    for key, instance in list(session.identity_map.items()):
+        if key[0] is model and key[1][0] in found or key[0] is Show and \
+                inspect(instance).dict.get(f'{kind}_id') in found:
+            session.expunge(instance)
+    return found
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+# Venue.shows / Artist.shows are passive_deletes: session.delete() of a
+# venue or artist deletes the shows already loaded one by one, then this
+# removes the rest in bulk before the row itself goes.
+
+
+def _deleting(mapper, connection, target):
+    kind = 'venue' if isinstance(target, Venue) else 'artist'
+    delete_shows(object_session(target), connection, kind, [target.id])
+    matchmaking.forget(connection, kind, [target.id])
+    if kind == 'artist':
+        related.forget(connection, [target.id])
+
+
+event.listen(Venue, 'before_delete', _deleting)
+event.listen(Artist, 'before_delete', _deleting)
@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from models import db, Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Export queries.
+# ----------------------------------------------------------------------------#
+
+
+# rows fetched per round trip from the server-side cursor
+BATCH_SIZE = 1000
+
+FORMATS = ('csv', 'ndjson')
+
+
+def venues_query():
+    return db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state, Venue.address,
+        Venue.phone, Venue.image_link, Venue.facebook_link, Venue.website,
+        Venue.seeking_talent, Venue.seeking_description, Venue.updated_at
+    )
+
+
+def artists_query():
+    return db.session.query(
+        Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+        Artist.image_link, Artist.facebook_link, Artist.website,
+        Artist.seeking_venue, Artist.seeking_description, Artist.updated_at
+    )
+
+
+def shows_query():
+    return db.session.query(
+        Show.id, Show.start_time, Show.end_time,
+        Show.venue_id, Venue.name.label('venue_name'),
+        Show.artist_id, Artist.name.label('artist_name'),
+        Show.updated_at
+    ).join(
+        Venue, Venue.id == Show.venue_id
+    ).join(
+        Artist, Artist.id == Show.artist_id
+    )
+
+
+EXPORTS = {
+    'venues': (Venue, venues_query),
+    'artists': (Artist, artists_query),
+    'shows': (Show, shows_query),
+}
+
+
+def export_query(kind, start=None, end=None, updated_since=None):
+    # start / end bound show start times, updated_since applies to all kinds
+    model, build = EXPORTS[kind]
+    query = build()
+
+    if model is Show:
+        if start is not None:
+            query = query.filter(Show.start_time >= start)
+        if end is not None:
+            query = query.filter(Show.start_time < end)
+    if updated_since is not None:
+        query = query.filter(model.updated_at >= updated_since)
+
+    # stream_results asks the driver for a server-side cursor so that
+    # memory stays flat, yield_per hands rows over a batch at a time
+    return query.order_by(model.id).execution_options(
+        stream_results=True).yield_per(BATCH_SIZE)
+
+
+# ----------------------------------------------------------------------------#
+# Writers.
+# ----------------------------------------------------------------------------#
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(query):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([column['name'] for column in query.column_descriptions])
+    for batch in _batches(query):
+        for row in batch:
+            writer.writerow([_value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # header only when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(query):
+    names = [column['name'] for column in query.column_descriptions]
+
+    for batch in _batches(query):
+        yield ''.join(
+            json.dumps(dict(zip(names, map(_value, row)))) + '\n'
+            for row in batch
+        )
+
+
+def iter_export(query, format):
+    if format == 'csv':
+        return iter_csv(query)
+    return iter_ndjson(query)
@@ -0,0 +1,95 @@
+import threading
+
+from sqlalchemy import event, select
+from models import db, Genre
+
+
+# ----------------------------------------------------------------------------#
+# Genre name cache.
+# ----------------------------------------------------------------------------#
+
+
+# genre name -> id for every genre known to be committed
+_ids_by_name = {}
+_lock = threading.Lock()
+
+
+def invalidate_genre_cache(*args):
+    with _lock:
+        _ids_by_name.clear()
+
+
+event.listen(Genre, 'after_update', invalidate_genre_cache)
+event.listen(Genre, 'after_delete', invalidate_genre_cache)
+
+
+def _insert_missing(connection, names):
+    # one INSERT ... ON CONFLICT DO NOTHING against uq_genres_name
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        connection.execute(
+            Genre.__table__.insert(), [{'name': name} for name in names])
+        return
+
+    connection.execute(
+        insert(Genre.__table__).on_conflict_do_nothing(
+            index_elements=['name']),
+        [{'name': name} for name in names]
+    )
+
+
+def genre_ids(names):
+    # resolve genre names to ids, creating the missing ones
+    names = list(dict.fromkeys(names))
+
+    with _lock:
+        loaded = bool(_ids_by_name)
+    if not loaded:
+        # not under the lock: the query autoflushes, and a flushed genre
+        # invalidates the cache
+        rows = db.session.query(Genre.name, Genre.id).all()
+        with _lock:
+            _ids_by_name.update(rows)
+
+    with _lock:
+        known = {
+            name: _ids_by_name[name]
+            for name in names if name in _ids_by_name
+        }
+
+    missing = [name for name in names if name not in known]
+    if missing:
+        # genres are shared reference data: commit them on their own so
+        # the cache never holds ids of a rolled back insert
+        with db.engine.begin() as connection:
+            _insert_missing(connection, missing)
+            rows = connection.execute(
+                select(Genre.name, Genre.id).where(Genre.name.in_(missing))
+            ).all()
+        known.update(rows)
+        with _lock:
+            _ids_by_name.update(rows)
+
+    return [known[name] for name in names]
+
+
+def resolve_genres(names):
+    # Genre objects for the given names, in a constant number of queries
+    for attempt in range(2):
+        ids = genre_ids(names)
+        if not ids:
+            return []
+        genres = {
+            genre.id: genre
+            for genre in Genre.query.filter(Genre.id.in_(ids)).all()
+        }
+        if all(genre_id in genres for genre_id in ids):
+            return [genres[genre_id] for genre_id in ids]
+        # a genre deleted by another process is still cached here: reload
+        # the names and create the missing genres again
+        invalidate_genre_cache()
+    raise LookupError(f'Genres changed while resolving {names!r}')
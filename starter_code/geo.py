@@ -0,0 +1,465 @@
+import csv
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import bindparam, event, func, inspect, select, text
+from sqlalchemy.orm import Session, object_session
+from models import db, Venue
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+# Venues carry the latitude / longitude of their city, filled offline by
+# `flask geo geocode` from a local gazetteer file; a venue whose city or
+# state changes loses its coordinates until the next run.  Distances are in
+# meters here, the api converts.
+
+
+EARTH_RADIUS = 6371008.8
+
+UNITS = {'mi': 1609.344, 'km': 1000.0}
+
+venues = Venue.__table__
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_box(lat, lon, meters):
+    # (south, west, north, east) around the circle; west > east when it
+    # crosses the antimeridian
+    delta = math.degrees(meters / EARTH_RADIUS)
+    south, north = max(-90.0, lat - delta), min(90.0, lat + delta)
+    if south == -90.0 or north == 90.0:
+        return south, -180.0, north, 180.0
+    spread = math.degrees(
+        math.asin(min(1.0, math.sin(meters / EARTH_RADIUS) /
+                      math.cos(math.radians(lat)))))
+    if spread >= 180.0:
+        return south, -180.0, north, 180.0
+    west = (lon - spread + 180.0) % 360.0 - 180.0
+    east = (lon + spread + 180.0) % 360.0 - 180.0
+    return south, west, north, east
+
+
+def split_box(south, west, north, east):
+    # one or two boxes that do not cross the antimeridian
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def box_center(south, west, north, east):
+    if west > east:
+        east += 360.0
+    return (south + north) / 2, ((west + east) / 2 + 180.0) % 360.0 - 180.0
+
+
+# ----------------------------------------------------------------------------#
+# In-process grid index.
+# ----------------------------------------------------------------------------#
+
+
+class GridIndex(object):
+    # venues bucketed by cells of `cell` degrees; a search only looks at
+    # the cells its box covers
+
+    def __init__(self, cell=0.5):
+        self.cell = cell
+        self.points = {}
+        self.cells = defaultdict(dict)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _key(self, lat, lon):
+        return int(math.floor(lat / self.cell)), \
+            int(math.floor(lon / self.cell))
+
+    def add(self, venue_id, lat, lon):
+        self.remove(venue_id)
+        if lat is None or lon is None:
+            return
+        self.points[venue_id] = (lat, lon)
+        self.cells[self._key(lat, lon)][venue_id] = (lat, lon)
+
+    def remove(self, venue_id):
+        point = self.points.pop(venue_id, None)
+        if point is None:
+            return
+        key = self._key(*point)
+        self.cells[key].pop(venue_id, None)
+        if not self.cells[key]:
+            del self.cells[key]
+
+    def within(self, south, west, north, east):
+        # (id, lat, lon) of the venues inside the box
+        for box in split_box(south, west, north, east):
+            low_row, low_col = self._key(box[0], box[1])
+            high_row, high_col = self._key(box[2], box[3])
+            for row in range(low_row, high_row + 1):
+                for col in range(low_col, high_col + 1):
+                    for venue_id, (lat, lon) in self.cells.get(
+                            (row, col), {}).items():
+                        if box[0] <= lat <= box[2] and \
+                                box[1] <= lon <= box[3]:
+                            yield venue_id, lat, lon
+
+    def nearest(self, lat, lon, meters, limit):
+        # [(id, distance)] within meters of the point, nearest first
+        found = (
+            (venue_id, haversine(lat, lon, venue_lat, venue_lon))
+            for venue_id, venue_lat, venue_lon in self.within(
+                *radius_box(lat, lon, meters))
+        )
+        return heapq.nsmallest(
+            limit, (item for item in found if item[1] <= meters),
+            key=lambda item: (item[1], item[0]))
+
+    def in_box(self, box, lat, lon, limit):
+        # [(id, distance from the point)] inside the box, nearest first
+        return heapq.nsmallest(limit, (
+            (venue_id, haversine(lat, lon, venue_lat, venue_lon))
+            for venue_id, venue_lat, venue_lon in self.within(*box)
+        ), key=lambda item: (item[1], item[0]))
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+
+class GeoBackend(object):
+    # returns [(venue id, meters)], nearest first
+
+    def nearest(self, lat, lon, meters, limit):
+        raise NotImplementedError
+
+    def in_box(self, box, lat, lon, limit):
+        raise NotImplementedError
+
+
+class EarthdistanceGeoBackend(GeoBackend):
+    # cube / earthdistance, backed by the gist index on
+    # ll_to_earth(latitude, longitude) of the venue coordinates migration
+
+    location = func.ll_to_earth(Venue.latitude, Venue.longitude)
+
+    def _query(self, lat, lon, center, meters, conditions, limit):
+        distance = func.earth_distance(
+            func.ll_to_earth(lat, lon), self.location)
+        query = select(Venue.id, distance).where(
+            Venue.latitude.isnot(None), Venue.longitude.isnot(None),
+            func.earth_box(func.ll_to_earth(*center), meters)
+            .op('@>')(self.location),
+            *conditions
+        ).order_by(distance, Venue.id).limit(limit)
+        return [tuple(row) for row in db.session.execute(query)]
+
+    def nearest(self, lat, lon, meters, limit):
+        # earth_box is a cube around the sphere, the distance trims it
+        distance = func.earth_distance(
+            func.ll_to_earth(lat, lon), self.location)
+        return self._query(
+            lat, lon, (lat, lon), meters, [distance <= meters], limit)
+
+    def in_box(self, box, lat, lon, limit):
+        # the circle around the box narrows down on the index, the
+        # coordinates trim it
+        south, west, north, east = box
+        center = box_center(*box)
+        meters = max(haversine(*center, corner_lat, corner_lon)
+                     for corner_lat in (south, north)
+                     for corner_lon in (west, east))
+        longitude = Venue.longitude.between(west, east) if west <= east \
+            else (Venue.longitude >= west) | (Venue.longitude <= east)
+        return self._query(lat, lon, center, meters, [
+            Venue.latitude.between(south, north), longitude], limit)
+
+
+class GridGeoBackend(GeoBackend):
+    # keeps a GridIndex built lazily from the database and refreshed from
+    # the venues touched by writes in this process.  Loads run outside the
+    # lock, they autoflush and a flushed venue invalidates here; searches
+    # meanwhile use the previous grid
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.index = None
+        self.built_at = None
+        self.building = False
+        self.pending = set()
+        # bumped by full invalidations, a build that raced one is not kept
+        self.generation = 0
+
+    def invalidate(self, venue_id=None):
+        with self.lock:
+            if venue_id is None:
+                self.index = None
+                self.generation += 1
+            else:
+                self.pending.add(venue_id)
+
+    def _load(self, ids=None):
+        query = select(Venue.id, Venue.latitude, Venue.longitude)
+        if ids is not None:
+            query = query.where(Venue.id.in_(ids))
+        return db.session.execute(query).all()
+
+    def _build(self):
+        index = GridIndex()
+        for row in self._load():
+            index.add(*row)
+        return index
+
+    def _index(self):
+        with self.lock:
+            index = self.index
+            expired = (
+                index is not None and self.ttl and
+                time.monotonic() - self.built_at > self.ttl
+            )
+            rebuild = (index is None or expired) and not self.building
+            ids = None
+            if rebuild:
+                # writes from here on are applied to the new grid later
+                self.building = True
+                self.pending.clear()
+                generation = self.generation
+            elif index is not None and self.pending:
+                ids, self.pending = self.pending, set()
+
+        if rebuild:
+            try:
+                index = self._build()
+            finally:
+                with self.lock:
+                    self.building = False
+            with self.lock:
+                if self.generation == generation:
+                    self.index = index
+                    self.built_at = time.monotonic()
+        elif index is None:
+            # the first build of another request is still running
+            index = self._build()
+        elif ids:
+            rows = self._load(ids)
+            with self.lock:
+                for venue_id in ids:
+                    index.remove(venue_id)
+                for row in rows:
+                    index.add(*row)
+        return index
+
+    def nearest(self, lat, lon, meters, limit):
+        index = self._index()
+        with self.lock:
+            return index.nearest(lat, lon, meters, limit)
+
+    def in_box(self, box, lat, lon, limit):
+        index = self._index()
+        with self.lock:
+            return index.in_box(box, lat, lon, limit)
+
+
+# ----------------------------------------------------------------------------#
+# Interface.
+# ----------------------------------------------------------------------------#
+
+
+_earthdistance_backend = EarthdistanceGeoBackend()
+_grid_backend = None
+_has_earthdistance = None
+
+
+def has_earthdistance():
+    # checked once per process
+    global _has_earthdistance
+    if _has_earthdistance is None:
+        _has_earthdistance = db.engine.dialect.name == 'postgresql' and \
+            bool(db.session.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM pg_extension "
+                "WHERE extname = 'earthdistance')")).scalar())
+    return _has_earthdistance
+
+
+def get_backend():
+    # GEO_BACKEND is 'earthdistance', 'grid' or 'auto' (earthdistance when
+    # the extension is installed)
+    global _grid_backend
+
+    choice = current_app.config.get('GEO_BACKEND', 'auto')
+    if choice == 'auto':
+        choice = 'earthdistance' if has_earthdistance() else 'grid'
+
+    if choice == 'earthdistance':
+        return _earthdistance_backend
+
+    if _grid_backend is None:
+        _grid_backend = GridGeoBackend(
+            ttl=current_app.config.get('GEO_INDEX_TTL', 300))
+    return _grid_backend
+
+
+def venues_near(lat, lon, meters, limit):
+    return get_backend().nearest(lat, lon, meters, limit)
+
+
+def venues_in_box(box, lat, lon, limit):
+    return get_backend().in_box(box, lat, lon, limit)
+
+
+# ----------------------------------------------------------------------------#
+# Geocoding.
+# ----------------------------------------------------------------------------#
+# Two gazetteer layouts are read, both tab separated:
+#   GeoNames exports (US.txt, cities1000.txt), the populated places only,
+#     admin1 code as the state
+#   US Census Gazetteer place files, with their USPS / NAME / INTPTLAT /
+#     INTPTLONG header; the trailing "city", "town", ... is dropped
+
+
+CENSUS_SUFFIX = re.compile(
+    r'\s+(city|town|village|borough|cdp|municipality|'
+    r'city and borough|consolidated government.*|'
+    r'unified government.*|metro government.*|\(balance\))$')
+
+
+def place(state, city):
+    return (state or '').strip().upper(), \
+        re.sub(r'\s+', ' ', (city or '').strip().lower())
+
+
+def _census_name(name):
+    name = name.strip().lower()
+    while True:
+        stripped = CENSUS_SUFFIX.sub('', name)
+        if stripped == name:
+            return name
+        name = stripped
+
+
+def load_gazetteer(path):
+    # (state, city) -> (lat, lon); the most populous of places sharing a
+    # name in a state wins, for GeoNames
+    places, population = {}, {}
+    with open(path, newline='', encoding='utf-8') as handle:
+        rows = csv.reader(handle, delimiter='\t', quoting=csv.QUOTE_NONE)
+        first = next(rows, None)
+        if first is None:
+            return places
+        header = [column.strip().upper() for column in first]
+        if 'USPS' in header and 'NAME' in header:
+            columns = [header.index(name) for name in
+                       ('USPS', 'NAME', 'INTPTLAT', 'INTPTLONG')]
+            for row in rows:
+                state, name, lat, lon = (row[i] for i in columns)
+                places[place(state, _census_name(name))] = (
+                    float(lat), float(lon))
+            return places
+
+        for row in [first] + list(rows):
+            if len(row) < 15 or row[6] != 'P':
+                continue
+            count = int(row[14] or 0)
+            for name in {row[1], row[2]}:
+                key = place(row[10], name)
+                if count >= population.get(key, -1):
+                    places[key] = (float(row[4]), float(row[5]))
+                    population[key] = count
+    return places
+
+
+def geocode_venues(connection, gazetteer, overwrite=False, batch_size=1000):
+    # fills the coordinates of the venues whose city is in the gazetteer,
+    # only the ones without coordinates unless overwrite; returns
+    # (geocoded, not found)
+    query = select(venues.c.id, venues.c.state, venues.c.city)
+    if not overwrite:
+        query = query.where(venues.c.latitude.is_(None))
+    found, missing = [], 0
+    for venue_id, state, city in connection.execute(query):
+        point = gazetteer.get(place(state, city))
+        if point is None:
+            missing += 1
+        else:
+            found.append({'_id': venue_id, 'lat': point[0], 'lon': point[1]})
+
+    statement = venues.update().where(
+        venues.c.id == bindparam('_id')
+    ).values(latitude=bindparam('lat'), longitude=bindparam('lon'))
+    for start in range(0, len(found), batch_size):
+        connection.execute(statement, found[start:start + batch_size])
+    return len(found), missing
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+
+
+def _previous(attribute, current):
+    deleted = attribute.history.deleted
+    return deleted[0] if deleted else current
+
+
+def _moved(mapper, connection, target):
+    # coordinates of the old city are wrong for the new one; the edit form
+    # sets city and state every time, only a different place counts
+    attrs = inspect(target).attrs
+    if attrs.latitude.history.has_changes() or \
+            attrs.longitude.history.has_changes():
+        return
+    before = place(_previous(attrs.state, target.state),
+                   _previous(attrs.city, target.city))
+    if before != place(target.state, target.city):
+        target.latitude = target.longitude = None
+
+
+def _invalidate(venue_ids):
+    if _grid_backend is None:
+        return
+    if venue_ids is None:
+        _grid_backend.invalidate()
+    for venue_id in venue_ids or ():
+        _grid_backend.invalidate(venue_id)
+
+
+def invalidate(venue_ids=None, session=None):
+    # drops the venues from this process's grid, all of them when None, for
+    # writes the mapper events do not see (bulk deletes, `flask geo
+    # geocode`); with a session, again once it commits or rolls back, as a
+    # query in between may load the rows as they were
+    if session is not None:
+        session.info.setdefault('geo_venue_ids', set()).update(
+            venue_ids if venue_ids is not None else [None])
+    _invalidate(venue_ids)
+
+
+def _mark_changed(mapper, connection, target):
+    invalidate([target.id], object_session(target))
+
+
+def _invalidate_finished(session):
+    venue_ids = session.info.pop('geo_venue_ids', None)
+    if venue_ids:
+        _invalidate(None if None in venue_ids else venue_ids)
+
+
+event.listen(Venue, 'before_update', _moved)
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Venue, _event, _mark_changed)
+
+event.listen(Session, 'after_commit', _invalidate_finished)
+event.listen(Session, 'after_rollback', _invalidate_finished)
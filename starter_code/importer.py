@@ -0,0 +1,374 @@
+import csv
+import json
+import os
+
+from sqlalchemy import select, text
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from areas import count_venues
+from bookings import reject_overlaps
+from counters import count_shows
+from related import queue as queue_related
+from genres import genre_ids
+from models import db, Venue, Artist, Show, venue_genre, artist_genre
+from models import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+
+
+# ----------------------------------------------------------------------------#
+# Readers.
+# ----------------------------------------------------------------------------#
+
+
+KINDS = ('genres', 'venues', 'artists', 'shows')
+
+
+def read_rows(path):
+    # yields dicts from .csv, .json (an array) or .ndjson / .jsonl files;
+    # in csv files genres are separated by ';'
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('genres'):
+                    row['genres'] = [
+                        genre.strip() for genre in row['genres'].split(';')
+                        if genre.strip()
+                    ]
+                yield row
+    elif extension in ('.ndjson', '.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif extension == '.json':
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+    else:
+        raise ValueError(f'Unsupported file type: {extension}')
+
+
+def has_ids(path):
+    # whether the first row of the file carries an id
+    rows = read_rows(path)
+    try:
+        first = next(rows, {})
+    finally:
+        rows.close()
+    return first.get('id') not in (None, '')
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ----------------------------------------------------------------------------#
+# Validation.
+# ----------------------------------------------------------------------------#
+
+
+FORMS = {
+    'venues': VenueForm,
+    'artists': ArtistForm,
+    'shows': ShowForm,
+}
+
+
+# checkboxes, which a browser leaves out of the post when unticked
+CHECKBOXES = ('seeking_venue', 'seeking_talent')
+
+
+def formdata(row):
+    # the same shape a browser would post for the form
+    data = MultiDict()
+    for key, value in row.items():
+        if value is None or value is False:
+            continue
+        if value is True:
+            value = 'y'
+        if key in CHECKBOXES and isinstance(value, str) and \
+                value.lower() in ('false', 'no', '0'):
+            continue
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                data.add(key, str(item))
+        else:
+            data.add(key, str(value))
+    return data
+
+
+def validate(kind, row):
+    # returns (values, errors) using the web form's rules
+    if kind == 'genres':
+        name = (row.get('name') or '').strip()
+        if not name:
+            return None, {'name': ['This field is required.']}
+        return {'name': name}, None
+
+    form = FORMS[kind](formdata=formdata(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+
+    values = {}
+    if row.get('id') not in (None, ''):
+        try:
+            values['id'] = int(row['id'])
+        except (TypeError, ValueError):
+            return None, {'id': ['Not a valid integer.']}
+
+    if kind == 'shows':
+        try:
+            values['venue_id'] = int(form.venue_id.data)
+            values['artist_id'] = int(form.artist_id.data)
+        except (TypeError, ValueError):
+            return None, {'venue_id / artist_id': ['Not a valid integer.']}
+        values['start_time'] = form.start_time.data
+        values['end_time'] = (
+            form.end_time.data or values['start_time'] + DEFAULT_SHOW_DURATION)
+        if values['end_time'] <= values['start_time']:
+            return None, {'end_time': ['Must be after start_time.']}
+        if values['end_time'] - values['start_time'] > MAX_SHOW_DURATION:
+            return None, {'end_time': [
+                f'Must be at most {MAX_SHOW_DURATION} after start_time.']}
+        return values, None
+
+    for field in ('name', 'city', 'state', 'phone', 'image_link',
+                  'facebook_link', 'seeking_description'):
+        values[field] = form[field].data
+    values['website'] = form.website_link.data
+    values['genres'] = form.genres.data
+    if kind == 'venues':
+        values['address'] = form.address.data
+        values['seeking_talent'] = bool(form.seeking_talent.data)
+    else:
+        values['seeking_venue'] = bool(form.seeking_venue.data)
+    return values, None
+
+
+# ----------------------------------------------------------------------------#
+# Loading.
+# ----------------------------------------------------------------------------#
+
+
+TABLES = {
+    'venues': (Venue.__table__, venue_genre, venue_genre.c.venue_id),
+    'artists': (Artist.__table__, artist_genre, artist_genre.c.artist_id),
+    'shows': (Show.__table__, None, None),
+}
+
+
+def allocate_ids(connection, table, count):
+    # reserve primary keys up front so genre links can be inserted in the
+    # same executemany batch as their parents
+    if connection.dialect.name == 'postgresql':
+        return list(connection.execute(
+            text(
+                'SELECT nextval(pg_get_serial_sequence(:table, \'id\')) '
+                'FROM generate_series(1, :count)'
+            ),
+            {'table': table.name, 'count': count}
+        ).scalars())
+
+    start = connection.execute(
+        select(db.func.coalesce(db.func.max(table.c.id), 0))
+    ).scalar()
+    return list(range(start + 1, start + count + 1))
+
+
+def reset_sequence(connection, table):
+    # explicit ids from the file leave a postgres sequence behind
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT coalesce(max(id), 1) FROM {table.name}))"
+        ))
+
+
+def check_shows(connection, rows):
+    # unknown venues / artists first, then double bookings among the rest
+    missing = check_references(connection, rows)
+    missing_ids = {id(row) for row, _ in missing}
+    return missing + reject_overlaps(
+        connection, [row for row in rows if id(row) not in missing_ids])
+
+
+def check_references(connection, rows):
+    # rows whose venue or artist does not exist, in two queries per batch
+    venue_ids = {row['venue_id'] for row in rows}
+    artist_ids = {row['artist_id'] for row in rows}
+    known_venues = set(connection.execute(
+        select(Venue.id).where(Venue.id.in_(venue_ids))).scalars())
+    known_artists = set(connection.execute(
+        select(Artist.id).where(Artist.id.in_(artist_ids))).scalars())
+
+    missing = []
+    for row in rows:
+        if row['venue_id'] not in known_venues:
+            missing.append((row, 'unknown venue_id'))
+        elif row['artist_id'] not in known_artists:
+            missing.append((row, 'unknown artist_id'))
+    return missing
+
+
+def load_batch(kind, rows, dry_run=False):
+    # writes one validated batch in a single transaction,
+    # returns the rows rejected by reference checks
+    if kind == 'genres':
+        if not dry_run:
+            genre_ids([row['name'] for row in rows])
+        return []
+
+    table, association, key = TABLES[kind]
+    # ids allocated for one batch could collide with explicit ids further
+    # down the file, so a file has them on every row or on none
+    explicit_ids = bool(rows) and 'id' in rows[0]
+    if any(('id' in row) != explicit_ids for row in rows):
+        raise ValueError('Rows with and without ids in one batch')
+
+    if dry_run:
+        if kind == 'shows':
+            with db.engine.connect() as connection:
+                return check_shows(connection, rows)
+        return []
+
+    # genres are resolved before the batch transaction, see genres.py
+    if association is not None:
+        names = list(dict.fromkeys(
+            name for row in rows for name in row['genres']))
+        ids_by_name = dict(zip(names, genre_ids(names))) if names else {}
+
+    with db.engine.begin() as connection:
+        rejected = []
+        if kind == 'shows':
+            rejected = check_shows(connection, rows)
+            rejected_ids = {id(row) for row, _ in rejected}
+            rows = [row for row in rows if id(row) not in rejected_ids]
+
+        if rows and not explicit_ids and association is not None:
+            for row, new_id in zip(
+                    rows, allocate_ids(connection, table, len(rows))):
+                row['id'] = new_id
+
+        records = [
+            {column: value for column, value in row.items()
+             if column != 'genres'}
+            for row in rows
+        ]
+        if records:
+            connection.execute(table.insert(), records)
+        # core inserts skip the mapper events that keep these in sync
+        if kind == 'shows':
+            count_shows(connection, added=[
+                (row['venue_id'], row['artist_id'], row['start_time'])
+                for row in records
+            ])
+            queue_related(connection, venue_ids=[
+                row['venue_id'] for row in records])
+        elif kind == 'venues':
+            count_venues(connection, added=[
+                (row['state'], row['city']) for row in records])
+
+        if association is not None:
+            links = [
+                {key.name: row['id'], 'genre_id': ids_by_name[name]}
+                for row in rows for name in dict.fromkeys(row['genres'])
+            ]
+            if links:
+                connection.execute(association.insert(), links)
+            if kind == 'artists':
+                queue_related(connection, [row['id'] for row in rows])
+
+        if explicit_ids:
+            reset_sequence(connection, table)
+
+    return rejected
+
+
+# ----------------------------------------------------------------------------#
+# Checkpoints.
+# ----------------------------------------------------------------------------#
+
+
+def read_checkpoint(path):
+    # number of input rows already handled by a previous run
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f).get('rows', 0)
+
+
+def write_checkpoint(path, rows):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'rows': rows}, f)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------------#
+# Import.
+# ----------------------------------------------------------------------------#
+
+
+class ImportReport(object):
+
+    def __init__(self, skipped=0):
+        self.skipped = skipped
+        self.read = 0
+        self.imported = 0
+        self.errors = []
+
+    @property
+    def invalid(self):
+        return len(self.errors)
+
+
+def import_file(kind, path, batch_size=5000, dry_run=False,
+                checkpoint=None, progress=None):
+    # validates and loads every row of path; with a checkpoint file the
+    # rows of batches already committed are skipped on the next run
+    done = 0 if dry_run else read_checkpoint(checkpoint)
+    report = ImportReport(skipped=done)
+    with_ids = kind != 'genres' and has_ids(path)
+
+    rows = enumerate(read_rows(path), start=1)
+    for batch in batches(rows, batch_size):
+        last_line = batch[-1][0]
+        if last_line <= done:
+            continue
+
+        valid = []
+        for line, row in batch:
+            if line <= done:
+                continue
+            report.read += 1
+            values, errors = validate(kind, row)
+            if not errors and ('id' in values) != with_ids:
+                errors = {'id': [
+                    'Give an id on every row or on none, as on line 1.']}
+            if errors:
+                report.errors.append((line, errors))
+            else:
+                values['_line'] = line
+                valid.append(values)
+
+        lines = {id(row): row.pop('_line') for row in valid}
+        rejected = load_batch(kind, valid, dry_run=dry_run)
+        for row, message in rejected:
+            report.errors.append((lines[id(row)], {'row': [message]}))
+        report.imported += len(valid) - len(rejected)
+
+        if checkpoint and not dry_run:
+            write_checkpoint(checkpoint, last_line)
+        if progress:
+            progress(report)
+
+    if checkpoint and not dry_run and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return report
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+
+from flask import abort, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# ----------------------------------------------------------------------------#
+# Statement fingerprints.
+# ----------------------------------------------------------------------------#
+
+
+_PARAMS = re.compile(r"%\(\w+\)s|\?|:\w+|\$\d+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    # the shape of a statement: parameters, literals and IN lists collapsed
+    shape = _PARAMS.sub('?', statement)
+    shape = _LITERALS.sub('?', shape)
+    shape = _IN_LISTS.sub('(?)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+# ----------------------------------------------------------------------------#
+# Per-request statistics.
+# ----------------------------------------------------------------------------#
+
+
+class QueryStats(object):
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        return [
+            (shape, count) for shape, count in self.shapes.most_common()
+            if count > threshold
+        ]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if has_request_context() and 'sql_stats' in g:
+        conn.info.setdefault('query_start', []).append(
+            (id(context), time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if has_request_context() and 'sql_stats' in g:
+        starts = conn.info.get('query_start')
+        if starts:
+            g.sql_stats.record(
+                statement, time.perf_counter() - starts.pop()[1])
+
+
+def _handle_error(context):
+    # after_cursor_execute does not run for a failed statement, its start
+    # would be left on the pooled connection and paired with a later one
+    if context.connection is None:
+        return
+    starts = context.connection.info.get('query_start')
+    if starts and starts[-1][0] == id(context.execution_context):
+        starts.pop()
+
+
+class SQLInstrumentation(object):
+    # counts queries and database time per request, reports them in a
+    # Server-Timing header and at /_debug/sql, and warns when a route runs
+    # the same statement shape more than SQL_REPEAT_THRESHOLD times
+
+    def __init__(self, app=None, history=100):
+        self.history = deque(maxlen=history)
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_INSTRUMENTATION', True)
+        app.config.setdefault('SQL_REPEAT_THRESHOLD', 10)
+        app.config.setdefault('SQL_DEBUG_ENDPOINT', app.debug)
+
+        if not app.config['SQL_INSTRUMENTATION']:
+            return
+
+        if not event.contains(
+                Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(
+                Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(
+                Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.add_url_rule('/_debug/sql', 'debug_sql', self.debug_view)
+
+    def start(self):
+        g.sql_stats = QueryStats()
+
+    def finish(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'
+        )
+
+        threshold = current_app.config['SQL_REPEAT_THRESHOLD']
+        repeated = stats.repeated(threshold)
+        for shape, count in repeated:
+            current_app.logger.warning(
+                'Possible N+1: %s %s ran %d times: %s',
+                request.method, request.path, count, shape)
+
+        with self.lock:
+            self.history.append({
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_ms': round(stats.duration * 1000, 2),
+                'repeated': [
+                    {'statement': shape, 'count': count}
+                    for shape, count in repeated
+                ]
+            })
+        return response
+
+    def debug_view(self):
+        if not current_app.config['SQL_DEBUG_ENDPOINT']:
+            abort(404)
+        with self.lock:
+            requests = list(reversed(self.history))
+        return jsonify(requests=requests)
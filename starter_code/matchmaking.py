@@ -0,0 +1,285 @@
+import heapq
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, inspect, select, text, union_all
+from models import db, Venue, Artist, Show, VenueMatch, ArtistMatch
+from models import MatchState, venue_genre, artist_genre, show_archive
+
+
+# ----------------------------------------------------------------------------#
+# Matchmaking.
+# ----------------------------------------------------------------------------#
+# Pairs venues seeking talent with artists seeking venues in the same city.
+# A pair is scored on the genres the two share and, as a bonus, on the
+# shows the artist already played at the venue.  Candidates come from an
+# inverted index (state, city, genre) -> seeking ids of each side, so a
+# venue is only ever scored against the artists of its own city that share
+# a genre with it, never against every artist.
+#
+# `flask matches update`, run from cron, re-scores the venues and artists
+# whose row, genres or shows changed since the previous run, as told by
+# their updated_at, and everyone on the other side whose matches can move
+# with them.  The k best matches of each side are stored in venue_matches
+# and artist_matches; pages read them with one primary key range scan.
+# A deleted show lowers the bonus at the next change of either side or at
+# the next `--full` run.
+#
+# updated_at is stamped when a write flushes, not when it commits, so a
+# transaction still open during a run can commit rows older than the run.
+# Each run therefore re-reads from a watermark before its own start and
+# before the oldest open writing transaction (on postgres), less
+# MATCHES_WATERMARK_MARGIN seconds for slower commits and clock skew;
+# re-scoring a row twice changes nothing.
+
+
+GENRE_WEIGHT = 1.0
+# bonus for an artist that played the venue before, all of it from
+# REBOOKINGS shows on
+HISTORY_WEIGHT = 0.5
+REBOOKINGS = 3
+
+STATE_ID = 1
+# matched_at of the row the migration seeds, before any run
+NEVER = datetime(1970, 1, 1)
+
+shows = Show.__table__
+state = MatchState.__table__
+
+# kind -> (model, seeking column, genre link column, matches table, other
+# side)
+KINDS = {
+    'venue': (Venue, 'seeking_talent', venue_genre.c.venue_id,
+              VenueMatch.__table__, 'artist'),
+    'artist': (Artist, 'seeking_venue', artist_genre.c.artist_id,
+               ArtistMatch.__table__, 'venue'),
+}
+
+
+def place(state_name, city):
+    # city and state are free text
+    return (state_name or '').strip().upper(), (city or '').strip().lower()
+
+
+def _chunks(ids, size=1000):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+class Seekers(object):
+    # the seeking venues or artists: their place, their genres and the
+    # inverted index (state, city, genre) -> ids
+
+    def __init__(self, connection, kind):
+        model, seeking, link, _, _ = KINDS[kind]
+        table = model.__table__
+        wanted = table.c[seeking].is_(True)
+        self.places = {
+            entity_id: place(state_name, city)
+            for entity_id, state_name, city in connection.execute(
+                select(table.c.id, table.c.state, table.c.city).where(wanted))
+        }
+        self.genres = defaultdict(set)
+        self.index = defaultdict(list)
+        for entity_id, genre_id in connection.execute(
+                select(link, link.table.c.genre_id).join(
+                    table, table.c.id == link).where(wanted)):
+            self.genres[entity_id].add(genre_id)
+            self.index[self.places[entity_id] + (genre_id,)].append(
+                entity_id)
+
+    def candidates(self, at, genres):
+        # id -> number of shared genres, of the seekers at the place
+        shared = defaultdict(int)
+        for genre_id in genres:
+            for entity_id in self.index.get(at + (genre_id,), ()):
+                shared[entity_id] += 1
+        return shared
+
+
+def score(shared, own, other, together):
+    # cosine of the two genre sets, plus the rebooking bonus
+    return (GENRE_WEIGHT * shared / math.sqrt(own * other) +
+            HISTORY_WEIGHT * min(together, REBOOKINGS) / REBOOKINGS)
+
+
+def _history(connection, kind, ids):
+    # (venue id, artist id) -> shows together, archived ones included, for
+    # the given venues / artists
+    played = union_all(*[
+        select(table.c.venue_id, table.c.artist_id).where(
+            table.c[f'{kind}_id'].in_(ids))
+        for table in (shows, show_archive)
+    ]).subquery()
+    return {
+        (venue_id, artist_id): count
+        for venue_id, artist_id, count in connection.execute(
+            select(played.c.venue_id, played.c.artist_id, func.count())
+            .group_by(played.c.venue_id, played.c.artist_id))
+    }
+
+
+def _top_k(kind, entity_id, seekers, history, k):
+    # [(other id, score)] best first; empty when the entity is not seeking
+    own, others = seekers[kind], seekers[KINDS[kind][4]]
+    genres = own.genres.get(entity_id)
+    if not genres:
+        return []
+    scored = []
+    for other_id, shared in others.candidates(
+            own.places[entity_id], genres).items():
+        pair = (entity_id, other_id) if kind == 'venue' else \
+            (other_id, entity_id)
+        scored.append((other_id, score(
+            shared, len(genres), len(others.genres[other_id]),
+            history.get(pair, 0))))
+    return heapq.nlargest(k, scored, key=lambda item: (item[1], -item[0]))
+
+
+def _store(connection, kind, ids, seekers, k):
+    # replaces the stored matches of the given venues / artists
+    table, other = KINDS[kind][3], KINDS[kind][4]
+    for batch in _chunks(ids):
+        history = _history(connection, kind, batch)
+        connection.execute(
+            table.delete().where(table.c[f'{kind}_id'].in_(batch)))
+        rows = [
+            {f'{kind}_id': entity_id, 'rank': rank,
+             f'{other}_id': other_id, 'score': round(value, 6)}
+            for entity_id in batch
+            for rank, (other_id, value) in enumerate(
+                _top_k(kind, entity_id, seekers, history, k))
+        ]
+        if rows:
+            connection.execute(table.insert(), rows)
+
+
+def _changed(connection, since):
+    # kind -> ids whose row, genres or shows changed after since
+    changed = {}
+    for kind, (model, _, _, _, _) in KINDS.items():
+        table, column = model.__table__, shows.c[f'{kind}_id']
+        ids = set(connection.execute(
+            select(table.c.id).where(table.c.updated_at > since)).scalars())
+        ids.update(connection.execute(
+            select(column).where(
+                shows.c.updated_at > since, column.isnot(None)).distinct()
+        ).scalars())
+        changed[kind] = ids
+    return changed
+
+
+def _neighbours(connection, kind, ids, seekers):
+    # ids of the other side whose matches can move with the given ones:
+    # those that list them now and those they are scored against
+    own, other = seekers[kind], KINDS[kind][4]
+    table = KINDS[other][3]
+    found = set()
+    for batch in _chunks(ids):
+        found.update(connection.execute(
+            select(table.c[f'{other}_id']).where(
+                table.c[f'{kind}_id'].in_(batch)).distinct()).scalars())
+    for entity_id in ids:
+        if entity_id in own.genres:
+            found.update(seekers[other].candidates(
+                own.places[entity_id], own.genres[entity_id]))
+    return found
+
+
+def _lock_state(connection):
+    # matched_at, with the row locked so two runs never interleave; the
+    # migration seeds the row, a database made by create_all gets it here
+    matched_at = connection.execute(
+        select(state.c.matched_at).where(state.c.id == STATE_ID)
+        .with_for_update()).scalar()
+    if matched_at is None:
+        connection.execute(state.insert().values(id=STATE_ID,
+                                                 matched_at=NEVER))
+        matched_at = NEVER
+    return matched_at
+
+
+def _watermark(connection, started, margin):
+    # where the next run reads from, see above
+    since = started
+    if connection.dialect.name == 'postgresql':
+        oldest = connection.execute(text(
+            "SELECT min(xact_start) AT TIME ZONE 'UTC' "
+            "FROM pg_stat_activity "
+            "WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+        )).scalar()
+        if oldest is not None and oldest < since:
+            since = oldest
+    return since - margin
+
+
+def update(connection, k, full=False, margin=timedelta(minutes=5)):
+    # re-scores what changed since the last run, everything on the first
+    # run or when full; returns {kind: number re-scored}
+    started = datetime.utcnow()
+    matched_at = _lock_state(connection)
+    seekers = {kind: Seekers(connection, kind) for kind in KINDS}
+
+    if full or matched_at <= NEVER:
+        targets = {kind: set(seekers[kind].places) for kind in KINDS}
+        for kind in KINDS:
+            connection.execute(KINDS[kind][3].delete())
+    else:
+        changed = _changed(connection, matched_at)
+        targets = {kind: set(ids) for kind, ids in changed.items()}
+        for kind, ids in changed.items():
+            targets[KINDS[kind][4]] |= _neighbours(
+                connection, kind, ids, seekers)
+    for kind, ids in targets.items():
+        _store(connection, kind, ids, seekers, k)
+
+    connection.execute(
+        state.update().where(state.c.id == STATE_ID)
+        .values(matched_at=_watermark(connection, started, margin)))
+    return {kind: len(ids) for kind, ids in targets.items()}
+
+
+def matches(kind, entity_id):
+    # the stored matches of a venue / artist, best first, leaving out the
+    # ones that stopped seeking since the last run
+    table, other = KINDS[kind][3], KINDS[kind][4]
+    model, seeking = KINDS[other][0], KINDS[other][1]
+    return [
+        dict(row) for row in db.session.execute(
+            select(
+                model.id, model.name, model.city, model.state,
+                model.image_link, table.c.score
+            ).join(
+                model, model.id == table.c[f'{other}_id']
+            ).where(
+                table.c[f'{kind}_id'] == entity_id,
+                getattr(model, seeking).is_(True)
+            ).order_by(table.c.rank)
+        ).mappings()
+    ]
+
+
+def forget(connection, kind, ids):
+    # drops the matches of and to deleted venues / artists; the foreign keys
+    # cascade on postgres, not on sqlite
+    own, other = KINDS[kind][3], KINDS[KINDS[kind][4]][3]
+    connection.execute(own.delete().where(own.c[f'{kind}_id'].in_(ids)))
+    connection.execute(other.delete().where(other.c[f'{kind}_id'].in_(ids)))
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+
+
+def _touch_on_genres(mapper, connection, target):
+    # genres are a relationship, changing only them would leave updated_at
+    # alone and the change unseen by update() and by updated_since syncs
+    if inspect(target).attrs.genres.history.has_changes():
+        target.updated_at = datetime.utcnow()
+
+
+event.listen(Venue, 'before_update', _touch_on_genres)
+event.listen(Artist, 'before_update', _touch_on_genres)
@@ -0,0 +1,55 @@
+"""add show counters
+
+Revision ID: 4d7b9e1f3a26
+Revises: e2a85b6c9f03
+Create Date: 2026-10-17 13:41:07.218390
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7b9e1f3a26'
+down_revision = 'e2a85b6c9f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column(
+            'upcoming_shows_count', sa.Integer(), nullable=False,
+            server_default='0'))
+        op.add_column(table, sa.Column(
+            'past_shows_count', sa.Integer(), nullable=False,
+            server_default='0'))
+    op.create_table(
+        'show_counter_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rolled_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # same "now" as the app, naive local time
+    now = datetime.today()
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            f'UPDATE {table} SET '
+            f'upcoming_shows_count = (SELECT count(*) FROM shows '
+            f'WHERE shows.{column} = {table}.id AND start_time > :now), '
+            f'past_shows_count = (SELECT count(*) FROM shows '
+            f'WHERE shows.{column} = {table}.id AND start_time <= :now)'
+        ), {'now': now})
+    op.get_bind().execute(sa.text(
+        'INSERT INTO show_counter_state (id, rolled_at) VALUES (1, :now)'
+    ), {'now': now})
+
+
+def downgrade():
+    op.drop_table('show_counter_state')
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
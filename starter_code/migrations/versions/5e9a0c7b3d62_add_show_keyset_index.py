@@ -0,0 +1,25 @@
+"""add show keyset index
+
+Revision ID: 5e9a0c7b3d62
+Revises: b7d4e2f08c15
+Create Date: 2026-10-17 10:41:07.905311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e9a0c7b3d62'
+down_revision = 'b7d4e2f08c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_start_time_id', 'shows',
+                    ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
@@ -0,0 +1,31 @@
+"""add updated_at
+
+Revision ID: 8c6f1d2a4b90
+Revises: 5e9a0c7b3d62
+Create Date: 2026-10-17 11:20:45.337904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c6f1d2a4b90'
+down_revision = '5e9a0c7b3d62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists', 'shows'):
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.func.now()))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table,
+                        ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('shows', 'artists', 'venues'):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,42 @@
+"""add areas
+
+Revision ID: 9a3c5e7f1b48
+Revises: 4d7b9e1f3a26
+Create Date: 2026-10-17 14:18:52.604113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3c5e7f1b48'
+down_revision = '4d7b9e1f3a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'areas',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('state', sa.String(length=120), nullable=False),
+        sa.Column('city', sa.String(length=120), nullable=False),
+        sa.Column('venue_count', sa.Integer(), nullable=False,
+                  server_default='0'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('state', 'city', name='uq_areas_state_city')
+    )
+    op.create_index('ix_venues_state_city', 'venues', ['state', 'city'],
+                    unique=False)
+    op.execute(
+        'INSERT INTO areas (state, city, venue_count) '
+        'SELECT state, city, count(*) FROM venues '
+        'WHERE state IS NOT NULL AND city IS NOT NULL '
+        'GROUP BY state, city'
+    )
+
+
+def downgrade():
+    op.drop_index('ix_venues_state_city', table_name='venues')
+    op.drop_table('areas')
@@ -0,0 +1,65 @@
+"""cascade deletes of venues and artists to shows and genre links
+
+Revision ID: a6d2f9c4e1b7
+Revises: f3b8d1c6a0e7
+Create Date: 2026-10-17 19:12:38.204917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2f9c4e1b7'
+down_revision = 'f3b8d1c6a0e7'
+branch_labels = None
+depends_on = None
+
+
+# table -> (column, referred table)
+FOREIGN_KEYS = {
+    'shows': (('venue_id', 'venues'), ('artist_id', 'artists')),
+    'venue_genres': (('venue_id', 'venues'), ('genre_id', 'genres')),
+    'artist_genres': (('artist_id', 'artists'), ('genre_id', 'genres')),
+}
+
+# names for the unnamed constraints sqlite reflects, so batch mode can
+# drop them
+NAMING_CONVENTION = {
+    'fk': '%(table_name)s_%(column_0_name)s_fkey',
+}
+
+
+def replace_foreign_keys(ondelete):
+    # the constraints were created unnamed, or named by older tables, so
+    # the current names are looked up rather than assumed
+    inspector = sa.inspect(op.get_bind())
+    for table, keys in FOREIGN_KEYS.items():
+        existing = {
+            tuple(fk['constrained_columns']): fk['name']
+            for fk in inspector.get_foreign_keys(table)
+        }
+        with op.batch_alter_table(
+                table, naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred in keys:
+                name = f'{table}_{column}_fkey'
+                if (column,) in existing:
+                    batch_op.drop_constraint(
+                        existing[(column,)] or name, type_='foreignkey')
+                batch_op.create_foreign_key(
+                    name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    # rows left behind where the old constraints were not enforced
+    # (sqlite) would fail the new ones
+    for table, keys in FOREIGN_KEYS.items():
+        for column, referred in keys:
+            op.execute(
+                f'DELETE FROM {table} WHERE {column} IS NOT NULL AND '
+                f'{column} NOT IN (SELECT id FROM {referred})')
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
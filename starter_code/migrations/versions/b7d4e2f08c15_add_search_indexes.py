@@ -0,0 +1,61 @@
+"""add search indexes
+
+Revision ID: b7d4e2f08c15
+Revises: 3f1c2a9d7e41
+Create Date: 2026-10-17 10:03:54.118027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d4e2f08c15'
+down_revision = '3f1c2a9d7e41'
+branch_labels = None
+depends_on = None
+
+
+# trigram indexes serve ILIKE '%term%' and the %> operator,
+# the tsvector expressions must match search.PostgresSearchBackend
+TRIGRAM_INDEXES = [
+    ('ix_venues_name_trgm', 'venues', 'name'),
+    ('ix_venues_city_trgm', 'venues', 'city'),
+    ('ix_artists_name_trgm', 'artists', 'name'),
+    ('ix_artists_city_trgm', 'artists', 'city'),
+    ('ix_genres_name_trgm', 'genres', 'name'),
+]
+
+TSVECTOR_INDEXES = [
+    ('ix_venues_search_document', 'venues'),
+    ('ix_artists_search_document', 'artists'),
+]
+
+
+def upgrade():
+    # the in-process n-gram index is used on other databases
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        op.execute(
+            f'CREATE INDEX {name} ON {table} '
+            f'USING gin ({column} gin_trgm_ops)'
+        )
+    for name, table in TSVECTOR_INDEXES:
+        op.execute(
+            f"CREATE INDEX {name} ON {table} USING gin "
+            f"(to_tsvector('simple', "
+            f"coalesce(name, '') || ' ' || coalesce(city, '')))"
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for name, table in TSVECTOR_INDEXES:
+        op.drop_index(name, table_name=table)
+    for name, table, column in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,26 @@
+"""add venue genres index
+
+Revision ID: c1e4a7d2f695
+Revises: 9a3c5e7f1b48
+Create Date: 2026-10-17 15:02:33.918245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1e4a7d2f695'
+down_revision = '9a3c5e7f1b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_genres_venue_id_genre_id', 'venue_genres',
+                    ['venue_id', 'genre_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_genres_venue_id_genre_id',
+                  table_name='venue_genres')
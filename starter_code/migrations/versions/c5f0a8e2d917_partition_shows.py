@@ -0,0 +1,169 @@
+"""add shows archive, partition shows by month on postgresql
+
+Revision ID: c5f0a8e2d917
+Revises: a6d2f9c4e1b7
+Create Date: 2026-10-17 20:03:51.118402
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f0a8e2d917'
+down_revision = 'a6d2f9c4e1b7'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = 'id, venue_id, artist_id, start_time, end_time, updated_at'
+
+# indexes of shows that are not behind a constraint, recreated as they were
+INDEXES = (
+    "SELECT indexdef FROM pg_indexes "
+    "WHERE schemaname = current_schema() AND tablename = 'shows' "
+    "AND indexname NOT IN "
+    "(SELECT conname FROM pg_constraint WHERE conrelid = 'shows'::regclass)"
+)
+
+IS_PARTITIONED = (
+    "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+    "WHERE partrelid = to_regclass('shows'))"
+)
+
+
+def next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def exclude_overlaps(table):
+    for column, kind in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        op.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT ex_{table}_{kind}_overlap '
+            f'EXCLUDE USING gist '
+            f'({column} WITH =, tsrange(start_time, end_time) WITH &&)'
+        )
+
+
+def replace_shows(new_table_options, prepare):
+    # copies shows into a new table created with the given options, moves
+    # the id sequence over and swaps the two; prepare(new name) runs before
+    # the rows are copied
+    bind = op.get_bind()
+    sequence = bind.execute(
+        sa.text("SELECT pg_get_serial_sequence('shows', 'id')")).scalar()
+    if sequence is None:
+        raise RuntimeError('shows.id has no sequence to carry over')
+    indexes = bind.execute(sa.text(INDEXES)).scalars().all()
+
+    op.execute(
+        f"CREATE TABLE shows_new ("
+        f"id integer NOT NULL DEFAULT nextval('{sequence}'::regclass), "
+        f"venue_id integer, artist_id integer, "
+        f"start_time timestamp without time zone NOT NULL, "
+        f"end_time timestamp without time zone NOT NULL, "
+        f"updated_at timestamp without time zone NOT NULL DEFAULT now(), "
+        f"CONSTRAINT ck_shows_end_after_start CHECK (end_time > start_time)"
+        f") {new_table_options}"
+    )
+    prepare('shows_new')
+    op.execute(
+        f'INSERT INTO shows_new ({COLUMNS}) SELECT {COLUMNS} FROM shows')
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY shows_new.id')
+    op.execute('DROP TABLE shows CASCADE')
+    op.execute('ALTER TABLE shows_new RENAME TO shows')
+
+    for column, referred in (('venue_id', 'venues'), ('artist_id', 'artists')):
+        op.execute(
+            f'ALTER TABLE shows ADD CONSTRAINT shows_{column}_fkey '
+            f'FOREIGN KEY ({column}) REFERENCES {referred} (id) '
+            f'ON DELETE CASCADE'
+        )
+    for definition in indexes:
+        op.execute(definition)
+
+
+def partition():
+    # the primary key of a partitioned table has to include start_time
+    bind = op.get_bind()
+    first = bind.execute(sa.text('SELECT min(start_time) FROM shows')).scalar()
+    now = datetime.today()
+    months_ahead = current_app.config.get('SHOWS_PARTITION_MONTHS_AHEAD', 12)
+
+    def create_partitions(parent):
+        op.execute(f'CREATE TABLE shows_default PARTITION OF {parent} DEFAULT')
+        exclude_overlaps('shows_default')
+        month = datetime((first or now).year, (first or now).month, 1)
+        last = datetime(now.year, now.month, 1)
+        for _ in range(months_ahead):
+            last = next_month(last)
+        while month <= last:
+            name, upper = f'shows_p{month:%Y%m}', next_month(month)
+            op.execute(
+                f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES "
+                f"FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+            )
+            exclude_overlaps(name)
+            month = upper
+
+    replace_shows('PARTITION BY RANGE (start_time)', create_partitions)
+    op.execute(
+        'ALTER TABLE shows ADD CONSTRAINT shows_pkey '
+        'PRIMARY KEY (id, start_time)')
+
+
+def unpartition():
+    replace_shows('', lambda name: None)
+    op.execute('ALTER TABLE shows ADD CONSTRAINT shows_pkey PRIMARY KEY (id)')
+    op.execute(
+        'ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_overlap '
+        'EXCLUDE USING gist '
+        '(venue_id WITH =, tsrange(start_time, end_time) WITH &&)'
+    )
+    op.execute(
+        'ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_overlap '
+        'EXCLUDE USING gist '
+        '(artist_id WITH =, tsrange(start_time, end_time) WITH &&)'
+    )
+
+
+def upgrade():
+    op.create_table(
+        'shows_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=True),
+        sa.Column('artist_id', sa.Integer(), nullable=True),
+        sa.Column('start_time', sa.DateTime(), nullable=False),
+        sa.Column('end_time', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['venue_id'], ['venues.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_shows_archive_venue_id_start_time', 'shows_archive',
+                    ['venue_id', 'start_time'])
+    op.create_index('ix_shows_archive_artist_id_start_time',
+                    'shows_archive', ['artist_id', 'start_time'])
+
+    if op.get_bind().dialect.name == 'postgresql' and \
+            current_app.config.get('SHOWS_PARTITIONED'):
+        partition()
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql' and \
+            bind.execute(sa.text(IS_PARTITIONED)).scalar():
+        unpartition()
+    op.execute(
+        f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM shows_archive')
+    op.drop_index('ix_shows_archive_artist_id_start_time',
+                  table_name='shows_archive')
+    op.drop_index('ix_shows_archive_venue_id_start_time',
+                  table_name='shows_archive')
+    op.drop_table('shows_archive')
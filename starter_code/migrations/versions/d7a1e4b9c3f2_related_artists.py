@@ -0,0 +1,52 @@
+"""add related artists and their update queue
+
+Revision ID: d7a1e4b9c3f2
+Revises: c5f0a8e2d917
+Create Date: 2026-10-17 21:26:09.553104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a1e4b9c3f2'
+down_revision = 'c5f0a8e2d917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'related_artists',
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.SmallInteger(), nullable=False),
+        sa.Column('related_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['related_id'], ['artists.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('artist_id', 'rank')
+    )
+    op.create_index('ix_related_artists_related_id', 'related_artists',
+                    ['related_id'])
+    op.create_table(
+        'related_artist_queue',
+        sa.Column('artist_id', sa.Integer(), autoincrement=False,
+                  nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('artist_id')
+    )
+    # every existing artist starts out queued, the first
+    # `flask related update` fills related_artists
+    op.execute(
+        'INSERT INTO related_artist_queue (artist_id) SELECT id FROM artists')
+
+
+def downgrade():
+    op.drop_table('related_artist_queue')
+    op.drop_index('ix_related_artists_related_id',
+                  table_name='related_artists')
+    op.drop_table('related_artists')
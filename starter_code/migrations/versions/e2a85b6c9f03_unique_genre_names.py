@@ -0,0 +1,38 @@
+"""unique genre names
+
+Revision ID: e2a85b6c9f03
+Revises: 8c6f1d2a4b90
+Create Date: 2026-10-17 12:02:18.650472
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a85b6c9f03'
+down_revision = '8c6f1d2a4b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fold duplicate genres into the lowest id before adding the constraint
+    for table in ('venue_genres', 'artist_genres'):
+        op.execute(
+            f'UPDATE {table} SET genre_id = ('
+            f'SELECT min(keep.id) FROM genres keep '
+            f'JOIN genres dup ON dup.name = keep.name '
+            f'WHERE dup.id = {table}.genre_id)'
+        )
+    op.execute(
+        'DELETE FROM genres WHERE id NOT IN '
+        '(SELECT min(id) FROM genres GROUP BY name)'
+    )
+    with op.batch_alter_table('genres') as batch_op:
+        batch_op.create_unique_constraint('uq_genres_name', ['name'])
+
+
+def downgrade():
+    with op.batch_alter_table('genres') as batch_op:
+        batch_op.drop_constraint('uq_genres_name', type_='unique')
@@ -0,0 +1,54 @@
+"""add venue / artist matches
+
+Revision ID: e4c9b2f7a15d
+Revises: d7a1e4b9c3f2
+Create Date: 2026-10-17 22:41:17.308265
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4c9b2f7a15d'
+down_revision = 'd7a1e4b9c3f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled by the first `flask matches update`, which scores everyone
+    for kind, other in (('venue', 'artist'), ('artist', 'venue')):
+        op.create_table(
+            f'{kind}_matches',
+            sa.Column(f'{kind}_id', sa.Integer(), nullable=False),
+            sa.Column('rank', sa.SmallInteger(), nullable=False),
+            sa.Column(f'{other}_id', sa.Integer(), nullable=False),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint([f'{kind}_id'], [f'{kind}s.id'],
+                                    ondelete='CASCADE'),
+            sa.ForeignKeyConstraint([f'{other}_id'], [f'{other}s.id'],
+                                    ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(f'{kind}_id', 'rank')
+        )
+        op.create_index(f'ix_{kind}_matches_{other}_id', f'{kind}_matches',
+                        [f'{other}_id'])
+    match_state = op.create_table(
+        'match_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('matched_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # the row every run locks; the first run scores everyone
+    op.bulk_insert(match_state, [
+        {'id': 1, 'matched_at': datetime(1970, 1, 1)}])
+
+
+def downgrade():
+    op.drop_table('match_state')
+    for kind, other in (('venue', 'artist'), ('artist', 'venue')):
+        op.drop_index(f'ix_{kind}_matches_{other}_id',
+                      table_name=f'{kind}_matches')
+        op.drop_table(f'{kind}_matches')
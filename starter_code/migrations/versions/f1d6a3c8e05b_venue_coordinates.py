@@ -0,0 +1,62 @@
+"""add venue coordinates, earthdistance index on postgresql
+
+Revision ID: f1d6a3c8e05b
+Revises: e4c9b2f7a15d
+Create Date: 2026-10-17 23:52:40.671930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1d6a3c8e05b'
+down_revision = 'e4c9b2f7a15d'
+branch_labels = None
+depends_on = None
+
+
+AVAILABLE = (
+    "SELECT EXISTS (SELECT 1 FROM pg_available_extensions "
+    "WHERE name = 'earthdistance')"
+)
+
+INSTALLED = (
+    "SELECT EXISTS (SELECT 1 FROM pg_extension "
+    "WHERE extname = 'earthdistance')"
+)
+
+
+def earthdistance():
+    # creating the extensions needs the privilege to; without it, or
+    # without the contrib package, geo.py uses its in-process grid
+    bind = op.get_bind()
+    if not bind.execute(sa.text(AVAILABLE)).scalar():
+        return False
+    try:
+        with bind.begin_nested():
+            op.execute('CREATE EXTENSION IF NOT EXISTS cube')
+            op.execute('CREATE EXTENSION IF NOT EXISTS earthdistance')
+    except sa.exc.DBAPIError:
+        return False
+    return True
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    if op.get_bind().dialect.name == 'postgresql' and earthdistance():
+        op.execute(
+            'CREATE INDEX ix_venues_earth ON venues USING gist '
+            '(ll_to_earth(latitude, longitude)) '
+            'WHERE latitude IS NOT NULL AND longitude IS NOT NULL'
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql' and \
+            bind.execute(sa.text(INSTALLED)).scalar():
+        op.execute('DROP INDEX IF EXISTS ix_venues_earth')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
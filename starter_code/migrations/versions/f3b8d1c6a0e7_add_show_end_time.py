@@ -0,0 +1,81 @@
+"""add show end time and overlap constraints
+
+Revision ID: f3b8d1c6a0e7
+Revises: c1e4a7d2f695
+Create Date: 2026-10-17 15:47:10.561829
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d1c6a0e7'
+down_revision = 'c1e4a7d2f695'
+branch_labels = None
+depends_on = None
+
+
+OVERLAPS = (
+    'SELECT a.id, b.id FROM shows a JOIN shows b '
+    'ON a.id < b.id AND (a.{0} = b.{0}) '
+    'AND a.start_time < b.end_time AND b.start_time < a.end_time '
+    'LIMIT 10'
+)
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(),
+                                     nullable=True))
+    # existing shows get the default three hours
+    if postgres:
+        op.execute(
+            "UPDATE shows SET end_time = start_time + interval '3 hours'")
+    else:
+        op.execute(
+            "UPDATE shows SET end_time = datetime(start_time, '+3 hours')")
+
+    if not postgres:
+        with op.batch_alter_table('shows') as batch_op:
+            batch_op.alter_column('end_time', nullable=False)
+            batch_op.create_check_constraint(
+                'ck_shows_end_after_start', 'end_time > start_time')
+        return
+
+    op.alter_column('shows', 'end_time', nullable=False)
+    op.create_check_constraint(
+        'ck_shows_end_after_start', 'shows', 'end_time > start_time')
+
+    # the exclusion constraints fail on existing double bookings, name
+    # them instead of the constraint error
+    for column in ('venue_id', 'artist_id'):
+        pairs = op.get_bind().execute(sa.text(OVERLAPS.format(column))).all()
+        if pairs:
+            raise RuntimeError(
+                f'Overlapping shows with the same {column}, fix or delete '
+                f'them first: {", ".join(f"{a}/{b}" for a, b in pairs)}')
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute(
+        'ALTER TABLE shows ADD CONSTRAINT ex_shows_venue_overlap '
+        'EXCLUDE USING gist '
+        '(venue_id WITH =, tsrange(start_time, end_time) WITH &&)'
+    )
+    op.execute(
+        'ALTER TABLE shows ADD CONSTRAINT ex_shows_artist_overlap '
+        'EXCLUDE USING gist '
+        '(artist_id WITH =, tsrange(start_time, end_time) WITH &&)'
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            'ALTER TABLE shows DROP CONSTRAINT ex_shows_artist_overlap')
+        op.execute(
+            'ALTER TABLE shows DROP CONSTRAINT ex_shows_venue_overlap')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.drop_constraint('ck_shows_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
@@ -1,12 +1,13 @@
+from datetime import datetime, timedelta
 from sqlalchemy.sql.schema import ForeignKey
-from flask_sqlalchemy import SQLAlchemy
+from routing import RoutingSQLAlchemy
 
 # ----------------------------------------------------------------------------#
 # SQLA Config.
 # ----------------------------------------------------------------------------#
 
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 
 
 # ----------------------------------------------------------------------------#
@@ -16,6 +17,9 @@ db = SQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -28,8 +32,22 @@ class Venue(db.Model):
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=True)
     seeking_description = db.Column(db.String(250))
+    # of the city, filled by `flask geo geocode`, see geo.py
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now())
+    # maintained by counters.py, as of ShowCounterState.rolled_at
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+    # the foreign key cascades, unloaded shows are deleted in bulk by
+    # deletes.py rather than loaded one by one
     shows = db.relationship('Show', backref='venue',
-                            lazy=True, cascade="all, delete-orphan")
+                            lazy=True, cascade="all, delete-orphan",
+                            passive_deletes=True)
 
     def __repr__(self):
         return f'Venue ID: {self.id}, Venue Name: {self.name}'
@@ -53,8 +71,17 @@ class Artist(db.Model):
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=True)
     seeking_description = db.Column(db.String(250))
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now())
+    # maintained by counters.py, as of ShowCounterState.rolled_at
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
     shows = db.relationship('Show', backref=db.backref(
-        'artist', lazy=True))
+        'artist', lazy=True), cascade="all, delete-orphan",
+        passive_deletes=True)
 
     def __repr__(self):
         return f'Artist ID: {self.id}, Artist Name: {self.name}'
@@ -63,12 +90,37 @@ class Artist(db.Model):
         return f'Artist - {self.name} ({self.id}): {self.city}, {self.state}'
 
 
+DEFAULT_SHOW_DURATION = timedelta(hours=3)
+# longest show that can be listed; bookings.overlaps relies on it outside
+# postgres
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + \
+        DEFAULT_SHOW_DURATION
+
+
 class Show (db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint('end_time > start_time',
+                           name='ck_shows_end_after_start'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, ForeignKey(Venue.id))
-    artist_id = db.Column(db.Integer, ForeignKey(Artist.id))
+    venue_id = db.Column(db.Integer, ForeignKey(Venue.id, ondelete='CASCADE'))
+    artist_id = db.Column(db.Integer,
+                          ForeignKey(Artist.id, ondelete='CASCADE'))
     start_time = db.Column(db.DateTime, nullable=False)
+    # shows at one venue or by one artist may not overlap, see bookings.py
+    end_time = db.Column(db.DateTime, nullable=False,
+                         default=default_end_time)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True,
+                           default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now())
 
     def __repr__(self) -> str:
         return (
@@ -85,8 +137,139 @@ class Show (db.Model):
         )
 
 
+# shows moved out of `shows` by `flask shows archive`, see partitions.py;
+# ids are kept, only the past-shows sections read this table
+show_archive = db.Table(
+    'shows_archive',
+    db.Column('id', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('venue_id', db.Integer,
+              ForeignKey(Venue.id, ondelete='CASCADE')),
+    db.Column('artist_id', db.Integer,
+              ForeignKey(Artist.id, ondelete='CASCADE')),
+    db.Column('start_time', db.DateTime, nullable=False),
+    db.Column('end_time', db.DateTime, nullable=False),
+    db.Column('updated_at', db.DateTime, nullable=False),
+    db.Index('ix_shows_archive_venue_id_start_time', 'venue_id',
+             'start_time'),
+    db.Index('ix_shows_archive_artist_id_start_time', 'artist_id',
+             'start_time'),
+)
+
+
+class ShowCounterState(db.Model):
+    # a single row: the time up to which shows have been moved from the
+    # upcoming to the past counters
+    __tablename__ = 'show_counter_state'
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'Show counters rolled at {self.rolled_at}'
+
+
+class Area(db.Model):
+    # venues per (state, city), maintained by areas.py
+    __tablename__ = 'areas'
+    __table_args__ = (
+        db.UniqueConstraint('state', 'city', name='uq_areas_state_city'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.String(120), nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    venue_count = db.Column(db.Integer, nullable=False, default=0,
+                            server_default='0')
+
+    def __repr__(self):
+        return f'Area: {self.city}, {self.state} ({self.venue_count} venues)'
+
+
+class RelatedArtist(db.Model):
+    # the k most similar artists of each artist, precomputed by related.py
+    __tablename__ = 'related_artists'
+    __table_args__ = (
+        db.Index('ix_related_artists_related_id', 'related_id'),
+    )
+    artist_id = db.Column(db.Integer,
+                          ForeignKey('artists.id', ondelete='CASCADE'),
+                          primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    related_id = db.Column(db.Integer,
+                           ForeignKey('artists.id', ondelete='CASCADE'),
+                           nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return (f'Related artist {self.rank} of {self.artist_id}: '
+                f'{self.related_id} ({self.score:.3f})')
+
+
+class RelatedArtistQueue(db.Model):
+    # artists whose related artists need recomputing
+    __tablename__ = 'related_artist_queue'
+    artist_id = db.Column(db.Integer,
+                          ForeignKey('artists.id', ondelete='CASCADE'),
+                          primary_key=True)
+
+    def __repr__(self):
+        return f'Related artists of {self.artist_id} queued'
+
+
+class VenueMatch(db.Model):
+    # the best seeking artists for each seeking venue, by matchmaking.py
+    __tablename__ = 'venue_matches'
+    __table_args__ = (
+        db.Index('ix_venue_matches_artist_id', 'artist_id'),
+    )
+    venue_id = db.Column(db.Integer,
+                         ForeignKey('venues.id', ondelete='CASCADE'),
+                         primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    artist_id = db.Column(db.Integer,
+                          ForeignKey('artists.id', ondelete='CASCADE'),
+                          nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return (f'Match {self.rank} of venue {self.venue_id}: '
+                f'artist {self.artist_id} ({self.score})')
+
+
+class ArtistMatch(db.Model):
+    # the best seeking venues for each seeking artist, by matchmaking.py
+    __tablename__ = 'artist_matches'
+    __table_args__ = (
+        db.Index('ix_artist_matches_venue_id', 'venue_id'),
+    )
+    artist_id = db.Column(db.Integer,
+                          ForeignKey('artists.id', ondelete='CASCADE'),
+                          primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    venue_id = db.Column(db.Integer,
+                         ForeignKey('venues.id', ondelete='CASCADE'),
+                         nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return (f'Match {self.rank} of artist {self.artist_id}: '
+                f'venue {self.venue_id} ({self.score})')
+
+
+class MatchState(db.Model):
+    # a single row: the time of the last matchmaking run, the next one
+    # re-scores what changed after it
+    __tablename__ = 'match_state'
+    id = db.Column(db.Integer, primary_key=True)
+    matched_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'Matches updated at {self.matched_at}'
+
+
 class Genre(db.Model):
     __tablename__ = 'genres'
+    __table_args__ = (
+        db.UniqueConstraint('name', name='uq_genres_name'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     artists = db.relationship(
@@ -103,12 +286,15 @@ class Genre(db.Model):
 
 venue_genre = db.Table('venue_genres',
                        db.Column('genre_id', db.Integer,
-                                 ForeignKey('genres.id')),
+                                 ForeignKey('genres.id', ondelete='CASCADE')),
                        db.Column('venue_id', db.Integer,
-                                 ForeignKey('venues.id')))
+                                 ForeignKey('venues.id', ondelete='CASCADE')),
+                       db.Index('ix_venue_genres_venue_id_genre_id',
+                                'venue_id', 'genre_id'))
 
 artist_genre = db.Table('artist_genres',
                         db.Column('genre_id', db.Integer,
-                                  ForeignKey('genres.id')),
+                                  ForeignKey('genres.id', ondelete='CASCADE')),
                         db.Column('artist_id', db.Integer,
-                                  ForeignKey('artists.id')))
+                                  ForeignKey('artists.id',
+                                             ondelete='CASCADE')))
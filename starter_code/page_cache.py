@@ -0,0 +1,228 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import event, func, inspect, select, union
+from sqlalchemy.orm import Session, object_session
+from models import (db, Venue, Artist, Show, VenueMatch, ArtistMatch,
+                    RelatedArtist, show_archive)
+
+
+# ----------------------------------------------------------------------------#
+# Page stamps.
+# ----------------------------------------------------------------------------#
+# A cached page is only served while the rows it was rendered from are
+# unchanged, whichever worker or CLI command wrote them: every request reads
+# a stamp of those rows in one statement and compares it with the stamp the
+# page was stored with.  Deleted rows show in the counts, the matches and
+# related artists, which carry no updated_at, in a checksum of their ranks.
+
+
+shows = Show.__table__
+
+# kind -> (model, other side, its model, matches table)
+STAMPED = {
+    'venue': (Venue, 'artist', Artist, VenueMatch.__table__),
+    'artist': (Artist, 'venue', Venue, ArtistMatch.__table__),
+}
+
+
+def _ranked(table, column, condition):
+    # row count and a checksum of the ranking
+    return [
+        select(func.count()).select_from(table).where(condition)
+        .scalar_subquery(),
+        select(func.sum(table.c.rank * table.c[column])).where(condition)
+        .scalar_subquery(),
+    ]
+
+
+def stamp_query(kind, entity_id):
+    model, other, other_model, matches = STAMPED[kind]
+    own, other_id = f'{kind}_id', f'{other}_id'
+    columns = [
+        select(model.updated_at).where(model.id == entity_id)
+        .scalar_subquery()
+    ]
+    for table in (shows, show_archive):
+        condition = table.c[own] == entity_id
+        columns += [
+            select(func.count()).select_from(table).where(condition)
+            .scalar_subquery(),
+            select(func.max(table.c.updated_at)).where(condition)
+            .scalar_subquery(),
+        ]
+    # the other side's names and images on the show tiles and the matches
+    others = union(*[
+        select(table.c[other_id]).where(table.c[own] == entity_id)
+        for table in (shows, show_archive, matches)
+    ])
+    columns.append(
+        select(func.max(other_model.updated_at))
+        .where(other_model.id.in_(others)).scalar_subquery())
+    columns += _ranked(matches, other_id, matches.c[own] == entity_id)
+    if kind == 'artist':
+        related = RelatedArtist.__table__
+        condition = related.c.artist_id == entity_id
+        columns += _ranked(related, 'related_id', condition)
+        columns.append(
+            select(func.max(Artist.updated_at)).where(Artist.id.in_(
+                select(related.c.related_id).where(condition)
+            )).scalar_subquery())
+    return select(*columns)
+
+
+def page_stamp(key):
+    kind, entity_id = key
+    return tuple(db.session.execute(stamp_query(kind, entity_id)).one())
+
+
+# ----------------------------------------------------------------------------#
+# Rendered page cache.
+# ----------------------------------------------------------------------------#
+
+
+class CachedPage(object):
+
+    def __init__(self, body, stamp, expires_at=None):
+        self.body = body
+        self.stamp = stamp
+        # the same rows render the same body in every worker
+        self.etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+        self.last_modified = datetime.utcnow().replace(microsecond=0)
+        self.created = time.monotonic()
+        # past / upcoming split of the page changes at this (local) time
+        self.expires_at = expires_at
+
+
+class PageCache(object):
+    # rendered detail pages keyed by ('venue' | 'artist', id), each valid
+    # for the page stamp it was rendered under; a render that raced with a
+    # write is stored under the stamp read before it, so the next request
+    # renders again
+
+    def __init__(self, max_entries=2000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key, stamp):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stale = (
+                entry.stamp != stamp or
+                (self.ttl and time.monotonic() - entry.created > self.ttl) or
+                (entry.expires_at and datetime.today() >= entry.expires_at)
+            )
+            if stale:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, stamp, body, expires_at=None):
+        entry = CachedPage(body, stamp, expires_at)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key):
+        # drops the page early, the stamp would catch it on the next request
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+page_cache = PageCache()
+
+
+def cached_page(key, build):
+    # build() returns (body, expires_at) or None when there is nothing to
+    # cache; pending flash messages are user specific so those renders skip
+    # the cache
+    if not current_app.config.get('PAGE_CACHE_ENABLED', True) or \
+            session.get('_flashes'):
+        built = build()
+        return built[0] if built else None
+
+    stamp = page_stamp(key)
+    entry = page_cache.get(key, stamp)
+    if entry is None:
+        built = build()
+        if built is None:
+            return None
+        body, expires_at = built
+        entry = page_cache.set(key, stamp, body, expires_at)
+
+    response = make_response(entry.body)
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# ----------------------------------------------------------------------------#
+# Invalidation.
+# ----------------------------------------------------------------------------#
+
+
+def _invalidate(target, keys):
+    # once at flush, and again after commit so a page rendered from the
+    # pre-commit data in the meantime is dropped as well
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('page_cache_keys', set()).update(keys)
+    for key in keys:
+        page_cache.invalidate(key)
+
+
+def _invalidate_entity(mapper, connection, target):
+    kind = 'venue' if isinstance(target, Venue) else 'artist'
+    _invalidate(target, {(kind, target.id)})
+
+
+def _invalidate_show(mapper, connection, target):
+    # the show's venue and artist, including the previous ones on update
+    state = inspect(target)
+    keys = set()
+    for attribute, kind in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        history = state.attrs[attribute].history
+        ids = set(history.added or ()) | set(history.deleted or ())
+        ids.add(getattr(target, attribute))
+        keys |= {
+            (kind, int(entity_id)) for entity_id in ids
+            if entity_id is not None
+        }
+    _invalidate(target, keys)
+
+
+def _invalidate_committed(session):
+    for key in session.info.pop('page_cache_keys', ()):
+        page_cache.invalidate(key)
+
+
+def _discard_pending(session):
+    session.info.pop('page_cache_keys', None)
+
+
+for _model in (Venue, Artist):
+    event.listen(_model, 'after_update', _invalidate_entity)
+    event.listen(_model, 'after_delete', _invalidate_entity)
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Show, _event, _invalidate_show)
+
+event.listen(Session, 'after_commit', _invalidate_committed)
+event.listen(Session, 'after_rollback', _discard_pending)
@@ -0,0 +1,96 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+# ----------------------------------------------------------------------------#
+# Cursors.
+# ----------------------------------------------------------------------------#
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    # opaque, url-safe token for the sort key of a row
+    payload = [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, types):
+    # types gives the python type of each key column, e.g. (datetime, int)
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        if len(payload) != len(types):
+            raise ValueError('cursor has the wrong number of values')
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for value, kind in zip(payload, types)
+        )
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(str(e))
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pages.
+# ----------------------------------------------------------------------------#
+
+
+class Page(object):
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_page(query, columns, key, per_page, after=None, before=None):
+    # columns: the unique, ascending sort key, e.g. (Show.start_time, Show.id)
+    # key: returns the values of that sort key for a fetched row
+    # after / before: decoded cursors, at most one of them is used
+    if before is not None:
+        rows = query.filter(
+            tuple_(*columns) < tuple_(*before)
+        ).order_by(
+            *[column.desc() for column in columns]
+        ).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_prev, has_next = more, True
+    else:
+        if after is not None:
+            query = query.filter(tuple_(*columns) > tuple_(*after))
+        rows = query.order_by(*columns).limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev, has_next = after is not None, more
+
+    if not rows:
+        # ran off one end: only offer the way back
+        return Page(
+            rows,
+            next_cursor=encode_cursor(before) if before else None,
+            prev_cursor=encode_cursor(after) if after else None
+        )
+
+    return Page(
+        rows,
+        next_cursor=encode_cursor(key(rows[-1])) if has_next else None,
+        prev_cursor=encode_cursor(key(rows[0])) if has_prev else None
+    )
@@ -0,0 +1,168 @@
+from datetime import datetime
+
+from sqlalchemy import select, text, union_all
+from models import Venue, Artist, Show, show_archive
+
+
+# ----------------------------------------------------------------------------#
+# Hot and cold shows.
+# ----------------------------------------------------------------------------#
+# With SHOWS_PARTITIONED set when migrating a PostgreSQL database, `shows`
+# is range partitioned by month on start_time (shows_p202610, ...) with a
+# shows_default partition for anything outside the created months.  Queries
+# that bound start_time, like every upcoming-show query, only scan the
+# partitions of the months they cover.  `flask shows partitions` creates
+# the months ahead.
+#
+# Elsewhere `flask shows archive` moves shows that ended a while ago into
+# shows_archive, keeping `shows` down to the recent and upcoming ones.
+# Only the past-shows sections of the venue and artist pages, the counters
+# and deletes read the archive; the show list, the API and the exports see
+# the live table.
+
+
+shows = Show.__table__
+
+COLUMNS = ('id', 'venue_id', 'artist_id', 'start_time', 'end_time',
+           'updated_at')
+
+# kind -> (other side, its model)
+OTHER = {
+    'venue': ('artist', Artist),
+    'artist': ('venue', Venue),
+}
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'shows_p{month:%Y%m}'
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass('shows'))"
+    )).scalar()
+
+
+def partitions(connection):
+    # names of the partitions attached to shows
+    return set(connection.execute(text(
+        "SELECT inhrelid::regclass::text FROM pg_inherits "
+        "WHERE inhparent = to_regclass('shows')"
+    )).scalars())
+
+
+def create_partition(connection, month):
+    # shows of [month, next month); rows the default partition holds for
+    # that range move over first, attaching would fail on them otherwise.
+    # Exclusion constraints cannot span a partitioned table, each partition
+    # gets its own, so a double booking across a month boundary is only
+    # caught by bookings.find_conflicts
+    name = partition_name(month)
+    bounds = {'lower': month, 'upper': next_month(month)}
+    connection.execute(text(
+        f'CREATE TABLE {name} '
+        f'(LIKE shows INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    connection.execute(text(
+        f'WITH moved AS (DELETE FROM shows_default '
+        f'WHERE start_time >= :lower AND start_time < :upper RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'), bounds)
+    for column, kind in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        connection.execute(text(
+            f'ALTER TABLE {name} ADD CONSTRAINT ex_{name}_{kind}_overlap '
+            f'EXCLUDE USING gist '
+            f'({column} WITH =, tsrange(start_time, end_time) WITH &&)'))
+    connection.execute(text(
+        f"ALTER TABLE shows ATTACH PARTITION {name} FOR VALUES "
+        f"FROM ('{bounds['lower']:%Y-%m-%d}') "
+        f"TO ('{bounds['upper']:%Y-%m-%d}')"))
+    return name
+
+
+def ensure_partitions(connection, months_ahead, now=None):
+    # creates the missing partitions from this month to months_ahead
+    # months from now, returns their names
+    month = month_start(now or datetime.today())
+    existing = partitions(connection)
+    created = []
+    for _ in range(months_ahead + 1):
+        if partition_name(month) not in existing:
+            created.append(create_partition(connection, month))
+        month = next_month(month)
+    return created
+
+
+def archive_shows(connection, before, batch=500):
+    # moves the shows that ended before `before` into shows_archive, returns
+    # how many; they are all past, so the counters stay as they are.  Only
+    # the rows archived are deleted, a show ending before `before` that is
+    # committed meanwhile waits for the next run
+    if connection.dialect.name == 'postgresql':
+        columns = ', '.join(COLUMNS)
+        return connection.execute(text(
+            f'WITH moved AS (DELETE FROM shows WHERE end_time < :before '
+            f'RETURNING {columns}) '
+            f'INSERT INTO shows_archive ({columns}) '
+            f'SELECT {columns} FROM moved'), {'before': before}).rowcount
+    ids = connection.execute(
+        select(shows.c.id).where(shows.c.end_time < before)
+    ).scalars().all()
+    for start in range(0, len(ids), batch):
+        chosen = shows.c.id.in_(ids[start:start + batch])
+        connection.execute(show_archive.insert().from_select(
+            COLUMNS,
+            select(*[shows.c[name] for name in COLUMNS]).where(chosen)))
+        connection.execute(shows.delete().where(chosen))
+    return len(ids)
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+
+def _shows_of(table, kind, entity_id, condition):
+    other, model = OTHER[kind]
+    return select(
+        table.c.start_time,
+        model.id.label(f'{other}_id'),
+        model.name.label(f'{other}_name'),
+        model.image_link.label(f'{other}_image_link'),
+        model.updated_at.label(f'{other}_updated_at')
+    ).join(
+        model, model.id == table.c[f'{other}_id']
+    ).where(
+        table.c[f'{kind}_id'] == entity_id, condition(table)
+    )
+
+
+def upcoming_shows(session, kind, entity_id, now):
+    # shows of the venue / artist starting at or after now, with the other
+    # side's name and image; the bound on start_time keeps postgres to the
+    # partitions from this month on, the archive is never read
+    query = _shows_of(
+        shows, kind, entity_id, lambda table: table.c.start_time >= now)
+    return session.execute(
+        query.order_by(shows.c.start_time)).mappings().all()
+
+
+def past_shows(session, kind, entity_id, now):
+    # shows of the venue / artist that started before now, archived ones
+    # included
+    query = union_all(*[
+        _shows_of(table, kind, entity_id,
+                  lambda table: table.c.start_time < now)
+        for table in (shows, show_archive)
+    ]).subquery()
+    return session.execute(
+        select(query).order_by(query.c.start_time)).mappings().all()
@@ -0,0 +1,142 @@
+import bisect
+import threading
+import time
+
+from flask import abort, current_app, jsonify
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool, QueuePool
+
+
+# ----------------------------------------------------------------------------#
+# Pool statistics.
+# ----------------------------------------------------------------------------#
+
+
+# upper bounds, in milliseconds, of the checkout wait histogram buckets
+WAIT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class PoolStats(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidations = 0
+            self.soft_invalidations = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_wait(self, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            self.wait_total += ms
+            self.wait_max = max(self.wait_max, ms)
+            self.wait_counts[bisect.bisect_left(WAIT_BUCKETS, ms)] += 1
+
+    def snapshot(self, pool=None):
+        with self.lock:
+            waits = sum(self.wait_counts)
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'soft_invalidations': self.soft_invalidations,
+                'timeouts': self.timeouts,
+                'wait_ms': {
+                    'count': waits,
+                    'mean': round(self.wait_total / waits, 3) if waits else 0,
+                    'max': round(self.wait_max, 3),
+                    'histogram': [
+                        {'le': bound, 'count': count} for bound, count in zip(
+                            WAIT_BUCKETS + ('inf',), self.wait_counts)
+                    ]
+                }
+            }
+        if isinstance(pool, QueuePool):
+            data.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # a QueuePool that records how long each checkout waited for a
+    # connection, including the time spent opening a new one
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.count('timeouts')
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+def _on(name):
+    def listener(*args):
+        pool_stats.count(name)
+    return listener
+
+
+event.listen(Pool, 'connect', _on('connects'))
+event.listen(Pool, 'checkout', _on('checkouts'))
+event.listen(Pool, 'checkin', _on('checkins'))
+event.listen(Pool, 'invalidate', _on('invalidations'))
+event.listen(Pool, 'soft_invalidate', _on('soft_invalidations'))
+
+
+# ----------------------------------------------------------------------------#
+# Engine options.
+# ----------------------------------------------------------------------------#
+
+
+def engine_options(uri, pool_size, max_overflow, pool_timeout, pool_recycle,
+                   pool_pre_ping, statement_timeout):
+    # SQLALCHEMY_ENGINE_OPTIONS for the given settings; sqlite keeps its
+    # default pool, which takes no sizing arguments
+    options = {
+        'pool_pre_ping': pool_pre_ping,
+        'pool_recycle': pool_recycle,
+    }
+    if uri.startswith('sqlite'):
+        return options
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+    )
+    if statement_timeout and uri.startswith('postgres'):
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={statement_timeout}'
+        }
+    return options
+
+
+def pool_view():
+    if not current_app.config['SQL_DEBUG_ENDPOINT']:
+        abort(404)
+    db = current_app.extensions['sqlalchemy'].db
+    return jsonify(pool_stats.snapshot(db.engine.pool))
@@ -0,0 +1,356 @@
+import heapq
+import math
+from collections import defaultdict
+
+from sqlalchemy import (and_, event, exists, func, inspect, literal, or_,
+                        select, union, union_all)
+from models import db, Venue, Artist, Show, RelatedArtist, RelatedArtistQueue
+from models import artist_genre, venue_genre, show_archive
+
+
+# ----------------------------------------------------------------------------#
+# Related artists.
+# ----------------------------------------------------------------------------#
+# Every artist is a sparse vector over
+#   ('g', genre)  its own genres, and the genres of the venues it played,
+#                 in proportion to how often it played them
+#   ('v', venue)  the venues it played, so artists sharing stages are close
+# weighted by idf and normalised, so the dot product of two vectors is their
+# cosine similarity.  `flask related rebuild` stores the k best matches of
+# every artist in related_artists; changes to genres and shows queue the
+# artists they affect in related_artist_queue and `flask related update`,
+# run from cron, recomputes those and the artists whose lists they can
+# enter or leave, loading only the vectors of the artists sharing a feature
+# with them.  Pages read the stored rows, one primary key range scan per
+# artist.
+
+
+ARTIST_GENRE_WEIGHT = 1.0
+VENUE_GENRE_WEIGHT = 0.5
+VENUE_WEIGHT = 1.0
+
+# longest posting list scored per feature: only the artists weighing a
+# feature most are looked at, so a genre every other artist plays costs
+# the same as a rare one
+CHAMPIONS = 2000
+
+related = RelatedArtist.__table__
+pending = RelatedArtistQueue.__table__
+artists = Artist.__table__
+shows = Show.__table__
+
+
+def _played():
+    # (artist id, venue id) of every live and archived show
+    played = union_all(
+        select(shows.c.artist_id, shows.c.venue_id),
+        select(show_archive.c.artist_id, show_archive.c.venue_id)
+    ).subquery()
+    return select(played.c.artist_id, played.c.venue_id).where(
+        played.c.artist_id.isnot(None), played.c.venue_id.isnot(None)
+    ).subquery()
+
+
+def _features():
+    # (artist id, kind, feature id), once per feature of an artist's vector
+    played = _played()
+    return union(
+        select(artist_genre.c.artist_id, literal('g').label('kind'),
+               artist_genre.c.genre_id.label('feature')),
+        select(played.c.artist_id, literal('g'), venue_genre.c.genre_id).join(
+            venue_genre, venue_genre.c.venue_id == played.c.venue_id),
+        select(played.c.artist_id, literal('v'), played.c.venue_id)
+    ).subquery()
+
+
+def neighbours(artist_ids):
+    # select of the given artists and every artist sharing a feature with
+    # them, the only ones their dot products can reach
+    features = _features()
+    other = _features()
+    return select(other.c.artist_id).join(features, and_(
+        features.c.kind == other.c.kind,
+        features.c.feature == other.c.feature
+    )).where(features.c.artist_id.in_(artist_ids)).distinct()
+
+
+def _frequencies(connection, artist_ids):
+    # (feature -> artists having it, artists with any feature) for the
+    # features of the given artists, counted over the whole catalog
+    features = _features()
+    wanted = select(features.c.kind, features.c.feature).where(
+        features.c.artist_id.in_(artist_ids)).distinct().subquery()
+    frequency = {
+        (kind, feature): count
+        for kind, feature, count in connection.execute(
+            select(features.c.kind, features.c.feature, func.count()).join(
+                wanted, and_(wanted.c.kind == features.c.kind,
+                             wanted.c.feature == features.c.feature)
+            ).group_by(features.c.kind, features.c.feature))
+    }
+    size = connection.execute(
+        select(func.count(features.c.artist_id.distinct()))).scalar()
+    return frequency, size
+
+
+def load_vectors(connection, artist_ids=None):
+    # artist id -> {feature: weight}, normalised; every artist's, or only
+    # those of artist_ids (a list or a select of ids) weighted as if all
+    # were loaded
+    vectors = defaultdict(lambda: defaultdict(float))
+    genres = select(artist_genre.c.artist_id, artist_genre.c.genre_id)
+    played = _played()
+    plays = select(played.c.artist_id, played.c.venue_id, func.count())
+    venues = select(venue_genre.c.venue_id, venue_genre.c.genre_id)
+    if artist_ids is not None:
+        genres = genres.where(artist_genre.c.artist_id.in_(artist_ids))
+        plays = plays.where(played.c.artist_id.in_(artist_ids))
+        venues = venues.where(venue_genre.c.venue_id.in_(
+            select(played.c.venue_id).where(
+                played.c.artist_id.in_(artist_ids))))
+
+    for artist_id, genre_id in connection.execute(genres):
+        vectors[artist_id][('g', genre_id)] += ARTIST_GENRE_WEIGHT
+    plays = connection.execute(
+        plays.group_by(played.c.artist_id, played.c.venue_id)).all()
+    venue_genres = defaultdict(list)
+    for venue_id, genre_id in connection.execute(venues):
+        venue_genres[venue_id].append(genre_id)
+    totals = defaultdict(int)
+    for artist_id, venue_id, count in plays:
+        totals[artist_id] += count
+    for artist_id, venue_id, count in plays:
+        vector = vectors[artist_id]
+        vector[('v', venue_id)] += VENUE_WEIGHT
+        share = VENUE_GENRE_WEIGHT * count / totals[artist_id]
+        for genre_id in venue_genres.get(venue_id, ()):
+            vector[('g', genre_id)] += share
+
+    if artist_ids is None:
+        frequency = defaultdict(int)
+        for vector in vectors.values():
+            for feature in vector:
+                frequency[feature] += 1
+        size = len(vectors)
+    else:
+        frequency, size = _frequencies(connection, artist_ids)
+    for vector in vectors.values():
+        for feature in vector:
+            vector[feature] *= math.log(1 + size / frequency[feature])
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        for feature in vector:
+            vector[feature] /= norm
+    return vectors
+
+
+class SimilarityIndex(object):
+    # inverted index of the vectors; top_k() accumulates the dot products
+    # over the posting lists of an artist's features.  An index over a part
+    # of the vectors scores the artists whose neighbours it holds exactly
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ids = list(vectors)
+        position = {artist_id: i for i, artist_id in enumerate(self.ids)}
+        lists = defaultdict(list)
+        for artist_id, vector in vectors.items():
+            for feature, weight in vector.items():
+                lists[feature].append((weight, position[artist_id]))
+
+        self.postings = {}
+        for feature, entries in lists.items():
+            if len(entries) > CHAMPIONS:
+                entries = heapq.nlargest(CHAMPIONS, entries)
+            self.postings[feature] = [(i, w) for w, i in entries]
+        self.position = position
+
+    def top_k(self, artist_id, k):
+        # [(related id, score)] best first, the artist itself excluded
+        vector = self.vectors.get(artist_id)
+        if not vector:
+            return []
+        own = self.position[artist_id]
+        scores = defaultdict(float)
+        for feature, weight in vector.items():
+            for i, other in self.postings[feature]:
+                scores[i] += weight * other
+        scores.pop(own, None)
+        scored = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.ids[i], score) for i, score in scored if score > 0]
+
+
+def _store(connection, results):
+    # results: {artist id: [(related id, score)]}
+    if not results:
+        return
+    connection.execute(
+        related.delete().where(related.c.artist_id.in_(list(results))))
+    rows = [
+        {'artist_id': artist_id, 'rank': rank, 'related_id': related_id,
+         'score': round(score, 6)}
+        for artist_id, matches in results.items()
+        for rank, (related_id, score) in enumerate(matches)
+    ]
+    if rows:
+        connection.execute(related.insert(), rows)
+
+
+def _compute(connection, artist_ids, k, index=None, batch_size=1000):
+    index = index or SimilarityIndex(load_vectors(connection))
+    for start in range(0, len(artist_ids), batch_size):
+        _store(connection, {
+            artist_id: index.top_k(artist_id, k)
+            for artist_id in artist_ids[start:start + batch_size]
+        })
+    return len(artist_ids)
+
+
+def _affected(connection, index, artist_ids, k):
+    # artists whose top k can move with the given ones' vectors: those
+    # listing them now, and those they now score above the k-th kept match;
+    # index holds the neighbours of artist_ids
+    found = set(connection.execute(
+        select(related.c.artist_id).where(
+            related.c.related_id.in_(artist_ids)).distinct()
+    ).scalars())
+    kth = dict(connection.execute(
+        select(related.c.artist_id, related.c.score).where(
+            related.c.rank == k - 1,
+            related.c.artist_id.in_(neighbours(artist_ids)))
+    ).all())
+    for artist_id in artist_ids:
+        for other_id, score in index.top_k(artist_id, len(index.ids)):
+            if score > kth.get(other_id, 0):
+                found.add(other_id)
+    return found
+
+
+def update(connection, k):
+    # recomputes the queued artists and the ones whose matches they can
+    # move, returns how many were recomputed
+    queued = connection.execute(select(pending.c.artist_id)).scalars().all()
+    if not queued:
+        return 0
+    connection.execute(
+        pending.delete().where(pending.c.artist_id.in_(queued)))
+    index = SimilarityIndex(load_vectors(connection, neighbours(queued)))
+    targets = sorted(set(queued) | _affected(connection, index, queued, k))
+    index = SimilarityIndex(load_vectors(connection, neighbours(targets)))
+    return _compute(connection, targets, k, index=index)
+
+
+def rebuild(connection, k):
+    # recomputes every artist
+    connection.execute(related.delete())
+    connection.execute(pending.delete())
+    return _compute(
+        connection, connection.execute(select(artists.c.id)).scalars().all(),
+        k)
+
+
+def related_artists(artist_id):
+    # the stored matches of one artist, best first
+    return [
+        dict(row) for row in db.session.execute(
+            select(
+                Artist.id, Artist.name, Artist.image_link, RelatedArtist.score
+            ).join(
+                Artist, Artist.id == RelatedArtist.related_id
+            ).where(
+                RelatedArtist.artist_id == artist_id
+            ).order_by(RelatedArtist.rank)
+        ).mappings()
+    ]
+
+
+# ----------------------------------------------------------------------------#
+# Queue.
+# ----------------------------------------------------------------------------#
+
+
+def queue(connection, artist_ids=(), venue_ids=()):
+    # queues the given artists and every artist that played one of the
+    # given venues, skipping the ones already queued
+    def not_queued(column):
+        return ~exists().where(pending.c.artist_id == column)
+
+    artist_ids = [i for i in set(artist_ids) if i is not None]
+    venue_ids = [i for i in set(venue_ids) if i is not None]
+    if artist_ids:
+        connection.execute(pending.insert().from_select(
+            ['artist_id'],
+            select(artists.c.id).where(
+                artists.c.id.in_(artist_ids), not_queued(artists.c.id))
+        ))
+    if venue_ids:
+        # archived shows count towards the vectors as much as live ones
+        played = union(*[
+            select(table.c.artist_id.label('artist_id')).where(
+                table.c.venue_id.in_(venue_ids),
+                table.c.artist_id.isnot(None))
+            for table in (shows, show_archive)
+        ]).subquery()
+        connection.execute(pending.insert().from_select(
+            ['artist_id'],
+            select(played.c.artist_id).where(
+                not_queued(played.c.artist_id))
+        ))
+
+
+def forget(connection, artist_ids):
+    # drops the rows of deleted artists and queues the artists that listed
+    # them; the foreign keys cascade on postgres, not on sqlite
+    listed = connection.execute(
+        select(related.c.artist_id).where(
+            related.c.related_id.in_(artist_ids)).distinct()
+    ).scalars().all()
+    connection.execute(related.delete().where(or_(
+        related.c.artist_id.in_(artist_ids),
+        related.c.related_id.in_(artist_ids))))
+    connection.execute(
+        pending.delete().where(pending.c.artist_id.in_(artist_ids)))
+    queue(connection, set(listed) - set(artist_ids))
+
+
+# ----------------------------------------------------------------------------#
+# Events.
+# ----------------------------------------------------------------------------#
+
+
+def _show_changed(mapper, connection, target):
+    # the artist's vector and the similarity of everyone at the venue;
+    # the previous venue and artist too when a show moves
+    state = inspect(target)
+    artist_ids, venue_ids = {target.artist_id}, {target.venue_id}
+    for name, ids in (('artist_id', artist_ids), ('venue_id', venue_ids)):
+        ids.update(state.attrs[name].history.deleted or ())
+    queue(connection, artist_ids, venue_ids)
+
+
+def _show_updated(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.artist_id.history.has_changes() or \
+            state.attrs.venue_id.history.has_changes():
+        _show_changed(mapper, connection, target)
+
+
+def _artist_inserted(mapper, connection, target):
+    queue(connection, [target.id])
+
+
+def _artist_updated(mapper, connection, target):
+    if inspect(target).attrs.genres.history.has_changes():
+        queue(connection, [target.id])
+
+
+def _venue_updated(mapper, connection, target):
+    if inspect(target).attrs.genres.history.has_changes():
+        queue(connection, venue_ids=[target.id])
+
+
+event.listen(Show, 'after_insert', _show_changed)
+event.listen(Show, 'after_delete', _show_changed)
+event.listen(Show, 'after_update', _show_updated)
+event.listen(Artist, 'after_insert', _artist_inserted)
+event.listen(Artist, 'after_update', _artist_updated)
+event.listen(Venue, 'after_update', _venue_updated)
@@ -0,0 +1,87 @@
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+
+
+# ----------------------------------------------------------------------------#
+# Read replica routing.
+# ----------------------------------------------------------------------------#
+# GET / HEAD requests read from one of SQLALCHEMY_REPLICA_BINDS, everything
+# else (writes, flushes, cli commands) uses the primary.  After a request
+# commits, the client reads from the primary for
+# SQLALCHEMY_REPLICA_STICKY_SECONDS so it sees its own writes.
+
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def read_only(view):
+    # lets a view that is not a GET, like the search forms, read from a
+    # replica too
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def use_primary():
+    # for the rest of this request, e.g. the edit forms, whose values are
+    # posted back
+    g.use_primary = True
+
+
+def reads_from_replica():
+    if not has_request_context() or g.get('use_primary'):
+        return False
+    if request.method not in READ_METHODS and not g.get('read_only'):
+        return False
+    return session.get('_primary_until', 0) <= time.time()
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        replicas = self.app.config.get('SQLALCHEMY_REPLICA_BINDS')
+        if replicas and not self._flushing and reads_from_replica():
+            # one replica per request so its reads are consistent
+            if 'replica_bind' not in g:
+                g.replica_bind = random.choice(replicas)
+            return self.db.get_engine(self.app, bind=g.replica_bind)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('SQLALCHEMY_REPLICA_BINDS', [])
+        app.config.setdefault('SQLALCHEMY_REPLICA_STICKY_SECONDS', 5)
+        app.after_request(_stick_to_primary)
+
+
+def _mark_written(db_session):
+    if has_request_context():
+        g.db_written = True
+
+
+def _stick_to_primary(response):
+    if g.get('db_written'):
+        seconds = current_app.config['SQLALCHEMY_REPLICA_STICKY_SECONDS']
+        session['_primary_until'] = max(
+            session.get('_primary_until', 0), time.time() + seconds)
+    return response
+
+
+event.listen(RoutingSession, 'after_commit', _mark_written)
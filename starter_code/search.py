@@ -0,0 +1,395 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app
+from sqlalchemy import event, literal, literal_column, or_
+from sqlalchemy.orm import Session, object_session
+from models import db, Venue, Artist, Genre, venue_genre, artist_genre
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+# how much a plain substring hit in each field adds to a result's score
+FIELD_WEIGHTS = (('name', 1.0), ('city', 0.5), ('genres', 0.25))
+
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', (text or '').lower()).strip()
+
+
+def ngrams(text, n=3):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def escape_like(text):
+    return (
+        text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    )
+
+
+def genre_association(model):
+    # association table and its foreign key column pointing at model
+    if model is Venue:
+        return venue_genre, venue_genre.c.venue_id
+    return artist_genre, artist_genre.c.artist_id
+
+
+# ----------------------------------------------------------------------------#
+# In-process n-gram index.
+# ----------------------------------------------------------------------------#
+
+
+class NgramIndex(object):
+    # inverted index from trigram to document ids over name, city and genres
+
+    def __init__(self, n=3, threshold=0.6):
+        self.n = n
+        self.threshold = threshold
+        self.documents = {}
+        self.postings = defaultdict(set)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _grams(self, fields):
+        grams = set()
+        for value in fields.values():
+            grams |= ngrams(value, self.n)
+        return grams
+
+    def add(self, doc_id, name, city, genres):
+        self.remove(doc_id)
+        fields = {
+            'name': normalize(name),
+            'city': normalize(city),
+            'genres': ' | '.join(normalize(genre) for genre in genres)
+        }
+        self.documents[doc_id] = fields
+        for gram in self._grams(fields):
+            self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        fields = self.documents.pop(doc_id, None)
+        if fields is None:
+            return
+        for gram in self._grams(fields):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self.postings[gram]
+
+    def _candidates(self, term):
+        # doc id -> fraction of the term's trigrams it shares
+        grams = ngrams(term, self.n)
+        if grams:
+            hits = Counter()
+            for gram in grams:
+                hits.update(self.postings.get(gram, ()))
+            return {
+                doc_id: count / len(grams)
+                for doc_id, count in hits.items()
+                if count / len(grams) >= self.threshold
+            }
+        # terms shorter than one n-gram can only match as substrings
+        return {
+            doc_id: 1.0
+            for doc_id, fields in self.documents.items()
+            if any(term in value for value in fields.values())
+        }
+
+    def count(self, term):
+        term = normalize(term)
+        if not term:
+            return len(self.documents)
+        return len(self._candidates(term))
+
+    def search(self, term, limit=None):
+        term = normalize(term)
+        if not term:
+            ranked = sorted(
+                self.documents, key=lambda d: (self.documents[d]['name'], d))
+            return ranked[:limit] if limit else ranked
+
+        candidates = self._candidates(term)
+        scored = []
+        for doc_id, overlap in candidates.items():
+            fields = self.documents[doc_id]
+            score = overlap
+            for field, weight in FIELD_WEIGHTS:
+                if term in fields[field]:
+                    score += weight
+            scored.append((-score, fields['name'], doc_id))
+        scored.sort()
+
+        ranked = [doc_id for _, _, doc_id in scored]
+        return ranked[:limit] if limit else ranked
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+
+class SearchBackend(object):
+    # returns the ids of matching venues or artists, best match first, and
+    # how many match in all
+
+    def search(self, model, term, limit=None):
+        raise NotImplementedError
+
+    def count(self, model, term):
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(SearchBackend):
+    # pg_trgm for fuzzy / partial matches, tsvector for ranking;
+    # both are backed by the indexes in the search indexes migration
+
+    def _query(self, model, term, ranked=True):
+        term = term.strip()
+        query = db.session.query(model.id)
+
+        if term:
+            pattern = '%' + escape_like(term) + '%'
+            association, key = genre_association(model)
+            document = db.func.to_tsvector(
+                literal_column("'simple'"),
+                db.func.coalesce(model.name, '') + ' ' +
+                db.func.coalesce(model.city, '')
+            )
+            ts_query = db.func.plainto_tsquery(
+                literal_column("'simple'"), term)
+            genre_matches = db.session.query(key).join(
+                Genre, Genre.id == association.c.genre_id
+            ).filter(
+                or_(Genre.name.ilike(pattern), Genre.name.op('%>')(term))
+            )
+
+            query = query.filter(
+                or_(
+                    model.name.ilike(pattern),
+                    model.name.op('%>')(term),
+                    model.city.ilike(pattern),
+                    model.city.op('%>')(term),
+                    document.op('@@')(ts_query),
+                    model.id.in_(genre_matches)
+                )
+            )
+            if not ranked:
+                return query
+            query = query.order_by(
+                (
+                    db.func.coalesce(db.func.word_similarity(
+                        literal(term), model.name), 0) +
+                    db.func.coalesce(db.func.word_similarity(
+                        literal(term), model.city), 0) / 2 +
+                    db.func.ts_rank(document, ts_query)
+                ).desc(),
+                model.name,
+                model.id
+            )
+        elif ranked:
+            query = query.order_by(model.name, model.id)
+        return query
+
+    def search(self, model, term, limit=None):
+        query = self._query(model, term)
+        if limit:
+            query = query.limit(limit)
+        return [row.id for row in query]
+
+    def count(self, model, term):
+        return self._query(model, term, ranked=False).count()
+
+
+class NgramSearchBackend(SearchBackend):
+    # keeps one NgramIndex per model, built lazily from the database and
+    # refreshed from the ids touched by writes in this process.  Rebuilds
+    # run outside the lock; searches meanwhile use the previous index.
+    # Searches hold the lock, the index is updated in place under it.
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.indexes = {}
+        self.built_at = {}
+        self.building = set()
+        self.pending = defaultdict(set)
+        # bumped by full invalidations, a build that raced one is not kept
+        self.generations = defaultdict(int)
+
+    def invalidate(self, model, doc_id=None):
+        with self.lock:
+            if doc_id is None:
+                self.indexes.pop(model, None)
+                self.generations[model] += 1
+            else:
+                self.pending[model].add(doc_id)
+
+    def _load(self, model, ids=None):
+        association, key = genre_association(model)
+
+        rows = db.session.query(model.id, model.name, model.city)
+        genre_rows = db.session.query(key, Genre.name).join(
+            Genre, Genre.id == association.c.genre_id)
+        if ids is not None:
+            rows = rows.filter(model.id.in_(ids))
+            genre_rows = genre_rows.filter(key.in_(ids))
+
+        genres = defaultdict(list)
+        for doc_id, genre in genre_rows:
+            genres[doc_id].append(genre)
+        return [(row.id, row.name, row.city, genres[row.id]) for row in rows]
+
+    def _build(self, model):
+        index = NgramIndex()
+        for doc in self._load(model):
+            index.add(*doc)
+        return index
+
+    def _index(self, model):
+        with self.lock:
+            index = self.indexes.get(model)
+            expired = (
+                index is not None and self.ttl and
+                time.monotonic() - self.built_at[model] > self.ttl
+            )
+            rebuild = (index is None or expired) and \
+                model not in self.building
+            ids = None
+            if rebuild:
+                # writes from here on are applied to the new index later
+                self.building.add(model)
+                self.pending.pop(model, None)
+                generation = self.generations[model]
+            elif index is not None and self.pending.get(model):
+                ids = self.pending.pop(model)
+
+        if rebuild:
+            try:
+                index = self._build(model)
+            finally:
+                with self.lock:
+                    self.building.discard(model)
+            with self.lock:
+                if self.generations[model] == generation:
+                    self.indexes[model] = index
+                    self.built_at[model] = time.monotonic()
+        elif index is None:
+            # the first build of another request is still running
+            index = self._build(model)
+        elif ids:
+            docs = self._load(model, ids)
+            with self.lock:
+                for doc_id in ids:
+                    index.remove(doc_id)
+                for doc in docs:
+                    index.add(*doc)
+        return index
+
+    def search(self, model, term, limit=None):
+        index = self._index(model)
+        with self.lock:
+            return index.search(term, limit)
+
+    def count(self, model, term):
+        index = self._index(model)
+        with self.lock:
+            return index.count(term)
+
+
+# ----------------------------------------------------------------------------#
+# Interface.
+# ----------------------------------------------------------------------------#
+
+
+_postgres_backend = PostgresSearchBackend()
+_ngram_backend = None
+
+
+def get_backend():
+    # SEARCH_BACKEND is 'postgres', 'ngram' or 'auto' (pick by dialect)
+    global _ngram_backend
+
+    choice = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if choice == 'auto':
+        dialect = db.engine.dialect.name
+        choice = 'postgres' if dialect == 'postgresql' else 'ngram'
+
+    if choice == 'postgres':
+        return _postgres_backend
+
+    if _ngram_backend is None:
+        _ngram_backend = NgramSearchBackend(
+            ttl=current_app.config.get('SEARCH_INDEX_TTL', 300))
+    return _ngram_backend
+
+
+def _search(model, term, limit):
+    # (ranked ids, total number of matches); only counted apart when the
+    # limit cut the results
+    backend = get_backend()
+    ids = backend.search(model, term, limit)
+    if limit and len(ids) >= limit:
+        return ids, backend.count(model, term)
+    return ids, len(ids)
+
+
+def search_venues(term, limit=None):
+    return _search(Venue, term, limit)
+
+
+def search_artists(term, limit=None):
+    return _search(Artist, term, limit)
+
+
+# ----------------------------------------------------------------------------#
+# Invalidation.
+# ----------------------------------------------------------------------------#
+# Once at flush, and again after commit or rollback: a search running
+# between the flush and the commit, or in the flushing session itself, can
+# load the rows as they were or as they will never be.
+
+
+def _invalidate(keys):
+    if _ngram_backend is None:
+        return
+    for model, doc_id in keys:
+        _ngram_backend.invalidate(model, doc_id)
+
+
+def _mark_changed(mapper, connection, target):
+    key = (type(target), target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('search_keys', set()).add(key)
+    _invalidate([key])
+
+
+def _mark_genres_changed(mapper, connection, target):
+    # a renamed genre can touch any document, rebuild everything
+    keys = [(Venue, None), (Artist, None)]
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('search_keys', set()).update(keys)
+    _invalidate(keys)
+
+
+def _invalidate_finished(session):
+    _invalidate(session.info.pop('search_keys', ()))
+
+
+for _model in (Venue, Artist):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _mark_changed)
+
+event.listen(Genre, 'after_update', _mark_genres_changed)
+event.listen(Genre, 'after_delete', _mark_genres_changed)
+event.listen(Session, 'after_commit', _invalidate_finished)
+event.listen(Session, 'after_rollback', _invalidate_finished)
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+import assets
+
+
+# ----------------------------------------------------------------------------#
+# Template cache.
+# ----------------------------------------------------------------------------#
+# Compiled templates are written to TEMPLATE_BYTECODE_DIR, so a new worker
+# loads bytecode instead of parsing every template again, and all of them
+# are compiled at boot rather than on each one's first request.  Parts of a
+# page that rarely change are cached after rendering with
+#
+#   {% cache 'tile', show.artist_id, show.artist_updated_at %}
+#   ...
+#   {% endcache %}
+#
+# The key is the template, its line and the listed values.  Keyed on the
+# updated_at of what it shows, a stale fragment is never looked up again,
+# whichever process changed the row, and ages out.
+
+
+class FragmentCache(object):
+
+    def __init__(self, max_entries=5000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            body, created = entry
+            if self.ttl and time.monotonic() - created > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        with self.lock:
+            self.entries[key] = (body, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # the file's mtime keeps a template edited under auto-reload from
+        # hitting fragments of its previous version
+        try:
+            stamp = os.path.getmtime(parser.filename)
+        except (OSError, TypeError):
+            stamp = None
+        parts = [nodes.Const(parser.name), nodes.Const(stamp),
+                 nodes.Const(lineno)]
+        parts.append(parser.parse_expression())
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.Tuple(parts, 'load')]),
+            [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+            return caller()
+        body = fragment_cache.get(key)
+        if body is None:
+            body = str(caller())
+            fragment_cache.set(key, body)
+        return Markup(body)
+
+
+def assets_version():
+    # template global: changes when `flask assets build` runs
+    return assets.manifest_version()
+
+
+def precompile(app):
+    # compiles every template, from the bytecode cache when it is current;
+    # returns the number of templates
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def init_app(app):
+    # after the filters are registered, an unknown filter fails compilation
+    app.config.setdefault(
+        'TEMPLATE_BYTECODE_DIR', os.path.join(app.instance_path, 'jinja'))
+    app.config.setdefault('TEMPLATE_PRECOMPILE', True)
+    app.config.setdefault('FRAGMENT_CACHE_ENABLED', True)
+    app.config.setdefault('FRAGMENT_CACHE_SIZE', 5000)
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+
+    directory = app.config['TEMPLATE_BYTECODE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    fragment_cache.max_entries = app.config['FRAGMENT_CACHE_SIZE']
+    fragment_cache.ttl = app.config['FRAGMENT_CACHE_TTL']
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals.update(assets_version=assets_version)
+
+    if app.config['TEMPLATE_PRECOMPILE']:
+        precompile(app)
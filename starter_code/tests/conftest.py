@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+
+# ----------------------------------------------------------------------------#
+# Environment.
+# ----------------------------------------------------------------------------#
+# config.py reads the environment when app.py is imported, so the test
+# database and the on-disk caches are pointed at a temporary directory
+# first.  Every test starts from empty tables and empty in-process caches.
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix='fyyur-tests-')
+
+os.environ['DEBUG'] = ''
+os.environ['SQLALCHEMY_DATABASE_URI'] = \
+    'sqlite:///' + os.path.join(WORKDIR, 'fyyur.db')
+os.environ['SQLALCHEMY_TRACK_MODIFICATIONS'] = ''
+os.environ['SQLALCHEMY_REPLICA_URIS'] = ''
+os.environ['TEMPLATE_BYTECODE_DIR'] = ''
+os.environ['TEMPLATE_PRECOMPILE'] = 'False'
+os.environ['THUMBNAIL_DIR'] = os.path.join(WORKDIR, 'thumbnails')
+os.environ['SQL_REPEAT_THRESHOLD'] = '1000'
+sys.path.insert(0, ROOT)
+
+from app import app as fyyur  # noqa: E402
+from models import db  # noqa: E402
+
+
+def reset_caches():
+    import genres
+    import geo
+    import search
+    import thumbnails
+    from page_cache import page_cache
+    from template_cache import fragment_cache
+
+    page_cache.clear()
+    fragment_cache.clear()
+    genres.invalidate_genre_cache()
+    search._ngram_backend = None
+    geo._grid_backend = None
+    thumbnails._cache = None
+
+
+@pytest.fixture
+def app():
+    fyyur.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with fyyur.app_context():
+        db.drop_all()
+        db.create_all()
+        reset_caches()
+        yield fyyur
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_queries(app):
+    # with count_queries() as queries: ...; len(queries) statements ran
+    @contextmanager
+    def counting():
+        counter = QueryCounter()
+
+        def record(conn, cursor, statement, *args):
+            counter.statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield counter
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counting
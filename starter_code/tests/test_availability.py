@@ -0,0 +1,91 @@
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from availability import availability_filters, date_range
+from models import db, Venue, Artist, Show
+
+VENUES = 500
+WEEKS = 105
+FIRST_DAY = datetime(2026, 1, 5)
+# ~10ms on a laptop; the budget catches a plan that scans every show per
+# venue, which takes seconds at this size
+QUERY_BUDGET = 0.5
+
+
+@pytest.fixture
+def booked_venues(app):
+    # every venue plays one evening a week, venue i on weekday i % 7, over
+    # two years: ~50k shows
+    with db.engine.begin() as connection:
+        connection.execute(Artist.__table__.insert(), [
+            {'name': 'House Band', 'city': 'Austin', 'state': 'TX'}])
+        connection.execute(Venue.__table__.insert(), [
+            {'id': i, 'name': f'Venue {i}', 'city': f'City {i % 10}',
+             'state': 'TX', 'seeking_talent': i % 2 == 0}
+            for i in range(1, VENUES + 1)
+        ])
+        connection.execute(Show.__table__.insert(), [
+            {'venue_id': i, 'artist_id': 1,
+             'start_time': FIRST_DAY + timedelta(
+                 days=7 * week + i % 7, hours=20),
+             'end_time': FIRST_DAY + timedelta(
+                 days=7 * week + i % 7, hours=23)}
+            for i in range(1, VENUES + 1) for week in range(WEEKS)
+        ])
+
+
+def available(first, last=None, **filters):
+    start, end = date_range(first, last)
+    query = db.session.query(Venue.id).filter(
+        *availability_filters(start, end, **filters))
+    started = time.perf_counter()
+    ids = {venue_id for venue_id, in query}
+    return ids, time.perf_counter() - started
+
+
+def test_availability_excludes_booked_venues(booked_venues):
+    # FIRST_DAY is weekday 0 of the pattern
+    day = FIRST_DAY.date() + timedelta(weeks=30, days=3)
+    ids, elapsed = available(day)
+    assert ids == {i for i in range(1, VENUES + 1) if i % 7 != 3}
+    assert elapsed < QUERY_BUDGET
+
+    ids, elapsed = available(day, day + timedelta(days=1))
+    assert ids == {i for i in range(1, VENUES + 1) if i % 7 not in (3, 4)}
+    assert elapsed < QUERY_BUDGET
+
+    ids, elapsed = available(day, city='City 1', seeking_talent=True)
+    assert ids == {
+        i for i in range(1, VENUES + 1)
+        if i % 7 != 3 and i % 10 == 1 and i % 2 == 0
+    }
+    assert elapsed < QUERY_BUDGET
+
+    # past the last booked week everything is open
+    ids, elapsed = available(date(2030, 1, 1))
+    assert len(ids) == VENUES
+    assert elapsed < QUERY_BUDGET
+
+
+def test_availability_probes_the_venue_index(booked_venues):
+    start, end = date_range(date(2026, 6, 1))
+    query = db.session.query(Venue.id).filter(
+        *availability_filters(start, end))
+    statement = query.statement.compile(
+        db.engine, compile_kwargs={'literal_binds': True})
+    plan = ' '.join(
+        str(row[-1]) for row in db.session.execute(
+            text(f'EXPLAIN QUERY PLAN {statement}')))
+    assert 'ix_shows_venue_id_start_time' in plan
+
+
+def test_available_venues_page(client, booked_venues):
+    # 212 days after FIRST_DAY: the venues on weekday 2 are booked
+    response = client.get('/venues/available?from=2026-08-05&city=City 3')
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert '/venues/3"' in body
+    assert '/venues/23"' not in body
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+from bookings import find_conflicts
+from models import db, Venue, Artist, Show, MAX_SHOW_DURATION
+
+START = datetime(2027, 3, 1, 20, 0)
+
+
+def add_venue_and_artists():
+    venue = Venue(name='The Hall', city='Austin', state='TX')
+    artists = [Artist(name=f'Act {i}', city='Austin', state='TX')
+               for i in range(2)]
+    db.session.add_all([venue] + artists)
+    db.session.commit()
+    return venue.id, [artist.id for artist in artists]
+
+
+def list_show(client, venue_id, artist_id, start, end=None):
+    data = {'venue_id': venue_id, 'artist_id': artist_id,
+            'start_time': f'{start:%Y-%m-%d %H:%M:%S}'}
+    if end is not None:
+        data['end_time'] = f'{end:%Y-%m-%d %H:%M:%S}'
+    return client.post('/shows/create', data=data).get_data(as_text=True)
+
+
+def test_refuses_a_show_booked_by_another_process(client):
+    venue_id, (first, second) = add_venue_and_artists()
+    # committed elsewhere, on another connection
+    with db.engine.begin() as connection:
+        connection.execute(Show.__table__.insert(), {
+            'venue_id': venue_id, 'artist_id': first,
+            'start_time': START, 'end_time': START + timedelta(hours=3)})
+
+    body = list_show(client, venue_id, second, START + timedelta(hours=1))
+    assert 'it overlaps the show on 2027-03-01 20:00' in body
+    assert Show.query.count() == 1
+
+    body = list_show(client, venue_id, second, START + timedelta(hours=3))
+    assert 'Show was successfully listed!' in body
+    assert Show.query.count() == 2
+
+
+def test_flashes_a_show_ending_before_it_starts(client):
+    venue_id, (artist_id, _) = add_venue_and_artists()
+    body = list_show(client, venue_id, artist_id, START,
+                     START - timedelta(hours=1))
+    assert 'it has to end after it starts' in body
+    assert 'An error occurred' not in body
+    assert Show.query.count() == 0
+
+
+def test_flashes_a_show_lasting_too_long(client):
+    venue_id, (artist_id, _) = add_venue_and_artists()
+    body = list_show(client, venue_id, artist_id, START,
+                     START + MAX_SHOW_DURATION + timedelta(minutes=1))
+    assert 'it can last at most 24 hours' in body
+    assert Show.query.count() == 0
+
+
+def test_finds_the_longest_show_started_before(app):
+    venue_id, (first, second) = add_venue_and_artists()
+    db.session.add(Show(venue_id=venue_id, artist_id=first,
+                        start_time=START - MAX_SHOW_DURATION,
+                        end_time=START))
+    db.session.commit()
+    assert len(find_conflicts(venue_id, second, START - timedelta(minutes=1),
+                              START + timedelta(hours=1))) == 1
+    assert find_conflicts(venue_id, second, START,
+                          START + timedelta(hours=1)) == []
@@ -0,0 +1,21 @@
+from genres import genre_ids, invalidate_genre_cache, resolve_genres
+from models import db, Artist, Genre
+
+
+def test_resolve_genres_reloads_a_stale_cache(app):
+    genre_ids(['Jazz', 'Blues'])
+    # deleted without the mapper events, as another process would
+    with db.engine.begin() as connection:
+        connection.execute(
+            Genre.__table__.delete().where(Genre.name == 'Jazz'))
+
+    genres = resolve_genres(['Jazz', 'Blues'])
+    assert [genre.name for genre in genres] == ['Jazz', 'Blues']
+
+
+def test_resolve_genres_with_pending_genre_changes(app):
+    # the cache load autoflushes the pending artist, which updates the
+    # genre's collection and invalidates the cache
+    db.session.add(Artist(name='Trio', genres=resolve_genres(['Jazz'])))
+    invalidate_genre_cache()
+    assert [genre.name for genre in resolve_genres(['Jazz'])] == ['Jazz']
@@ -0,0 +1,62 @@
+import geo
+from deletes import delete_entities
+from models import db, Venue
+
+AUSTIN = (30.2672, -97.7431)
+
+
+def near_austin():
+    return [venue_id for venue_id, _ in geo.venues_near(*AUSTIN, 5000, 10)]
+
+
+def add_venue(name, located=True):
+    venue = Venue(name=name, city='Austin', state='TX')
+    if located:
+        venue.latitude, venue.longitude = AUSTIN
+    db.session.add(venue)
+    db.session.commit()
+    return venue.id
+
+
+def test_bulk_deleted_venues_leave_the_grid(app):
+    kept, deleted = add_venue('Kept'), add_venue('Deleted')
+    assert sorted(near_austin()) == [kept, deleted]
+
+    assert delete_entities(db.session, 'venue', [deleted]) == [deleted]
+    db.session.commit()
+    assert near_austin() == [kept]
+
+
+def test_geocoded_venues_join_the_grid(app, tmp_path):
+    venue_id = add_venue('Unplaced', located=False)
+    assert near_austin() == []
+
+    gazetteer = tmp_path / 'places.txt'
+    gazetteer.write_text(
+        'USPS\tNAME\tINTPTLAT\tINTPTLONG\n'
+        'TX\tAustin city\t30.2672\t-97.7431\n')
+    result = app.test_cli_runner().invoke(
+        args=['geo', 'geocode', str(gazetteer)])
+    assert '1 venues geocoded' in result.output
+    assert near_austin() == [venue_id]
+
+
+def test_rolled_back_moves_leave_the_grid(app):
+    venue_id = add_venue('Moving')
+    venue = db.session.get(Venue, venue_id)
+    venue.latitude, venue.longitude = 0.0, 0.0
+    db.session.flush()
+    # searched inside the flushing transaction, the moved row is loaded
+    assert near_austin() == []
+    db.session.rollback()
+    assert near_austin() == [venue_id]
+
+
+def test_searching_with_a_pending_venue(app):
+    located = add_venue('Located')
+    # flushed by the grid's load, which invalidates the grid
+    db.session.add(Venue(name='Pending', city='Austin', state='TX',
+                         latitude=AUSTIN[0], longitude=AUSTIN[1]))
+    assert len(near_austin()) == 2
+    db.session.rollback()
+    assert near_austin() == [located]
@@ -0,0 +1,91 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from importer import import_file, read_checkpoint
+from models import db, Venue, Artist, Show
+
+
+def write_rows(tmp_path, name, rows):
+    path = tmp_path / name
+    path.write_text('\n'.join(json.dumps(row) for row in rows))
+    return str(path)
+
+
+def venue_rows(count, ids=False):
+    rows = [
+        {'name': f'Venue {i}', 'city': 'Austin', 'state': 'TX',
+         'address': f'{i} Congress Ave', 'genres': ['Jazz'],
+         'facebook_link': 'https://www.facebook.com/venue'}
+        for i in range(1, count + 1)
+    ]
+    if ids:
+        for i, row in enumerate(rows, start=1):
+            row['id'] = i
+    return rows
+
+
+def test_dry_run_writes_nothing(app, tmp_path):
+    path = write_rows(tmp_path, 'venues.jsonl', venue_rows(5))
+    report = import_file('venues', path, batch_size=2, dry_run=True)
+    assert (report.read, report.imported, report.invalid) == (5, 5, 0)
+    assert Venue.query.count() == 0
+
+    start = f'{datetime.today() + timedelta(days=1):%Y-%m-%d %H:%M:%S}'
+    path = write_rows(tmp_path, 'shows.jsonl', [
+        {'venue_id': 1, 'artist_id': 1, 'start_time': start}])
+    report = import_file('shows', path, dry_run=True)
+    assert report.imported == 0
+    assert report.errors == [(1, {'row': ['unknown venue_id']})]
+    assert Show.query.count() == 0
+
+
+def test_resumes_from_the_checkpoint(app, tmp_path):
+    path = write_rows(tmp_path, 'venues.jsonl', venue_rows(10))
+    checkpoint = str(tmp_path / 'venues.checkpoint')
+
+    def crash_after_two_batches(report):
+        if report.read == 6:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        import_file('venues', path, batch_size=3, checkpoint=checkpoint,
+                    progress=crash_after_two_batches)
+    assert read_checkpoint(checkpoint) == 6
+    assert Venue.query.count() == 6
+
+    report = import_file('venues', path, batch_size=3, checkpoint=checkpoint)
+    assert (report.skipped, report.read, report.imported) == (6, 4, 4)
+    names = [name for name, in db.session.query(Venue.name)]
+    assert sorted(names) == sorted(f'Venue {i}' for i in range(1, 11))
+    assert read_checkpoint(checkpoint) == 0
+
+
+def test_rows_must_all_have_ids_or_none(app, tmp_path):
+    rows = venue_rows(4, ids=True)
+    del rows[1]['id']
+    path = write_rows(tmp_path, 'venues.jsonl', rows)
+    report = import_file('venues', path)
+    assert report.imported == 3
+    assert [line for line, _ in report.errors] == [2]
+    assert sorted(id for id, in db.session.query(Venue.id)) == [1, 3, 4]
+
+    rows = venue_rows(3)
+    rows[2]['id'] = 100
+    path = write_rows(tmp_path, 'more.jsonl', rows)
+    report = import_file('venues', path)
+    assert [line for line, _ in report.errors] == [3]
+    assert sorted(id for id, in db.session.query(Venue.id)) == [1, 3, 4, 5, 6]
+
+
+def test_only_checkboxes_read_no_as_false(app, tmp_path):
+    path = write_rows(tmp_path, 'artists.jsonl', [
+        {'name': 'No', 'city': 'Austin', 'state': 'TX', 'phone': '0',
+         'genres': ['Punk'], 'facebook_link': 'https://www.facebook.com/no',
+         'seeking_venue': 'no'}])
+    report = import_file('artists', path)
+    assert report.errors == []
+    artist = Artist.query.one()
+    assert (artist.name, artist.phone, artist.seeking_venue) == (
+        'No', '0', False)
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import matchmaking
+from genres import resolve_genres
+from models import db, Venue, Artist, MatchState, artist_genre
+
+
+def update(full=False):
+    with db.engine.begin() as connection:
+        return matchmaking.update(connection, 5, full)
+
+
+def matched_artists(venue_id):
+    return [row['id'] for row in matchmaking.matches('venue', venue_id)]
+
+
+def test_first_run_creates_and_locks_the_state_row(app):
+    assert MatchState.query.count() == 0
+    assert update() == {'venue': 0, 'artist': 0}
+    assert MatchState.query.count() == 1
+    assert update() == {'venue': 0, 'artist': 0}
+    assert MatchState.query.count() == 1
+
+
+def test_rows_committed_after_a_run_started_are_not_skipped(app):
+    jazz = resolve_genres(['Jazz'])
+    venue = Venue(name='The Hall', city='Austin', state='TX',
+                  seeking_talent=True, genres=jazz)
+    db.session.add(venue)
+    db.session.commit()
+
+    # an artist flushed before the run, its transaction commits after it
+    flushed = datetime.utcnow()
+    update()
+    assert matched_artists(venue.id) == []
+    with db.engine.begin() as connection:
+        artist_id = connection.execute(Artist.__table__.insert().values(
+            name='Late Act', city='Austin', state='TX', seeking_venue=True,
+            updated_at=flushed)).inserted_primary_key[0]
+        connection.execute(artist_genre.insert().values(
+            artist_id=artist_id, genre_id=jazz[0].id))
+
+    counts = update()
+    assert counts['artist'] >= 1
+    assert matched_artists(venue.id) == [artist_id]
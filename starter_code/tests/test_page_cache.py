@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+from models import db, Venue, Artist, Show
+from page_cache import page_cache
+
+
+def add_venue_with_show():
+    venue = Venue(name='The Hall', city='Austin', state='TX')
+    artist = Artist(name='Touring Act', city='Austin', state='TX')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add(Show(venue_id=venue.id, artist_id=artist.id,
+                        start_time=datetime.today() + timedelta(days=1)))
+    db.session.commit()
+    return venue.id, artist.id
+
+
+def write_elsewhere(statement):
+    # as another worker or a CLI command would: no mapper events, no
+    # in-process invalidation
+    with db.engine.begin() as connection:
+        connection.execute(statement)
+
+
+def test_pages_follow_writes_of_other_processes(client):
+    venue_id, artist_id = add_venue_with_show()
+    path = f'/venues/{venue_id}'
+    first = client.get(path)
+    assert 'Touring Act' in first.get_data(as_text=True)
+    assert client.get(path, headers={
+        'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # a renamed artist on the page, the row's updated_at moves
+    write_elsewhere(Artist.__table__.update().where(
+        Artist.id == artist_id).values(name='Renamed Act'))
+    second = client.get(path)
+    body = second.get_data(as_text=True)
+    assert 'Renamed Act' in body and 'Touring Act' not in body
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert client.get(path, headers={
+        'If-None-Match': first.headers['ETag']}).status_code == 200
+
+    # a deleted show leaves no updated_at behind, the count catches it
+    write_elsewhere(Show.__table__.delete())
+    assert 'Renamed Act' not in client.get(path).get_data(as_text=True)
+
+
+def test_cache_holds_one_entry_per_page(client):
+    ids = [add_venue_with_show()[0] for _ in range(3)]
+    for _ in range(2):
+        for venue_id in ids:
+            assert client.get(f'/venues/{venue_id}').status_code == 200
+    assert set(page_cache.entries) == {('venue', i) for i in ids}
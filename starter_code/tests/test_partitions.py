@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta
+
+from models import db, Venue, Artist, Show, show_archive
+from partitions import archive_shows
+
+NOW = datetime(2027, 3, 1, 20, 0)
+
+
+def add_shows(starts):
+    venue = Venue(name='The Hall', city='Austin', state='TX')
+    artist = Artist(name='The Act', city='Austin', state='TX')
+    db.session.add_all([venue, artist])
+    db.session.flush()
+    db.session.add_all([
+        Show(venue_id=venue.id, artist_id=artist.id, start_time=start,
+             end_time=start + timedelta(hours=2)) for start in starts])
+    db.session.commit()
+
+
+def test_archives_the_ended_shows_in_batches(app):
+    past = [NOW - timedelta(days=day) for day in range(1, 6)]
+    add_shows(past + [NOW + timedelta(days=1)])
+
+    with db.engine.begin() as connection:
+        assert archive_shows(connection, NOW, batch=2) == 5
+
+    assert [show.start_time for show in Show.query] == [
+        NOW + timedelta(days=1)]
+    archived = db.session.execute(
+        show_archive.select().order_by(show_archive.c.start_time)).all()
+    assert [row.start_time for row in archived] == sorted(past)
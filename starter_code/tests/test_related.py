@@ -0,0 +1,123 @@
+from datetime import datetime
+
+import pytest
+
+import related
+from genres import resolve_genres
+from models import db, Venue, Artist, RelatedArtistQueue, show_archive
+
+K = 2
+
+
+def add_artists(genres_by_name):
+    # genres first, as the views do: a pending artist would be flushed
+    # while missing genres are inserted on another connection
+    resolved = {
+        name: resolve_genres(genres)
+        for name, genres in genres_by_name.items()
+    }
+    artists = {
+        name: Artist(name=name, city='Austin', state='TX', genres=genres)
+        for name, genres in resolved.items()
+    }
+    db.session.add_all(artists.values())
+    db.session.commit()
+    return {name: artist.id for name, artist in artists.items()}
+
+
+def run(function):
+    with db.engine.begin() as connection:
+        return function(connection, K)
+
+
+def related_names(artist_id):
+    return [row['name'] for row in related.related_artists(artist_id)]
+
+
+def set_genres(artist_id, genres):
+    artist = db.session.get(Artist, artist_id)
+    artist.genres = resolve_genres(genres)
+    db.session.commit()
+
+
+def test_update_reaches_artists_a_change_moves(app):
+    ids = add_artists({
+        'Jazz Trio': ['Jazz', 'Blues'],
+        'Blues Duo': ['Blues', 'Jazz'],
+        'Folk Solo': ['Folk'],
+        'Folk Band': ['Folk', 'Country'],
+        'Punk Four': ['Punk'],
+    })
+    run(related.rebuild)
+    assert related_names(ids['Jazz Trio']) == ['Blues Duo']
+    assert related_names(ids['Folk Solo']) == ['Folk Band']
+
+    # only Punk Four is queued; Jazz Trio never listed it, but it enters
+    # Jazz Trio's list
+    set_genres(ids['Punk Four'], ['Jazz', 'Blues'])
+    assert RelatedArtistQueue.query.count() == 1
+    run(related.update)
+    assert set(related_names(ids['Jazz Trio'])) == {'Blues Duo', 'Punk Four'}
+
+    # Folk Band leaves Folk Solo's list, Folk Solo only listed it
+    set_genres(ids['Folk Band'], ['Punk'])
+    run(related.update)
+    assert related_names(ids['Folk Solo']) == []
+
+
+def test_venue_changes_queue_archived_performers(app):
+    ids = add_artists({'Old Act': ['Jazz'], 'New Act': ['Jazz']})
+    venue = Venue(name='The Hall', city='Austin', state='TX')
+    db.session.add(venue)
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(show_archive.insert(), {
+            'id': 1, 'venue_id': venue.id, 'artist_id': ids['Old Act'],
+            'start_time': datetime(2020, 1, 1, 20),
+            'end_time': datetime(2020, 1, 1, 23),
+            'updated_at': datetime(2020, 1, 1)})
+    run(related.rebuild)
+
+    venue.genres = resolve_genres(['Blues'])
+    db.session.commit()
+    queued = [row.artist_id for row in RelatedArtistQueue.query]
+    assert queued == [ids['Old Act']]
+
+
+def stored_rows():
+    return db.session.execute(
+        related.related.select().order_by('artist_id', 'rank')).all()
+
+
+def test_update_loads_only_the_neighbours_of_the_changes(app):
+    ids = add_artists({
+        'Jazz Trio': ['Jazz', 'Blues'],
+        'Blues Duo': ['Blues'],
+        'Folk Solo': ['Folk'],
+        'Folk Band': ['Folk', 'Country'],
+    })
+    venue = Venue(name='The Hall', city='Austin', state='TX',
+                  genres=resolve_genres(['Soul']))
+    db.session.add(venue)
+    db.session.commit()
+    with db.engine.begin() as connection:
+        connection.execute(show_archive.insert(), {
+            'id': 1, 'venue_id': venue.id, 'artist_id': ids['Jazz Trio'],
+            'start_time': datetime(2020, 1, 1, 20),
+            'end_time': datetime(2020, 1, 1, 23),
+            'updated_at': datetime(2020, 1, 1)})
+    run(related.rebuild)
+    set_genres(ids['Blues Duo'], ['Blues', 'Soul'])
+
+    with db.engine.connect() as connection:
+        everyone = related.load_vectors(connection)
+        some = related.load_vectors(
+            connection, related.neighbours([ids['Blues Duo']]))
+    assert set(some) == {ids['Jazz Trio'], ids['Blues Duo']}
+    for artist_id, vector in some.items():
+        assert vector == pytest.approx(everyone[artist_id])
+
+    run(related.update)
+    updated = stored_rows()
+    run(related.rebuild)
+    assert updated == stored_rows()
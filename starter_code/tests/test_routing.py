@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from conftest import WORKDIR
+from models import db, Venue
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    # a second database file standing in for a replica that has not
+    # caught up: same ids, other names
+    uri = 'sqlite:///' + os.path.join(WORKDIR, 'replica.db')
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_BINDS', {'replica_0': uri})
+    monkeypatch.setitem(app.config, 'SQLALCHEMY_REPLICA_BINDS', ['replica_0'])
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_ENABLED', False)
+    engine = db.get_engine(app, 'replica_0')
+    db.Model.metadata.drop_all(bind=engine)
+    db.Model.metadata.create_all(bind=engine)
+
+    db.session.add(Venue(name='Primary Hall', city='Austin', state='TX'))
+    db.session.commit()
+    with engine.begin() as connection:
+        connection.execute(Venue.__table__.insert(), {
+            'name': 'Replica Hall', 'city': 'Austin', 'state': 'TX'})
+    return engine
+
+
+def test_reads_go_to_the_replica(client, replica):
+    body = client.get('/venues/1').get_data(as_text=True)
+    assert 'Replica Hall' in body and 'Primary Hall' not in body
+    # a read_only POST view
+    body = client.post(
+        '/venues/search', data={'search_term': 'hall'}).get_data(as_text=True)
+    assert 'Replica Hall' in body
+
+
+def test_writes_stick_the_client_to_the_primary(client, replica):
+    response = client.post('/venues/create', data={
+        'name': 'New Hall', 'city': 'Austin', 'state': 'TX',
+        'address': '1 Congress Ave', 'genres': ['Jazz'],
+        'facebook_link': 'https://www.facebook.com/newhall',
+    })
+    assert response.status_code == 200
+    assert db.session.query(Venue).filter_by(name='New Hall').count() == 1
+
+    body = client.get('/venues/1').get_data(as_text=True)
+    assert 'Primary Hall' in body
+
+    with client.session_transaction() as session:
+        session['_primary_until'] = 0
+    assert 'Replica Hall' in client.get('/venues/1').get_data(as_text=True)
+    # another client never wrote
+    other = client.application.test_client()
+    assert 'Replica Hall' in other.get('/venues/1').get_data(as_text=True)
+
+
+def test_edit_forms_read_the_primary(client, replica):
+    body = client.get('/venues/1/edit').get_data(as_text=True)
+    assert 'Primary Hall' in body and 'Replica Hall' not in body
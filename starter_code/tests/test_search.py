@@ -0,0 +1,41 @@
+from sqlalchemy.dialects import postgresql
+
+import search
+from models import db, Venue
+
+
+def test_count_is_not_capped_by_the_result_limit(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'SEARCH_RESULT_LIMIT', 5)
+    db.session.add_all([
+        Venue(name=f'Blue Note {i}', city='Austin', state='TX')
+        for i in range(12)
+    ])
+    db.session.commit()
+
+    body = client.post(
+        '/venues/search', data={'search_term': 'blue note'}
+    ).get_data(as_text=True)
+    assert 'Number of search results for "blue note": 12' in body
+    assert body.count('Blue Note ') == 5
+
+
+def test_rolled_back_rows_leave_the_index(app):
+    db.session.add(Venue(name='Elephant Room', city='Austin', state='TX'))
+    db.session.commit()
+    assert search.search_venues('elephant')[1] == 1
+
+    venue = Venue(name='Elephant Gardens', city='Austin', state='TX')
+    db.session.add(venue)
+    db.session.flush()
+    # searched inside the flushing transaction, the pending row is loaded
+    assert search.search_venues('elephant')[1] == 2
+    db.session.rollback()
+    assert search.search_venues('elephant')[1] == 1
+
+
+def test_postgres_ranks_venues_without_a_city(app):
+    # word_similarity of a NULL city is NULL, which sorts first under DESC
+    query = search.PostgresSearchBackend()._query(Venue, 'blue')
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+    order = sql[sql.index('ORDER BY'):]
+    assert order.count('coalesce(word_similarity(') == 2
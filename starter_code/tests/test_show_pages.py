@@ -0,0 +1,72 @@
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+
+from app import DATETIME_FORMATS, format_datetime
+from models import db, Venue, Artist, Show
+
+SHOW_COUNT = 10000
+# generous against the ~1s a 10k-show page takes on a laptop; catches
+# a return to per-show queries or per-call pattern parsing
+RENDER_BUDGET = 5.0
+
+
+def add_shows(count):
+    artist = Artist(name='Touring Act', city='Austin', state='TX')
+    venue = Venue(name='The Hall', city='Austin', state='TX')
+    db.session.add_all([artist, venue])
+    db.session.commit()
+    # half past, half upcoming, one a day so none overlap
+    start = datetime.today() - timedelta(days=count // 2)
+    with db.engine.begin() as connection:
+        connection.execute(Show.__table__.insert(), [
+            {'venue_id': venue.id, 'artist_id': artist.id,
+             'start_time': start + timedelta(days=i),
+             'end_time': start + timedelta(days=i, hours=3)}
+            for i in range(count)
+        ])
+    return artist, venue
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def test_format_datetime_takes_datetimes():
+    value = datetime(2026, 5, 21, 21, 30)
+    assert format_datetime(value) == format_datetime(value.isoformat())
+    assert format_datetime(value, 'full') == babel.dates.format_datetime(
+        value, DATETIME_FORMATS['full'], locale='en')
+
+
+def test_format_datetime_is_not_slower_than_babel():
+    value = datetime(2026, 5, 21, 21, 30)
+
+    def ours():
+        for _ in range(SHOW_COUNT):
+            format_datetime(value, 'full')
+
+    def babels():
+        for _ in range(SHOW_COUNT):
+            babel.dates.format_datetime(
+                value, DATETIME_FORMATS['full'], locale='en')
+
+    assert best_of(3, ours) < best_of(3, babels)
+
+
+def test_10k_show_pages_render_within_budget(client):
+    artist, venue = add_shows(SHOW_COUNT)
+    for path in (f'/artists/{artist.id}', f'/venues/{venue.id}'):
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200
+        # every show's start time is rendered through the filter
+        assert response.get_data(as_text=True).count('<h6>') >= SHOW_COUNT
+        assert elapsed < RENDER_BUDGET, f'{path} took {elapsed:.2f}s'
@@ -0,0 +1,108 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from models import db, Venue
+
+SVG = (b'<svg xmlns="http://www.w3.org/2000/svg">'
+       b'<script>alert(1)</script></svg>')
+
+
+def png(size):
+    output = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(output, 'PNG')
+    return output.getvalue()
+
+
+class Origin(BaseHTTPRequestHandler):
+    files = {
+        '/wide.png': ('image/png', png((1000, 500))),
+        '/tall.png': ('image/png', png((300, 1200))),
+        '/evil.svg': ('image/svg+xml', SVG),
+        '/fake.png': ('image/png', b'<html>not an image</html>'),
+    }
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        mimetype, body = self.files[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', mimetype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def origin():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Origin)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def image_url(origin, path):
+    url = f'http://127.0.0.1:{origin.server_address[1]}{path}'
+    db.session.add(Venue(name=path, city='Austin', state='TX',
+                         image_link=url))
+    db.session.commit()
+    return url
+
+
+def get_thumbnail(client, size, url):
+    return client.get('/thumbnails/' + size, query_string={'src': url})
+
+
+@pytest.fixture
+def allow_private(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'THUMBNAIL_ALLOW_PRIVATE', True)
+
+
+@pytest.mark.parametrize('path, sizes', [
+    ('/wide.png', {'small': (160, 80), 'medium': (400, 200),
+                   'large': (800, 400)}),
+    ('/tall.png', {'small': (40, 160), 'medium': (100, 400),
+                   'large': (200, 800)}),
+])
+def test_scales_into_the_size_box(client, origin, allow_private, path,
+                                  sizes):
+    url = image_url(origin, path)
+    for size, dimensions in sizes.items():
+        response = get_thumbnail(client, size, url)
+        assert response.status_code == 200
+        assert response.mimetype == 'image/jpeg'
+        assert response.headers['X-Content-Type-Options'] == 'nosniff'
+        assert Image.open(io.BytesIO(response.data)).size == dimensions
+    # every size was stored from the one fetch
+    assert origin.requests == [path]
+
+
+@pytest.mark.parametrize('path', ['/evil.svg', '/fake.png'])
+def test_serves_only_raster_images(client, origin, allow_private, path):
+    response = get_thumbnail(client, 'small', image_url(origin, path))
+    assert response.status_code == 200
+    assert b'<script>' not in response.data
+    assert b'<html>' not in response.data
+    assert response.cache_control.max_age == \
+        client.application.config['THUMBNAIL_RETRY_AFTER']
+
+
+def test_refuses_private_addresses(client, origin):
+    assert not client.application.config['THUMBNAIL_ALLOW_PRIVATE']
+    response = get_thumbnail(client, 'small', image_url(origin, '/wide.png'))
+    assert response.mimetype == 'image/svg+xml'
+    assert origin.requests == []
+
+
+def test_only_fetches_image_links_in_use(client, origin, allow_private):
+    url = f'http://127.0.0.1:{origin.server_address[1]}/wide.png'
+    assert get_thumbnail(client, 'small', url).status_code == 404
+    assert origin.requests == []
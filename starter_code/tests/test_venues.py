@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from models import db, Venue, Artist, Show
+
+# /venues reads the area summary, /areas/<state>/<city> one grouped query;
+# neither may grow with the number of venues or shows
+QUERY_BUDGET = 3
+
+
+def add_venues(count, cities=20):
+    artist = Artist(name='Touring Act', city='Austin', state='TX')
+    venues = [
+        Venue(name=f'Venue {i}', city=f'City {i % cities}', state='TX')
+        for i in range(count)
+    ]
+    db.session.add_all(venues + [artist])
+    db.session.flush()
+    start = datetime.today() + timedelta(days=1)
+    db.session.add_all([
+        Show(venue_id=venue.id, artist_id=artist.id,
+             start_time=start + timedelta(days=i))
+        for i, venue in enumerate(venues)
+    ])
+    db.session.commit()
+
+
+def test_venues_query_budget(client, count_queries):
+    add_venues(20)
+    with count_queries() as small:
+        response = client.get('/venues')
+    assert response.status_code == 200
+
+    add_venues(500)
+    with count_queries() as large:
+        response = client.get('/venues')
+    assert response.status_code == 200
+
+    assert len(small) <= QUERY_BUDGET
+    assert len(large) == len(small)
+
+
+def test_area_venues_counts_upcoming_shows(client, count_queries):
+    add_venues(200, cities=2)
+    with count_queries() as queries:
+        response = client.get('/areas/TX/City 1')
+    assert response.status_code == 200
+    assert len(queries) <= QUERY_BUDGET
+
+    body = response.get_data(as_text=True)
+    assert body.count('/venues/') >= 100
+    assert client.get('/areas/TX/Nowhere').status_code == 404
+
+
+def test_venues_lists_area_counts(client):
+    add_venues(30, cities=3)
+    body = client.get('/venues').get_data(as_text=True)
+    for city in ('City 0', 'City 1', 'City 2'):
+        assert city in body
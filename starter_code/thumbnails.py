@@ -0,0 +1,347 @@
+import hashlib
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.request
+from urllib.parse import urlparse
+
+from flask import abort, current_app, request, send_file, url_for
+from models import db, Venue, Artist
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# ----------------------------------------------------------------------------#
+# Thumbnails.
+# ----------------------------------------------------------------------------#
+# /thumbnails/<size>?src=<image_link> fetches an image_link once, scales it
+# to the size's bounding box (with Pillow installed, the original is kept
+# otherwise) and stores the result on disk under the hash of the original's
+# bytes.  Files are touched on every hit and the least recently used ones
+# are removed once THUMBNAIL_CACHE_BYTES is exceeded.  Only urls some venue
+# or artist uses are fetched, so the route is not an open proxy, and only
+# from public addresses unless THUMBNAIL_ALLOW_PRIVATE is set.  SVG, which
+# can carry scripts, is not accepted: everything served from here is a
+# raster image of the type it is served as.
+
+
+SIZES = {
+    'small': (160, 160),
+    'medium': (400, 400),
+    'large': (800, 800),
+}
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+MIMETYPES = {extension: mimetype for mimetype, extension in EXTENSIONS.items()}
+
+# shown while an origin is down, cached briefly so it is retried
+PLACEHOLDER = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 4 3">'
+    b'<rect width="4" height="3" fill="#ddd"/></svg>'
+)
+
+
+class FetchError(Exception):
+    pass
+
+
+def _create_public_connection(address, *args, **kwargs):
+    # checks the address actually connected to, after any DNS answer and
+    # for every redirect, so a name cannot point the fetch inside
+    sock = socket.create_connection(address, *args, **kwargs)
+    ip = ipaddress.ip_address(sock.getpeername()[0])
+    ip = getattr(ip, 'ipv4_mapped', None) or ip
+    if not ip.is_global or ip.is_multicast:
+        sock.close()
+        raise FetchError(f'Refusing to fetch from {ip}')
+    return sock
+
+
+class _PublicOnly(object):
+
+    def do_open(self, http_class, request, **kwargs):
+        class PublicConnection(http_class):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self._create_connection = _create_public_connection
+        return super().do_open(PublicConnection, request, **kwargs)
+
+
+class _PublicHTTPHandler(_PublicOnly, urllib.request.HTTPHandler):
+    pass
+
+
+class _PublicHTTPSHandler(_PublicOnly, urllib.request.HTTPSHandler):
+    pass
+
+
+def fetch(url, timeout, max_bytes, allow_private=False):
+    # (bytes, mimetype) of an image url; proxies are not used, they would
+    # connect on our behalf
+    if urlparse(url).scheme not in ('http', 'https'):
+        raise FetchError(f'Unsupported url: {url}')
+    handlers = [urllib.request.ProxyHandler({})]
+    if not allow_private:
+        handlers += [_PublicHTTPHandler, _PublicHTTPSHandler]
+    opener = urllib.request.build_opener(*handlers)
+    try:
+        with opener.open(url, timeout=timeout) as response:
+            mimetype = response.headers.get_content_type()
+            content = response.read(max_bytes + 1)
+    except (OSError, ValueError) as e:
+        raise FetchError(str(e))
+    if mimetype not in EXTENSIONS:
+        raise FetchError(f'Not an image: {mimetype}')
+    if len(content) > max_bytes:
+        raise FetchError(f'Larger than {max_bytes} bytes')
+    return content, mimetype
+
+
+def scale(content, mimetype, box):
+    # (bytes, extension) of the image fitted into box, re-encoded; the
+    # original when Pillow is missing
+    if Image is None:
+        return content, EXTENSIONS[mimetype]
+    try:
+        image = Image.open(io.BytesIO(content))
+        image.thumbnail(box)
+        output = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(output, 'PNG', optimize=True)
+            return output.getvalue(), '.png'
+        image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+        return output.getvalue(), '.jpg'
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise FetchError(f'Not a readable {mimetype}: {e}')
+
+
+# ----------------------------------------------------------------------------#
+# Disk cache.
+# ----------------------------------------------------------------------------#
+
+
+class ThumbnailCache(object):
+    # <root>/urls/<sha of url> holds "<sha of content> <extension>" per size,
+    # <root>/<aa>/<sha of content>-<size><extension> the thumbnails
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.fetching = {}
+        self.failed = {}
+        self.total = None
+
+    def _url_path(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'urls', digest)
+
+    def _file(self, digest, size, extension):
+        return os.path.join(
+            self.root, digest[:2], f'{digest}-{size}{extension}')
+
+    def lookup(self, url, size):
+        # path of a cached thumbnail, touched for the LRU, or None
+        # the file is appended to, the last line of a size wins
+        entries = {}
+        try:
+            with open(self._url_path(url)) as f:
+                for line in f:
+                    name, digest, extension = line.split()
+                    entries[name] = (digest, extension)
+        except (OSError, ValueError):
+            return None
+        # types no longer served, like svg, are fetched again
+        if size not in entries or entries[size][1] not in MIMETYPES:
+            return None
+        path = self._file(entries[size][0], size, entries[size][1])
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def store(self, url, size, content, extension):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._file(digest, size, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, a reader never sees half a file
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+        url_path = self._url_path(url)
+        os.makedirs(os.path.dirname(url_path), exist_ok=True)
+        with self.lock:
+            with open(url_path, 'a') as f:
+                f.write(f'{size} {digest} {extension}\n')
+            self._grow(len(content))
+        return path
+
+    def _grow(self, added):
+        if self.total is None:
+            self.total = sum(size for _, size, _ in self._files())
+        else:
+            self.total += added
+        if self.total > self.max_bytes:
+            self._evict()
+
+    def _files(self):
+        for directory, dirs, files in os.walk(self.root):
+            if os.path.basename(directory) == 'urls':
+                continue
+            for filename in files:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self):
+        # least recently used first, down to 90% so this does not run on
+        # every store; stale url entries are found missing on lookup
+        files = sorted(self._files())
+        self.total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total -= size
+
+    def thumbnail(self, url, size, fetch_options, retry_after):
+        # path of the thumbnail, fetching and scaling it on a miss; None
+        # while the origin is failing
+        path = self.lookup(url, size)
+        if path is not None:
+            return path
+
+        with self.lock:
+            if time.monotonic() - self.failed.get(url, -retry_after) \
+                    < retry_after:
+                return None
+            # one fetch per url at a time, the others wait for it
+            event = self.fetching.get(url)
+            owner = event is None
+            if owner:
+                event = self.fetching[url] = threading.Event()
+
+        if not owner:
+            event.wait(fetch_options['timeout'] * 2)
+            return self.lookup(url, size)
+
+        try:
+            content, mimetype = fetch(url, **fetch_options)
+            path = None
+            for name, box in SIZES.items():
+                scaled, extension = scale(content, mimetype, box)
+                stored = self.store(url, name, scaled, extension)
+                if name == size:
+                    path = stored
+            return path
+        except FetchError as e:
+            current_app.logger.warning('Thumbnail of %s failed: %s', url, e)
+            with self.lock:
+                self.failed[url] = time.monotonic()
+            return None
+        finally:
+            with self.lock:
+                self.fetching.pop(url).set()
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ThumbnailCache(
+            current_app.config['THUMBNAIL_DIR'],
+            current_app.config['THUMBNAIL_CACHE_BYTES'])
+    return _cache
+
+
+# ----------------------------------------------------------------------------#
+# Views.
+# ----------------------------------------------------------------------------#
+
+
+def known_image(url):
+    # only image_links in use are fetched
+    return db.session.query(
+        db.session.query(Venue.id).filter(Venue.image_link == url).exists()
+    ).scalar() or db.session.query(
+        db.session.query(Artist.id).filter(Artist.image_link == url).exists()
+    ).scalar()
+
+
+def thumbnail_view(size):
+    url = request.args.get('src', '')
+    if size not in SIZES or not url:
+        abort(404)
+
+    config = current_app.config
+    path = get_cache().lookup(url, size)
+    if path is None:
+        if not known_image(url):
+            abort(404)
+        path = get_cache().thumbnail(
+            url, size,
+            fetch_options={
+                'timeout': config['THUMBNAIL_FETCH_TIMEOUT'],
+                'max_bytes': config['THUMBNAIL_MAX_SOURCE_BYTES'],
+                'allow_private': config['THUMBNAIL_ALLOW_PRIVATE'],
+            },
+            retry_after=config['THUMBNAIL_RETRY_AFTER']
+        )
+
+    if path is None:
+        response = current_app.response_class(
+            PLACEHOLDER, mimetype='image/svg+xml')
+        response.cache_control.public = True
+        response.cache_control.max_age = config['THUMBNAIL_RETRY_AFTER']
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    response = send_file(
+        path, mimetype=MIMETYPES[os.path.splitext(path)[1]], conditional=True)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = config['THUMBNAIL_MAX_AGE']
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def thumbnail_url(url, size='medium'):
+    # template filter: {{ venue.image_link|thumbnail('large') }}
+    if not url:
+        return ''
+    return url_for('thumbnail', size=size, src=url)
+
+
+def init_app(app):
+    app.config.setdefault(
+        'THUMBNAIL_DIR', os.path.join(app.instance_path, 'thumbnails'))
+    app.config.setdefault('THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024)
+    app.config.setdefault('THUMBNAIL_MAX_AGE', 7 * 24 * 3600)
+    app.config.setdefault('THUMBNAIL_FETCH_TIMEOUT', 5)
+    app.config.setdefault('THUMBNAIL_MAX_SOURCE_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('THUMBNAIL_RETRY_AFTER', 300)
+    app.config.setdefault('THUMBNAIL_ALLOW_PRIVATE', False)
+    app.add_url_rule('/thumbnails/<size>', 'thumbnail', thumbnail_view)
+    app.add_template_filter(thumbnail_url, 'thumbnail')
@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from matchmaking import matches
+from models import db, Venue, Artist
+from partitions import past_shows, upcoming_shows
+from related import related_artists
+
+
+# ----------------------------------------------------------------------------#
+# View models.
+# ----------------------------------------------------------------------------#
+# Shared by the html pages and the json api.
+
+
+def venue_detail(venue_id):
+    # data for the venue page, None when there is no such venue
+    new_data = {}
+    current_venue = Venue.query.get(venue_id)
+
+    if current_venue is None:
+        return None
+
+    new_data['id'] = current_venue.id
+    new_data['name'] = current_venue.name
+    new_data['genres'] = current_venue.genres
+    new_data['address'] = current_venue.address
+    new_data['city'] = current_venue.city
+    new_data['state'] = current_venue.state
+    new_data['phone'] = current_venue.phone
+    new_data['website'] = current_venue.website
+    new_data['facebook_link'] = current_venue.facebook_link
+    new_data['seeking_talent'] = current_venue.seeking_talent
+    new_data['seeking_description'] = current_venue.seeking_description
+    new_data['image_link'] = current_venue.image_link
+
+    # upcoming shows come from the live table only, past ones include the
+    # archive; both split against a single "now"
+    now = datetime.today()
+    new_data['past_shows'] = [
+        dict(show) for show in
+        past_shows(db.session, 'venue', current_venue.id, now)
+    ]
+    new_data['upcoming_shows'] = [
+        dict(show) for show in
+        upcoming_shows(db.session, 'venue', current_venue.id, now)
+    ]
+
+    new_data['past_shows_count'] = len(new_data['past_shows'])
+    new_data['upcoming_shows_count'] = len(new_data['upcoming_shows'])
+    new_data['matches'] = (
+        matches('venue', current_venue.id)
+        if current_venue.seeking_talent else []
+    )
+
+    return new_data
+
+
+def artist_detail(artist_id):
+    # data for the artist page, None when there is no such artist
+    artist = Artist.query.get(artist_id)
+
+    if artist is None:
+        return None
+
+    data = {
+        'id': artist.id,
+        'name': artist.name,
+        'genres': artist.genres,
+        'city': artist.city,
+        'state': artist.state,
+        'phone': artist.phone,
+        'website': artist.website,
+        'facebook_link': artist.facebook_link,
+        'seeking_venue': artist.seeking_venue,
+        'seeking_description': artist.seeking_description,
+        'image_link': artist.image_link,
+    }
+
+    # as for venues, the archive only feeds the past shows
+    now = datetime.today()
+    data['past_shows'] = [
+        dict(show) for show in past_shows(db.session, 'artist', artist.id, now)
+    ]
+    data['upcoming_shows'] = [
+        dict(show) for show in
+        upcoming_shows(db.session, 'artist', artist.id, now)
+    ]
+
+    data['past_shows_count'] = len(data['past_shows'])
+    data['upcoming_shows_count'] = len(data['upcoming_shows'])
+    data['related_artists'] = related_artists(artist.id)
+    data['matches'] = (
+        matches('artist', artist.id) if artist.seeking_venue else []
+    )
+
+    return data